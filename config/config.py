@@ -10,6 +10,13 @@ class ApiKeys:
         self.gemini = os.getenv("GEMINI_API_KEY", "")
         self.tavily = os.getenv("TAVILY_API_KEY", "")
     
+    def scoped(self, new_keys) -> "ApiKeys":
+        """Copy of these keys with a connection's own keys layered on top (the shared keys stay untouched)"""
+        keys = ApiKeys.__new__(ApiKeys)
+        keys.__dict__.update(self.__dict__)
+        keys.update_keys(new_keys or {})
+        return keys
+
     def update_keys(self, new_keys):
         if "murf" in new_keys and new_keys["murf"]:
             self.murf = new_keys["murf"]
@@ -21,4 +28,107 @@ class ApiKeys:
             self.tavily = new_keys["tavily"]
 
 #singleton instance
-api_keys = ApiKeys()
\ No newline at end of file
+api_keys = ApiKeys()
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class Settings:
+    """Runtime tuning knobs, read once from the environment"""
+    def __init__(self):
+        #stream Gemini tokens into Murf sentence by sentence instead of waiting for the full answer
+        self.llm_streaming = _env_bool("LLM_STREAMING", True)
+        #max Gemini requests in flight per worker process
+        self.gemini_max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", "64"))
+        #shared pool of warm Murf stream-input websockets
+        self.murf_pool_max_connections = int(os.getenv("MURF_POOL_MAX_CONNECTIONS", "16"))
+        self.murf_pool_contexts_per_connection = int(os.getenv("MURF_POOL_CONTEXTS_PER_CONNECTION", "4"))
+        self.murf_pool_min_idle = int(os.getenv("MURF_POOL_MIN_IDLE", "1"))
+        self.murf_pool_idle_timeout = float(os.getenv("MURF_POOL_IDLE_TIMEOUT", "120"))
+        self.murf_pool_max_age = float(os.getenv("MURF_POOL_MAX_AGE", "900"))
+        self.murf_pool_health_interval = float(os.getenv("MURF_POOL_HEALTH_INTERVAL", "20"))
+        self.murf_pool_acquire_timeout = float(os.getenv("MURF_POOL_ACQUIRE_TIMEOUT", "10"))
+        #sentences synthesized ahead of the one currently playing
+        self.murf_segment_lookahead = int(os.getenv("MURF_SEGMENT_LOOKAHEAD", "2"))
+        #TTS audio sent to the browser: default and formats a session may negotiate
+        self.tts_default_format = os.getenv("TTS_DEFAULT_FORMAT", "pcm44")
+        self.tts_output_formats = [f.strip() for f in os.getenv("TTS_OUTPUT_FORMATS", "pcm44,pcm24,mp3,opus").split(",") if f.strip()]
+        #content-addressed cache of synthesized audio
+        self.tts_cache_enabled = _env_bool("TTS_CACHE_ENABLED", True)
+        self.tts_cache_dir = os.getenv("TTS_CACHE_DIR", "cache/tts")
+        self.tts_cache_memory_mb = int(os.getenv("TTS_CACHE_MEMORY_MB", "64"))
+        self.tts_cache_disk_mb = int(os.getenv("TTS_CACHE_DISK_MB", "1024"))
+        #/audio/batch: syntheses in flight per request and items accepted per request
+        self.tts_batch_concurrency = int(os.getenv("TTS_BATCH_CONCURRENCY", "8"))
+        self.tts_batch_max_items = int(os.getenv("TTS_BATCH_MAX_ITEMS", "1000"))
+        #Gemini tool calls: per-call timeouts and how many call/answer rounds one turn may take
+        self.tool_timeout = float(os.getenv("TOOL_TIMEOUT", "8"))
+        self.web_search_timeout = float(os.getenv("WEB_SEARCH_TIMEOUT", "5"))
+        self.tool_max_rounds = int(os.getenv("TOOL_MAX_ROUNDS", "3"))
+        #web_search result cache
+        self.search_cache_ttl = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+        self.search_cache_max_entries = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+        #bounded session registries
+        self.max_rest_sessions = int(os.getenv("MAX_REST_SESSIONS", "1000"))
+        self.max_voice_sessions = int(os.getenv("MAX_VOICE_SESSIONS", "500"))
+        self.session_idle_ttl = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+        self.voice_evict_after = float(os.getenv("VOICE_EVICT_AFTER", "60"))
+        #job queue for file transcription and the REST voice endpoints
+        self.job_workers = int(os.getenv("JOB_WORKERS", "4"))
+        self.job_max_pending = int(os.getenv("JOB_MAX_PENDING", "100"))
+        self.job_result_ttl = float(os.getenv("JOB_RESULT_TTL", "3600"))
+        #uploaded recordings, stored once per distinct content
+        self.upload_dir = os.getenv("UPLOAD_DIR", "temp_upload")
+        self.upload_max_mb = int(os.getenv("UPLOAD_MAX_MB", "100"))
+        self.upload_ttl = float(os.getenv("UPLOAD_TTL", "86400"))
+        #upstream endpoints, overridable to point at local stand-ins (tools/fake_upstreams.py)
+        self.gemini_base_url = os.getenv("GEMINI_BASE_URL", "")
+        self.murf_base_url = os.getenv("MURF_BASE_URL", "")
+        self.murf_stream_url = os.getenv("MURF_STREAM_URL", "wss://api.murf.ai/v1/speech/stream-input")
+        self.tavily_base_url = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com")
+        #shared upstream HTTP clients, one per provider and API key
+        self.client_idle_ttl = float(os.getenv("CLIENT_IDLE_TTL", "900"))
+        self.http_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+        self.gemini_max_connections = int(os.getenv("GEMINI_MAX_CONNECTIONS", "100"))
+        self.murf_max_connections = int(os.getenv("MURF_MAX_CONNECTIONS", "20"))
+        self.tavily_max_connections = int(os.getenv("TAVILY_MAX_CONNECTIONS", "20"))
+        #conversation and REST session state: "memory" (single worker) or "sqlite" (shared by workers)
+        self.state_backend = os.getenv("STATE_BACKEND", "memory").lower()
+        self.state_sqlite_path = os.getenv("STATE_SQLITE_PATH", "cache/state.sqlite3")
+        #conversation window sent to Gemini
+        self.history_token_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+        self.history_keep_turns = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+        self.gemini_context_cache = _env_bool("GEMINI_CONTEXT_CACHE", True)
+        self.gemini_context_cache_ttl = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+        #speculative replies: start Gemini once a partial transcript has been stable this long
+        self.speculative_llm = _env_bool("SPECULATIVE_LLM", False)
+        self.speculative_stable_ms = int(os.getenv("SPECULATIVE_STABLE_MS", "400"))
+        self.speculative_min_words = int(os.getenv("SPECULATIVE_MIN_WORDS", "3"))
+        self.speculative_tts = _env_bool("SPECULATIVE_TTS", False) #also pre-synthesize the first sentence
+        #AssemblyAI streaming sessions
+        self.stt_client = os.getenv("STT_CLIENT", "native").lower() #native | sdk
+        self.assemblyai_streaming_url = os.getenv("ASSEMBLYAI_STREAMING_URL", "wss://streaming.assemblyai.com/v3/ws")
+        self.stt_pool_size = int(os.getenv("STT_POOL_SIZE", "0"))
+        self.stt_pool_max_age = float(os.getenv("STT_POOL_MAX_AGE", "60"))
+        #/ws audio ingest: frame size sent to STT and how much may queue before dropping
+        self.ingest_frame_ms = int(os.getenv("INGEST_FRAME_MS", "50"))
+        self.ingest_max_buffer_ms = int(os.getenv("INGEST_MAX_BUFFER_MS", "1000"))
+        self.ws_config_timeout = float(os.getenv("WS_CONFIG_TIMEOUT", "1.0"))
+        #push each turn's latency breakdown to the browser (a browser can also ask for it in its config)
+        self.ws_timing_events = _env_bool("WS_TIMING_EVENTS", False)
+        #server-side voice activity detection on /ws audio
+        self.vad_enabled = _env_bool("VAD_ENABLED", True)
+        self.vad_hangover_ms = int(os.getenv("VAD_HANGOVER_MS", "300"))
+        self.vad_eou_silence_ms = int(os.getenv("VAD_EOU_SILENCE_MS", "700"))
+        self.vad_eou_grace = float(os.getenv("VAD_EOU_GRACE", "0.25"))
+        #interrupt the bot when the user talks over it
+        self.barge_in_enabled = _env_bool("BARGE_IN_ENABLED", True)
+        self.barge_in_min_speech_ms = int(os.getenv("BARGE_IN_MIN_SPEECH_MS", "200"))
+
+#singleton instance
+settings = Settings()
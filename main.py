@@ -1,20 +1,42 @@
-from fastapi import FastAPI, UploadFile, HTTPException, WebSocket
-from fastapi.websockets import WebSocketDisconnect
+from fastapi import FastAPI, Request, HTTPException, WebSocket
+from fastapi.websockets import WebSocketDisconnect, WebSocketState
 from pydantic import BaseModel
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
-from murf import Murf
+from fastapi.responses import FileResponse, JSONResponse, Response, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 import os
+import json
+import logging
 import time
 import assemblyai as aai
 from google import genai
-from services.murf_service import murf_tts
+from services.murf_service import murf_tts, murf_tts_batch, REST_VOICE_ID, REST_SAMPLE_RATE
 from services.assembly_service import AssemblyAIStreamingClient
+from services.gemini_service import gemini_slots, get_gemini_client, gemini_usage, dump_contents, load_contents
+from services.session_manager import SessionLimitReached, SessionManager, estimate_size
+from services.state_store import state_store
+import re
 import uuid
+import hashlib
+import secrets
 import asyncio
 import threading
+from typing import List, Optional
+from contextlib import asynccontextmanager
 from config.config import api_keys
+from services.murf_pool import murf_pool
+from services.vad import VoiceActivityDetector
+from services.tts_cache import tts_cache
+from services.tool_calling import search_cache
+from services.stt_pool import stt_pool
+from services.client_registry import client_registry
+from services.audio_codecs import choose_audio_profile
+from services.metrics import render_metrics, loop_lag, process_rss_bytes
+from services.speculation import speculation_stats
+from services.job_queue import Job, QueueFull, job_queue
+from services.transcription import transcription
+from services.upload_store import InvalidUpload, UploadTooLarge, upload_store
+from config.config import settings
 
 load_dotenv()
 # MURF_API_KEY = os.getenv('MURF_API_KEY')
@@ -22,11 +44,61 @@ load_dotenv()
 # GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #warm up shared upstream connections before the first session arrives
+    murf_pool.start()
+    client_registry.start()
+    #the profile a browser gets when it reports nothing beyond PCM playback (pcm24 by default)
+    profile = choose_audio_profile({})
+    prewarm_task = asyncio.create_task(murf_pool.prewarm(api_keys.murf, profile.sample_rate, profile.murf_format))
+    stt_pool.start(api_keys.assemblyai)
+    voice_sessions.start()
+    state_store.start()
+    loop_lag.start()
+    job_queue.start()
+    upload_store.start()
+    yield
+    prewarm_task.cancel()
+    try:
+        await prewarm_task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logging.error(f"Murf pool prewarm failed: {e}")
+    await upload_store.stop()
+    await job_queue.stop()
+    await loop_lag.stop()
+    await voice_sessions.stop()
+    await state_store.close()
+    await murf_pool.close()
+    await stt_pool.close()
+    await client_registry.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 class Payload(BaseModel):
     text: str
+
+class BatchItem(BaseModel):
+    text: str
+    id: Optional[str] = None
+    #per-item overrides of the batch's voice settings
+    voice_id: Optional[str] = None
+    style: Optional[str] = None
+    rate: Optional[int] = None
+    pitch: Optional[int] = None
+
+class BatchPayload(BaseModel):
+    items: List[BatchItem]
+    voice_id: str = REST_VOICE_ID
+    style: str = ""
+    rate: int = 0
+    pitch: int = 0
+    sample_rate: int = REST_SAMPLE_RATE
+    concurrency: Optional[int] = None #capped at TTS_BATCH_CONCURRENCY
     
     
 @app.get("/")
@@ -37,15 +109,51 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats():
+    return {
+        "murf_pool": murf_pool.stats(),
+        "stt_pool": stt_pool.stats(),
+        "tts_cache": tts_cache.stats(),
+        "search_cache": search_cache.stats(),
+        "clients": client_registry.stats(),
+        "state_store": state_store.stats(),
+        "voice_sessions": voice_sessions.stats(),
+        #per live session, without ids: a session's id must not leak from an unauthenticated endpoint
+        "voice_ingest": [entry.session.ingest.stats() for entry in list(voice_sessions.sessions.values())],
+        "voice_playback": [entry.session.murf_service.stats() for entry in list(voice_sessions.sessions.values())],
+        "gemini_usage": gemini_usage,
+        "speculation": speculation_stats(),
+        "jobs": job_queue.stats(),
+        "uploads": upload_store.stats(),
+        "event_loop_lag": loop_lag.stats(),
+        "process": {"pid": os.getpid(), "rss_bytes": process_rss_bytes()},
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage voice turn latency histograms in the Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/tts/cache/{key}")
+async def cached_audio(key: str):
+    """Serve synthesized audio straight from the TTS cache"""
+    if len(key) != 64 or not all(c in "0123456789abcdef" for c in key):
+        raise HTTPException(status_code=404, detail="Not found")
+    audio = await tts_cache.get(key)
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    content = bytes(audio)
+    tts_cache.release(audio)
+    return Response(content=content, media_type="audio/wav")
+
 @app.post("/audio", status_code=200)
 async def generateAudio(payload: Payload):
-    client = Murf(
-       api_key = MURF_API_KEY
-    )
+    client = client_registry.get("murf", api_keys.murf)
     
     if not payload.text:
         raise HTTPException(status_code=400, detail="Missing text")
-    res = client.text_to_speech.generate(
+    res = await client.text_to_speech.generate(
      text=payload.text,
      voice_id="en-US-Ken",
     
@@ -57,218 +165,318 @@ async def generateAudio(payload: Payload):
     return res.audio_file   
 
 
-@app.post('/upload/', status_code=200)
-async def upload_file(file: UploadFile):
+@app.post("/audio/batch", status_code=200)
+async def generate_audio_batch(payload: BatchPayload):
+    """Synthesize many texts concurrently; one NDJSON line per item as it finishes, then a summary"""
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="Missing items")
+    if len(payload.items) > settings.tts_batch_max_items:
+        raise HTTPException(status_code=413, detail=f"At most {settings.tts_batch_max_items} items per batch")
+    concurrency = min(payload.concurrency or settings.tts_batch_concurrency, settings.tts_batch_concurrency)
+    items = []
+    for item in payload.items:
+        items.append({
+            "id": item.id,
+            "text": item.text,
+            "voice_id": item.voice_id or payload.voice_id,
+            "style": payload.style if item.style is None else item.style,
+            "rate": payload.rate if item.rate is None else item.rate,
+            "pitch": payload.pitch if item.pitch is None else item.pitch,
+            "sample_rate": payload.sample_rate,
+        })
+
+    async def stream():
+        started = time.perf_counter()
+        summary = {"done": True, "items": len(items), "ok": 0, "failed": 0, "cached": 0}
+        async for result in murf_tts_batch(items, concurrency):
+            summary["ok" if result["status"] == "ok" else "failed"] += 1
+            summary["cached"] += 1 if result.get("cached") else 0
+            yield json.dumps(result) + "\n"
+        summary["ms"] = round((time.perf_counter() - started) * 1000)
+        print("Batch TTS:", summary)
+        yield json.dumps(summary) + "\n"
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+#uploads (a multipart "file" field or a raw audio body) are streamed from the request straight
+#to disk under their content hash, not spooled by UploadFile first; the id can be queued later
+async def _store_upload(request: Request) -> dict:
     try:
-        # Create temp_upload directory if it doesn't exist
-        os.makedirs("temp_upload", exist_ok=True)
-        
-        # Generate a unique filename
-        timestamp = int(time.time())
-        filename = f"temp_upload/{timestamp}_{file.filename if file.filename else 'recording.ogg'}"
-        
-        # Save the file to the temp_upload directory
-        with open(filename, 'wb') as f:
-            content = await file.read()
-            f.write(content)
-            print("File uploaded successfully to", filename)
-        
-        # Get file size in KB
-        file_size = os.path.getsize(filename) / 1024
-        
-        return {
-            "message": "File uploaded successfully",
-            "filename": os.path.basename(filename),
-            "content_type": file.content_type if file.content_type else "audio/ogg",
-            "size_kb": round(file_size, 2)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return await upload_store.save(request)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post('/upload/', status_code=200)
+async def upload_file(request: Request):
+    stored = await _store_upload(request)
+    print("File uploaded successfully to", stored["path"])
+    return {
+        "message": "File uploaded successfully",
+        "upload_id": stored["upload_id"],
+        "filename": stored["filename"] or "recording.ogg",
+        "content_type": stored["content_type"] or "audio/ogg",
+        "size_kb": round(stored["size"] / 1024, 2),
+        "deduplicated": stored["deduplicated"],
+    }
         
  
-@app.post('/transcribe/file/', status_code=200)
-async def transcribe_file(file: UploadFile):
+#REST voice work (batch transcription, Gemini, Murf) runs on the job queue so long
+#uploads never hold up the handler; the blocking endpoints below wait for their job
+async def _submit(kind: str, run, *args) -> Job:
     try:
-        transcriber = aai.Transcriber()
-        transcript = transcriber.transcribe(file.file)
-        print("transcript", transcript)
-        # Handle missing or empty transcript text
-        if not transcript or not getattr(transcript, "text", None) or not transcript.text.strip():
-            return {"error": "Nothing to transcribe"}
-        return {"transcript": transcript.text}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    #transcribe audio 
-   
+        return await job_queue.submit(kind, lambda job: run(job, *args))
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Too many queued jobs, try again later")
 
-@app.post('/tts/echo/', status_code=200)
-async def tts_echo(file: UploadFile):
-    client = Murf(
-       api_key = MURF_API_KEY
-    )
-    transcribe_text = transcription(file)
-    print("transcribe_text", transcribe_text)
-    
-    if not file:
-        raise HTTPException(status_code=400, detail="Missing file")
-    if not isinstance(transcribe_text, dict) or "transcript" not in transcribe_text:
+async def _transcribe_job(job: Job, audio_path: str) -> dict:
+    await job_queue.progress(job, "transcribing", 0.1)
+    return await transcription(audio_path)
+
+async def _tts_echo_job(job: Job, audio_path: str) -> dict:
+    await job_queue.progress(job, "transcribing", 0.1)
+    transcribed = await transcription(audio_path)
+    if "transcript" not in transcribed:
         return {"error": "Transcription failed"}
-    res = client.text_to_speech.generate(
-     text = transcribe_text["transcript"],
-     voice_id="en-US-Ken",
-    
-    )  
-    
-    if not res.audio_file:
-        raise HTTPException(status_code=500, detail="No audio file generated")
-    print("audioURL: ",res.audio_file)
-    return res.audio_file
+    await job_queue.progress(job, "speaking", 0.6)
+    murf_response = await murf_tts(transcribed["transcript"])
+    print("audioURL: ", murf_response)
+    return {"transcript": transcribed["transcript"], **murf_response}
 
+async def _llm_query_job(job: Job, audio_path: str) -> dict:
+    client = get_gemini_client()
 
+    # assemblyAI transcribe
+    await job_queue.progress(job, "transcribing", 0.1)
+    transcribed = await transcription(audio_path)
+    print("transcription", transcribed)
+    if "transcript" not in transcribed:
+        return {"error": "Transcription failed"}
 
-@app.post('/llm/query', status_code=200)
-async def llm_query(file: UploadFile):
-    try:
-        client = genai.Client()
-        
-        # assemblyAI transcribe 
-        transcribed = transcription(file)
-        print("transcription", transcribed)
-        if not isinstance(transcribed, dict) or "transcript" not in transcribed:
-            raise HTTPException(status_code=400, detail="Transcription failed")
-        
-        prompts = (
-            "You are a helpful assistant that answers question.\n"
-            "Keep answer within 2500 characters only.\n"
-            f"question: {transcribed['transcript']}"
-        )
-        
-        response = client.models.generate_content(
+    prompts = (
+        "You are a helpful assistant that answers question.\n"
+        "Keep answer within 2500 characters only.\n"
+        f"question: {transcribed['transcript']}"
+    )
+    await job_queue.progress(job, "thinking", 0.4)
+    async with gemini_slots:
+        response = await client.aio.models.generate_content(
             model="gemini-2.5-flash",
             contents=[prompts],
         )
-        
-        if response:
-            answer_text = response.text
-            if len(answer_text) > 3000:
-                print(answer_text)
-                answer_text = answer_text[:3000]
-            # murfAI TTS
-            murf_response = await murf_audio(answer_text)
-            
-            print("murf_response", murf_response)
-            return murf_response
-        else:
-            return "Sorry! I don't have an answer for that."
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+    answer_text = response.text if response else None
+    if not answer_text:
+        return {"text": "Sorry! I don't have an answer for that."}
+    if len(answer_text) > 3000:
+        print(answer_text)
+        answer_text = answer_text[:3000]
+    # murfAI TTS
+    await job_queue.progress(job, "speaking", 0.7)
+    murf_response = await murf_tts(answer_text)
+    print("murf_response", murf_response)
+    return {"transcript": transcribed["transcript"], "text": answer_text, **murf_response}
+
+@app.post('/transcribe/file/', status_code=200)
+async def transcribe_file(request: Request):
+    job = await _submit("transcribe", _transcribe_job, (await _store_upload(request))["path"])
+    await job.done.wait()
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    return job.result
+
+
+@app.post('/tts/echo/', status_code=200)
+async def tts_echo(request: Request):
+    job = await _submit("tts_echo", _tts_echo_job, (await _store_upload(request))["path"])
+    await job.done.wait()
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if "transcript" not in job.result:
+        return {"error": "Transcription failed"}
+    if not job.result.get("audio_file"):
+        raise HTTPException(status_code=500, detail="No audio file generated")
+    return job.result["audio_file"]
+
+
+@app.post('/llm/query', status_code=200)
+async def llm_query(request: Request):
+    job = await _submit("llm_query", _llm_query_job, (await _store_upload(request))["path"])
+    await job.done.wait()
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.result.get("error"):
+        raise HTTPException(status_code=400, detail=job.result["error"])
+    return job.result
     
 #llm with history context 
-#Dictionary to create or retrieve a session 
-active_sessions = {}
+#REST chat sessions live in the state store so any worker can serve the next request
+REST_CHAT_MODEL = "gemini-2.5-flash"
+
+#one entry per open /ws connection; evicted connections are closed, but only idle or dropped ones are evicted
+async def _close_voice_session(session_id: str, aaiClient):
+    try:
+        await aaiClient.websocket.close(code=1013, reason="Session evicted")
+    except Exception:
+        pass
+
+voice_sessions = SessionManager(
+    "voice",
+    max_sessions=settings.max_voice_sessions,
+    idle_ttl=settings.session_idle_ttl,
+    on_evict=_close_voice_session,
+    sizer=lambda aaiClient: estimate_size(aaiClient.gemini_service.conversation_history),
+    evict_after=settings.voice_evict_after,
+    is_live=lambda aaiClient: aaiClient.websocket.client_state == WebSocketState.CONNECTED,
+)
+
 #function to create or retrieve a session
-def get_or_create_session(session_id: str):
-    if session_id not in active_sessions:
-        #create a new session with Gemini chat 
-        client = genai.Client()
-        chat = client.chats.create(model="gemini-2.5-flash")
-        active_sessions[session_id] = {
-            "chat": chat,
+async def get_or_create_session(session_id: str) -> dict:
+    session = await state_store.get("rest", session_id)
+    if session is None:
+        session = {
             "history": [
                { "role": "system",
                 "content": "You are a helpful assistant that answers questions accurately and concisely."
                }
             ],
-            "last_used": time.time()
+            "contents": [],
         }
-    else:
-        #update last used timestamp
-        active_sessions[session_id]["last_used"] = time.time()
-    return active_sessions[session_id]        
+    #chats are cheap local objects; rebuild one on the shared client from the stored history
+    session["chat"] = get_gemini_client().aio.chats.create(
+        model=REST_CHAT_MODEL,
+        history=load_contents(session["contents"]),
+    )
+    return session
 
-@app.post('/agent/chat/{session_id}', status_code=200)
-async def agent_chat(file: UploadFile, session_id: str):
-    try:
-        #get or create session
-        session = get_or_create_session(session_id)
-        chat = session["chat"]
-        
-        # assemblyAI transcribe 
-        transcribed = transcription(file)
-        print("transcription", transcribed)
-        
-        if not isinstance(transcribed, dict) or "transcript" not in transcribed:
-              return JSONResponse(
-                status_code=400,
-                content={
-                "audio": murf_response["audio_file"],
-                "text": fallback_text,
-                "error_type": "general_error",
-                
-                }
-            )
-        
-        user_message = transcribed["transcript"]
-        
-        #add user_message to history
-        session["history"].append({
-            "role": "user",
-            "content": user_message
-        })
-        response = chat.send_message(
+async def save_session(session_id: str, session: dict):
+    chat = session["chat"]
+    await state_store.set("rest", session_id, {
+        "history": session["history"],
+        "contents": dump_contents(chat.get_history(curated=True)),
+    })
+
+async def _fallback_reply(error_type: str) -> dict:
+    fallback_text = "I'm having trouble processing your request. Please try again later."
+    murf_response = await murf_tts(fallback_text)
+    return {
+        "audio": murf_response.get("audio_file"),
+        "text": fallback_text,
+        "error_type": error_type,
+    }
+
+async def _agent_chat_job(job: Job, session_id: str, audio_path: str) -> dict:
+    #get or create session
+    session = await get_or_create_session(session_id)
+    chat = session["chat"]
+
+    # assemblyAI transcribe
+    await job_queue.progress(job, "transcribing", 0.1)
+    transcribed = await transcription(audio_path)
+    print("transcription", transcribed)
+    if "transcript" not in transcribed:
+        return await _fallback_reply("transcription_error")
+
+    user_message = transcribed["transcript"]
+
+    #add user_message to history
+    session["history"].append({
+        "role": "user",
+        "content": user_message
+    })
+    await job_queue.progress(job, "thinking", 0.4)
+    async with gemini_slots:
+        response = await chat.send_message(
             user_message
         )
-        print("response1", response.text)
-        
-        if response.text:
-            answer_text = response.text
-            if len(answer_text) > 3000:
-                print(answer_text)
-                answer_text = answer_text[:3000]
-                
-            #add assistant_response to history
-            session["history"].append({
-                "role": "assistant",
-                 "content": answer_text
-            })    
-            # murfAI TTS
-            murf_response = await murf_tts(answer_text)
-            
-            print("murf_response", murf_response)
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "audio": murf_response["audio_file"],
-                    "text": answer_text,
-                    "history": session["history"][-5:]
-                }
-            )
-        else:
-            #fallback
-            fallback_text = "I'm having trouble processing your request. Please try again later."
-            murf_response = await murf_tts(fallback_text)
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "audio": murf_response["audio_file"],
-                    "text": fallback_text,
-                    
-                    
-                }
-            )
-    except Exception as e:
+    print("response1", response.text)
+
+    if not response.text:
+        return await _fallback_reply("general_error")
+    answer_text = response.text
+    if len(answer_text) > 3000:
+        print(answer_text)
+        answer_text = answer_text[:3000]
+
+    #add assistant_response to history
+    session["history"].append({
+        "role": "assistant",
+         "content": answer_text
+    })
+    await save_session(session_id, session)
+    # murfAI TTS
+    await job_queue.progress(job, "speaking", 0.7)
+    murf_response = await murf_tts(answer_text)
+    print("murf_response", murf_response)
+    return {
+        "audio": murf_response.get("audio_file"),
+        "text": answer_text,
+        "history": session["history"][-5:]
+    }
+
+@app.post('/agent/chat/{session_id}', status_code=200)
+async def agent_chat(request: Request, session_id: str):
+    job = await _submit("agent_chat", _agent_chat_job, session_id, (await _store_upload(request))["path"])
+    await job.done.wait()
+    if job.status == "failed":
         # Graceful fallback on unexpected errors
-        fallback_text = "I'm having trouble processing your request. Please try again later."
-        murf_response = await murf_tts(fallback_text)
-        return JSONResponse(
-            status_code=500,
-            content={
-                "audio": murf_response["audio_file"],
-                "text": fallback_text,
-                
-                }
-        )
+        content = await _fallback_reply("general_error")
+    else:
+        content = job.result
+    status_code = {"transcription_error": 400, "general_error": 500}.get(content.get("error_type"), 200)
+    return JSONResponse(status_code=status_code, content=content)
+
+#job kind -> (runner, needs a session_id)
+JOB_KINDS = {
+    "transcribe": (_transcribe_job, False),
+    "tts_echo": (_tts_echo_job, False),
+    "llm_query": (_llm_query_job, False),
+    "agent_chat": (_agent_chat_job, True),
+}
+
+@app.post('/jobs/{kind}', status_code=202)
+async def submit_job(kind: str, request: Request, upload_id: Optional[str] = None,
+                     session_id: Optional[str] = None):
+    """Queue a new upload, or one stored earlier by /upload/ (?upload_id=), and return at once;
+    poll /jobs/{id} or follow /jobs/{id}/events"""
+    if kind not in JOB_KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown job kind {kind!r}")
+    run, needs_session = JOB_KINDS[kind]
+    if needs_session and not session_id:
+        raise HTTPException(status_code=400, detail="Missing session_id")
+    if upload_id:
+        audio_path = upload_store.path(upload_id)
+        if audio_path is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired upload")
+    else:
+        audio_path = (await _store_upload(request))["path"]
+    args = (session_id, audio_path) if needs_session else (audio_path,)
+    job = await _submit(kind, run, *args)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+@app.get('/jobs/{job_id}')
+async def job_status(job_id: str):
+    snapshot = await job_queue.get(job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return snapshot
+
+@app.get('/jobs/{job_id}/events')
+async def job_events(job_id: str):
+    """Server-sent events: one "data:" line per job update, ending when the job finishes"""
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+
+    async def stream():
+        async for snapshot in job_queue.events(job_id):
+            yield f"event: {snapshot['status']}\ndata: {json.dumps(snapshot)}\n\n"
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
                
 #websocket endpoint
 # @app.websocket("/ws")
@@ -309,22 +517,61 @@ async def agent_chat(file: UploadFile, session_id: str):
 #         print("Error in websocket endpoint:", str(e))
 
 
+def handle_client_event(aaiClient: AssemblyAIStreamingClient, text: str):
+    """JSON control messages the browser sends alongside its audio"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return
+    if not isinstance(data, dict):
+        return
+    if data.get("type") == "playback_stats":
+        aaiClient.murf_service.update_client_playback(data)
+
+
+#resume tokens are secrets issued by the server (token_urlsafe(32)); only their hash is used as a key
+RESUME_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_-]{32,128}")
+
+#conversation keys held by a live /ws connection in this process
+live_conversations = set()
+
+def _conversation_key(resume_token: str) -> str:
+    return hashlib.sha256(resume_token.encode("utf-8")).hexdigest()
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     print("WebSocket connection open")
     
+    first_audio = None
+    audio_hint = None
+    #keys and conversation belong to this connection only
+    session_keys = api_keys
+    resume_token = None
+    timing_events = False
     try:
-        # Wait for potential configuration message
-        data = await asyncio.wait_for(websocket.receive_json(), timeout=1.0)
-        if isinstance(data, dict) and data.get("type") == "config":
-            print("Received config:", data)
-            new_keys = data.get("apiKeys", {})
-            api_keys.update_keys(new_keys)
-            await websocket.send_json({
-                "status": "config_updated",
-                "message": "API keys updated successfully"
-            })
+        # Wait for potential configuration message; audio arriving first means there is none
+        message = await asyncio.wait_for(websocket.receive(), timeout=settings.ws_config_timeout)
+        if message.get("type") == "websocket.disconnect":
+            return
+        if message.get("bytes"):
+            first_audio = message["bytes"]
+        elif message.get("text"):
+            data = json.loads(message["text"])
+            if isinstance(data, dict) and data.get("type") == "config":
+                print("Received config:", data)
+                new_keys = data.get("apiKeys", {})
+                session_keys = api_keys.scoped(new_keys)
+                audio_hint = data.get("audio")
+                timing_events = data.get("timing") is True
+                requested_token = data.get("resumeToken")
+                if isinstance(requested_token, str) and RESUME_TOKEN_PATTERN.fullmatch(requested_token):
+                    resume_token = requested_token
+                await websocket.send_json({
+                    "status": "config_updated",
+                    "message": "API keys updated successfully"
+                })
     except (asyncio.TimeoutError, WebSocketDisconnect):
         pass
     except Exception as e:
@@ -332,28 +579,103 @@ async def websocket_endpoint(websocket: WebSocket):
     loop = asyncio.get_running_loop()
    
      # Initialize AssemblyAI client 
-    aaiClient = AssemblyAIStreamingClient( websocket, loop, sample_rate=16000, silence_threshold=1.5)
+    #TTS output format for this session, from the browser's codec support and network hint
+    audio_profile = choose_audio_profile(audio_hint)
+    await websocket.send_json({
+        "status": "audio_format",
+        **audio_profile.describe()
+    })
+    #registry key for this connection only; the conversation is found through the resume token
+    session_id = str(uuid.uuid4())
+    if resume_token and _conversation_key(resume_token) in live_conversations:
+        #another connection (e.g. a second tab) holds this conversation: start a new one
+        print("Resume token already in use, starting a new conversation")
+        resume_token = None
+    resumed = resume_token is not None
+    resume_token = resume_token or secrets.token_urlsafe(32)
+    conversation_key = _conversation_key(resume_token)
+    live_conversations.add(conversation_key)
+    aaiClient = AssemblyAIStreamingClient( websocket, loop, sample_rate=16000, silence_threshold=1.5,
+                                           audio_profile=audio_profile, keys=session_keys,
+                                           session_id=conversation_key, timing_events=timing_events)
     try:
+        voice_sessions.add(session_id, aaiClient)
+    except SessionLimitReached as e:
+        print(f"Refusing voice session: {e}")
+        live_conversations.discard(conversation_key)
+        await aaiClient.close()
+        await aaiClient.murf_service.close()
+        try:
+            await websocket.send_json({"status": "error", "message": "Server is busy, please try again shortly"})
+            await websocket.close(code=1013, reason="Server busy")
+        except Exception:
+            pass
+        return
+    vad = VoiceActivityDetector(
+        sample_rate=16000,
+        hangover_ms=settings.vad_hangover_ms,
+        eou_silence_ms=settings.vad_eou_silence_ms,
+    ) if settings.vad_enabled else None
+    try:
+        resumed = resumed and await aaiClient.gemini_service.load_state()
+        await websocket.send_json({
+            "status": "session",
+            "resumeToken": resume_token,
+            "resumed": resumed
+        })
         while True:
-            data = await websocket.receive_bytes()
+            if first_audio is not None:
+                data, first_audio = first_audio, None
+            else:
+                message = await websocket.receive()
+                if message.get("type") == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("text"):
+                    handle_client_event(aaiClient, message["text"])
+                    continue
+                data = message.get("bytes")
             if not data:
                 continue
+            voice_sessions.touch(session_id)
 
-            aaiClient.stream(data)
+            if not vad:
+                aaiClient.ingest.push(data)
+                continue
+
+            #drop long silences before they reach STT and endpoint locally
+            result = vad.process(data)
+            if vad.in_speech:
+                aaiClient.note_user_audio()
+            if result.audio:
+                aaiClient.ingest.push(result.audio)
+            if result.end_of_utterance:
+                asyncio.create_task(aaiClient.on_local_end_of_utterance())
+            if (settings.barge_in_enabled and aaiClient.bot_speaking and vad.in_speech
+                    and vad.utterance_speech_ms >= settings.barge_in_min_speech_ms):
+                await aaiClient.barge_in()
             
             
             
     except WebSocketDisconnect:
         print("WebSocket disconnected")
     finally:
-        aaiClient.close()
+        voice_sessions.remove(session_id)
+        live_conversations.discard(conversation_key)
+        await aaiClient.close()
         await aaiClient.murf_service.close()
         print("All services disconnected")
     
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)        
+    #WEB_CONCURRENCY=N runs N worker processes; they share conversations through STATE_BACKEND=sqlite
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        if settings.state_backend == "memory":
+            print("WARNING: STATE_BACKEND=memory keeps sessions per worker; use STATE_BACKEND=sqlite with WEB_CONCURRENCY > 1")
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)        
      
 
 
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, List, Optional, Union
+from urllib.parse import urlencode
+
+import websockets
+from assemblyai.streaming.v3 import (
+    BeginEvent,
+    StreamingError,
+    StreamingEvents,
+    StreamingSessionParameters,
+    TerminationEvent,
+    TurnEvent,
+)
+
+from config.config import settings
+
+_EVENT_MODELS = {
+    "Begin": (StreamingEvents.Begin, BeginEvent),
+    "Turn": (StreamingEvents.Turn, TurnEvent),
+    "Termination": (StreamingEvents.Termination, TerminationEvent),
+}
+
+
+class AsyncStreamingClient:
+    """AssemblyAI v3 streaming client running on the event loop (no per-session threads)
+
+    Mirrors the parts of the SDK StreamingClient we use: on(), stream(), set_params(),
+    force_endpoint(). Handlers are called on the loop as handler(client, event).
+    """
+    def __init__(self, api_key: str, sample_rate: int = 16000, format_turns: bool = False,
+                 url: Optional[str] = None):
+        self.api_key = api_key
+        self.sample_rate = sample_rate
+        self.format_turns = format_turns
+        self.url = url or settings.assemblyai_streaming_url
+        self.handlers: Dict[StreamingEvents, List[Callable]] = {event: [] for event in StreamingEvents}
+        self.ws = None
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        self.reader_task: Optional[asyncio.Task] = None
+        self.writer_task: Optional[asyncio.Task] = None
+        self.session_id = None
+        self.terminated = False
+
+    def on(self, event: StreamingEvents, handler: Callable):
+        self.handlers[event].append(handler)
+
+    def _emit(self, event: StreamingEvents, payload):
+        for handler in self.handlers[event]:
+            try:
+                handler(self, payload)
+            except Exception as e:
+                logging.error(f"AssemblyAI {event} handler failed: {e}")
+
+    async def connect(self):
+        query = urlencode({
+            "sample_rate": self.sample_rate,
+            "encoding": "pcm_s16le",
+            "format_turns": str(self.format_turns).lower(),
+        })
+        self.ws = await websockets.connect(
+            f"{self.url}?{query}",
+            additional_headers={"Authorization": self.api_key},
+            max_queue=64,
+        )
+        self.reader_task = asyncio.create_task(self._read_loop())
+        self.writer_task = asyncio.create_task(self._write_loop())
+
+    async def _read_loop(self):
+        try:
+            async for raw in self.ws:
+                try:
+                    message = json.loads(raw)
+                except (TypeError, ValueError):
+                    continue
+                self._dispatch(message)
+        except websockets.exceptions.ConnectionClosedError as e:
+            if not self.terminated:
+                self._emit(StreamingEvents.Error, StreamingError(
+                    message=f"AssemblyAI connection closed: {e.rcvd.reason if e.rcvd else e}",
+                    code=e.rcvd.code if e.rcvd else None,
+                ))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._emit(StreamingEvents.Error, StreamingError(message=str(e)))
+        finally:
+            if self.writer_task:
+                self.writer_task.cancel()
+
+    def _dispatch(self, message: dict):
+        if "error" in message:
+            self._emit(StreamingEvents.Error, StreamingError(message=str(message["error"])))
+            return
+        event_type = message.get("type")
+        if event_type not in _EVENT_MODELS:
+            return
+        event, model = _EVENT_MODELS[event_type]
+        try:
+            payload = model.model_validate(message)
+        except Exception as e:
+            logging.error(f"Unparseable AssemblyAI {event_type} message: {e}")
+            return
+        if event_type == "Begin":
+            self.session_id = payload.id
+        elif event_type == "Termination":
+            self.terminated = True
+        self._emit(event, payload)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                message = await self.outgoing.get()
+                await self.ws.send(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def _send(self, message: Union[bytes, str]):
+        if self.ws is None or self.terminated:
+            return
+        self.outgoing.put_nowait(message)
+
+    def stream(self, audio_chunk: bytes):
+        self._send(audio_chunk)
+
+    async def send_audio(self, audio_chunk: bytes):
+        """Send one audio frame directly, waiting on socket backpressure"""
+        if self.ws is None or self.terminated:
+            return
+        try:
+            await self.ws.send(audio_chunk)
+        except websockets.exceptions.ConnectionClosed:
+            pass #the reader reports the close
+
+    def set_params(self, params: StreamingSessionParameters):
+        update = params.model_dump(exclude_none=True)
+        update["type"] = "UpdateConfiguration"
+        self._send(json.dumps(update))
+
+    def force_endpoint(self):
+        self._send(json.dumps({"type": "ForceEndpoint"}))
+
+    async def disconnect(self, terminate: bool = True, timeout: float = 2.0):
+        if self.ws is None:
+            return
+        if terminate and not self.terminated:
+            self._send(json.dumps({"type": "Terminate"}))
+            #let queued audio and the Terminate go out, then wait briefly for Termination
+            try:
+                await asyncio.wait_for(asyncio.shield(self.reader_task), timeout=timeout)
+            except (asyncio.TimeoutError, Exception):
+                pass
+        self.terminated = True
+        for task in (self.writer_task, self.reader_task):
+            if task and not task.done():
+                task.cancel()
+        try:
+            await self.ws.close()
+        except Exception:
+            pass
@@ -11,61 +11,133 @@ from datetime import datetime, timedelta
 from collections import deque
 from services.murf_service import MurfService
 from services.gemini_service import GeminiService
-from config.config import api_keys
+from services.text_segmenter import SentenceSegmenter
+from services.stt_pool import stt_pool
+from services.audio_ingest import AudioIngest
+from services.metrics import TurnTimeline
+from services.speculation import Speculation
+from config.config import api_keys, settings
 from assemblyai.streaming.v3 import (
     BeginEvent,
-    StreamingClient,
-    StreamingClientOptions,
     StreamingError,
-    StreamingEvents,
-    StreamingParameters,
     StreamingSessionParameters,
     TerminationEvent,
     TurnEvent,
 )
 
+#audio held while the STT session is still connecting (~10 s of 16 kHz PCM16)
+MAX_PENDING_AUDIO_BYTES = 320_000
+
 load_dotenv()
 aai.settings.api_key =  api_keys.assemblyai
 
 class AssemblyAIStreamingClient:
-    def __init__(self, websocket, loop, sample_rate=16000, silence_threshold=0.6):
+    def __init__(self, websocket, loop, sample_rate=16000, silence_threshold=0.6, audio_profile=None,
+                 keys=None, session_id=None, timing_events=False):
         self.websocket = websocket
+        self.keys = keys or api_keys #this connection's credentials
         self.loop = loop
         self.silence_threshold = silence_threshold #second of silence to trigger LLM
         self.last_audio_time = None
         self.transcript = ""
         self.llm_task = None
         self.is_processing = False
+        self.streaming = settings.llm_streaming #pipe LLM tokens into TTS sentence by sentence
+        self.current_turn_order = None
+        self.committed_turn_order = None #turn already handed to the LLM, later events for it are ignored
+        self.barge_in_on_transcript = settings.barge_in_enabled and not settings.vad_enabled
+        #per-turn latency timeline; optionally pushed to the browser as a "timing" event
+        self.timing_events = timing_events or settings.ws_timing_events
+        self.timeline = None
+        self.turn_count = 0
+        self.last_user_audio = None #perf_counter of the last voiced audio from the browser
+        #start Gemini on a partial transcript that stopped changing, before the turn is final
+        self.speculate = settings.speculative_llm and self.streaming
+        self.speculation = None
+        self.speculation_timer = None
         
         
         #Initialize MurfService
         self.murf_service = MurfService(
             websocket = websocket,
-            api_key = api_keys.murf,
+            api_key = self.keys.murf,
+            profile = audio_profile,
         )
         
         #Initialize GeminiService
-        self.gemini_service = GeminiService()
-        
-          # Initialize AssemblyAI client
-        self.client = StreamingClient(
-            StreamingClientOptions(
-                api_key= aai.settings.api_key,
-                api_host= "streaming.assemblyai.com"
-                
-            )
+        self.gemini_service = GeminiService(
+            api_key = self.keys.gemini,
+            tavily_key = self.keys.tavily,
+            state_key = session_id,
         )
-        # Set up event handlers
-        self.client.on(StreamingEvents.Begin, self.on_begin)
-        self.client.on(StreamingEvents.Turn, self.on_turn)
-        self.client.on(StreamingEvents.Termination, self.on_terminated)
-        self.client.on(StreamingEvents.Error, self.on_error)
         
-        # Connect with parameters
-        self.client.connect(StreamingParameters(
-            sample_rate=sample_rate, format_turns=False
-        ))
+        #AssemblyAI session is taken from the pool (or connected) on the first audio frame
+        self.stt_session = None
+        self.client = None
+        self.connect_task = None
+        self.connect_failures = 0
+        self.connect_retry_at = 0.0 #monotonic time before which a failed connect isn't retried
+        self.pending_audio = deque()
+        self.pending_bytes = 0
+        self.first_audio_time = None
+
+        #re-frames browser audio and feeds STT from its own task
+        self.ingest = AudioIngest(
+            self.stream_async,
+            sample_rate=sample_rate,
+            frame_ms=settings.ingest_frame_ms,
+            max_buffer_ms=settings.ingest_max_buffer_ms,
+        )
+        self.ingest.start()
     
+    async def _connect(self):
+        """Get a connected STT session without blocking the event loop, then flush buffered audio"""
+        try:
+            self.stt_session = await stt_pool.acquire(self.keys.assemblyai, self)
+        except Exception as e:
+            logging.error(f"AssemblyAI connect failed: {e}")
+            self.pending_audio.clear()
+            self.pending_bytes = 0
+            #let the next audio frame try again, backing off 1s, 2s, 4s... up to 30s
+            self.connect_failures += 1
+            self.connect_retry_at = time.monotonic() + min(2 ** (self.connect_failures - 1), 30)
+            self.connect_task = None
+            if self.connect_failures == 1:
+                await self.websocket.send_json({
+                    "status": "error",
+                    "message": "Failed to connect to transcription service"
+                })
+            return
+        self.connect_failures = 0
+        client = self.stt_session.client
+        print(f"STT ready {(time.perf_counter() - self.first_audio_time) * 1000:.0f} ms after first audio")
+        #flush on the same path stream_async uses, and only then publish the client: audio that
+        #arrives meanwhile is buffered behind the backlog instead of overtaking it
+        send_audio = getattr(client, "send_audio", None)
+        try:
+            while self.pending_audio:
+                chunk = self.pending_audio.popleft()
+                self.pending_bytes -= len(chunk)
+                if send_audio is not None:
+                    await send_audio(chunk)
+                else:
+                    client.stream(chunk)
+        except Exception as e:
+            logging.error(f"Failed to flush buffered audio to AssemblyAI: {e}")
+        self.pending_audio.clear()
+        self.pending_bytes = 0
+        self.client = client
+    
+    def _schedule(self, coro):
+        """Run a coroutine on our loop from an STT callback (SDK thread or the loop itself)"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            return self.loop.create_task(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
     def on_begin(self, client, event: BeginEvent):
        print(f"Session started: {event.id}")
        self.last_audio_time = time.time()
@@ -75,21 +147,28 @@ class AssemblyAIStreamingClient:
         #update last audio time 
         self.last_audio_time = current_time
         print(f"transcript: {event.transcript}, end_of_turn: {event.end_of_turn}")
+        if event.turn_order == self.committed_turn_order:
+            #already answered from a local end-of-utterance; skip the late upstream final
+            return
+        self.current_turn_order = event.turn_order
+        if not settings.vad_enabled and event.transcript and event.transcript != self.transcript:
+            #no local VAD: new words are the best sign the user was still talking
+            self.last_user_audio = time.perf_counter()
         self.transcript = event.transcript 
+        if event.transcript and self.barge_in_on_transcript and self.bot_speaking:
+            #no local VAD, so the first partial transcript is our speech signal
+            self._schedule(self.barge_in())
            
        
+        if self.speculate and event.transcript and not event.end_of_turn:
+            self._schedule(self._maybe_speculate(event.transcript))
+
         if event.end_of_turn and event.transcript:
             print("calling process_buffered_transcript")
-            asyncio.run_coroutine_threadsafe(
-            self.process_buffered_transcript(),
-            self.loop
-        )
+            self._schedule(self.process_buffered_transcript())
         else:
             print("calling check_silence_and_process")
-            asyncio.run_coroutine_threadsafe(
-            self.check_silence_and_process(),
-            self.loop
-        )
+            self._schedule(self.check_silence_and_process())
       
       
         if event.end_of_turn and not event.turn_is_formatted:
@@ -112,6 +191,13 @@ class AssemblyAIStreamingClient:
             return
         
         self.is_processing = True
+        self.committed_turn_order = self.current_turn_order
+        #the transcript is final for us once it's committed, whether upstream or VAD ended the turn
+        now = time.perf_counter()
+        self.turn_count += 1
+        timeline = self.timeline = TurnTimeline(self.turn_count, on_finish=self._send_timing)
+        timeline.mark("user_audio_end", self.last_user_audio or now)
+        timeline.mark("final_transcript", now)
         
         await self.websocket.send_json({
                "status": "transcript",
@@ -121,20 +207,117 @@ class AssemblyAIStreamingClient:
         
         final_transcript = self.transcript
         self.transcript = ""
+
+        speculation, self.speculation = self.speculation, None
+        if speculation and speculation.matches(final_transcript):
+            print("Speculative reply confirmed by the final transcript")
+            timeline = self.timeline = speculation.adopt(final_transcript, timeline, self._tool_status)
+        elif speculation:
+            asyncio.create_task(speculation.discard())
+            speculation = None
         
-        # Call LLM asynchronously
-        self.llm_task = asyncio.run_coroutine_threadsafe(
-            self.call_llm_async(final_transcript),
-            self.loop,
-            
-        )
+        # Call LLM asynchronously (kept as a task so barge-in can cancel it)
+        self.llm_task = asyncio.create_task(self.call_llm_async(final_transcript, timeline, speculation))
         print("LLM task started")
     
-    async def call_llm_async(self, text: str):
+    async def on_local_end_of_utterance(self):
+        """VAD saw the speaker stop: ask upstream to finalize, then answer without waiting for it"""
+        if not self.transcript or self.is_processing:
+            return
+        print("Local end of utterance detected")
+        #make sure the tail of the utterance reaches STT before asking it to finalize
+        self.ingest.flush()
+        await self.ingest.drain()
+        force_endpoint = getattr(self.client, "force_endpoint", None)
+        if force_endpoint:
+            try:
+                force_endpoint()
+            except Exception as e:
+                logging.error(f"force_endpoint failed: {e}")
+        #short grace period so a forced final transcript can land first
+        await asyncio.sleep(settings.vad_eou_grace)
+        await self.process_buffered_transcript()
+
+    async def _maybe_speculate(self, transcript: str):
+        """Speculate once a partial transcript has stayed the same for the stability window"""
+        if self.speculation_timer:
+            self.speculation_timer.cancel()
+        self.speculation_timer = asyncio.current_task()
+        try:
+            await asyncio.sleep(settings.speculative_stable_ms / 1000)
+        except asyncio.CancelledError:
+            return
+        self.speculation_timer = None
+        if (self.is_processing or transcript != self.transcript
+                or len(transcript.split()) < settings.speculative_min_words):
+            return
+        if self.speculation:
+            if self.speculation.matches(transcript):
+                return
+            #the user kept talking: what we guessed is stale
+            stale, self.speculation = self.speculation, None
+            await stale.discard()
+            if self.is_processing:
+                return
+        print(f"Speculating on partial transcript: {transcript}")
+        self.speculation = Speculation(
+            transcript, self.gemini_service,
+            murf_service=self.murf_service if settings.speculative_tts else None,
+        )
+
+    async def _tool_status(self, names: list, active: bool):
+        """Tell the browser why the answer is taking a moment"""
+        await self.websocket.send_json({
+            "status": "tool_status",
+            "active": active,
+            "tools": names,
+            "message": "Looking that up..." if active else "",
+        })
+
+    def note_user_audio(self):
+        """Called for audio the VAD judged to be speech"""
+        self.last_user_audio = time.perf_counter()
+
+    async def _send_timing(self, report: dict):
+        if self.timing_events:
+            await self.websocket.send_json({"status": "timing", **report})
+
+    @property
+    def bot_speaking(self) -> bool:
+        """True while an answer is being generated or is still playing in the browser"""
+        return self.is_processing or self.murf_service.is_speaking
+
+    async def barge_in(self):
+        """User started talking over the bot: stop generation, synthesis and playback"""
+        if not self.bot_speaking:
+            return
+        print("Barge-in: cancelling current bot turn")
+        task = self.llm_task
+        if task and not task.done():
+            task.cancel()
+        await self.murf_service.abort()
+        self.is_processing = False
+        if self.timeline:
+            await self.timeline.finish("cancelled")
+        # Tell the browser to drop audio it has already scheduled
+        await self.websocket.send_json({
+            "status": "barge_in"
+        })
+        await self.websocket.send_json({
+            "status": "bot_speaking",
+            "active": False
+        })
+
+    async def call_llm_async(self, text: str, timeline: TurnTimeline = None, speculation: Speculation = None):
         print("Calling LLM...")
         try:
-            
-            llm_response = await self.gemini_service.gemini_response(text)
+            if self.streaming:
+                spoke = await self.stream_llm_to_tts(text, timeline, speculation)
+                if not spoke and timeline:
+                    await timeline.finish()
+                return
+
+            llm_response = await self.gemini_service.gemini_response(text, timeline, on_tool_calls=self._tool_status)
                  
             
             # Send completion signal
@@ -152,11 +335,15 @@ class AssemblyAIStreamingClient:
             #Convert LLM response to speech using Murf.ai
             if llm_response.strip():
                 print("Converting LLM response to speech...")
-                await self.murf_service.synthesize_speech(llm_response)
+                await self.murf_service.synthesize_speech(llm_response, timeline)
+            elif timeline:
+                await timeline.finish()
                 
             
         except Exception as e:
             logging.error(f"LLM Error: {e}")
+            if timeline:
+                await timeline.finish("failed")
             await self.websocket.send_json({
                 "status": "error",
                 "message": str(e)
@@ -165,24 +352,105 @@ class AssemblyAIStreamingClient:
             self.is_processing = False
             print("is_processing final",self.is_processing)
      
+    async def stream_llm_to_tts(self, text: str, timeline: TurnTimeline = None,
+                                speculation: Speculation = None) -> bool:
+        """Forward each finished sentence to Murf while later tokens are still arriving; True if anything was spoken"""
+        segmenter = SentenceSegmenter()
+        full_text = ""
+        speaking = False
+
+        async def speak(segment: str):
+            nonlocal speaking
+            if not speaking:
+                # Notify client that bot is about to speak (pause mic streaming)
+                await self.websocket.send_json({
+                    "status": "bot_speaking",
+                    "active": True
+                })
+                speaking = True
+            await self.murf_service.send_text(segment, timeline)
+
+        if speculation:
+            #confirmed speculative reply: replay what is already generated, then follow it live
+            deltas = speculation.stream()
+        else:
+            deltas = self.gemini_service.gemini_response_stream(text, timeline, on_tool_calls=self._tool_status)
+        try:
+            async for delta in deltas:
+                full_text += delta
+                await self.websocket.send_json({
+                    "status": "llm_response",
+                    "text": delta,
+                    "is_complete": False
+                })
+                for segment in segmenter.feed(delta):
+                    await speak(segment)
+        finally:
+            #close the stream now (not whenever it is collected) so an interrupted reply is saved
+            await deltas.aclose()
+            if speculation:
+                await speculation.finish()
+
+        tail = segmenter.flush()
+        if tail:
+            await speak(tail)
+
+        # Send completion signal with the whole answer
+        await self.websocket.send_json({
+            "status": "llm_response",
+            "text": full_text,
+            "is_complete": True
+        })
+        if speaking:
+            print("LLM stream finished, flushing Murf...")
+            await self.murf_service.end_turn()
+        return speaking
+
     def on_terminated(self, client, event: TerminationEvent):
        print(f"Session terminated: {event.audio_duration_seconds} seconds processed")
        # Process any remaining buffered transcript
        if self.transcript:
-            self.process_buffered_transcript()     
+            self._schedule(self.process_buffered_transcript())
     
     def on_error(self,client, error: StreamingError):
        print(f"Error: {error}")
        
     def stream(self, audio_chunk: bytes):
-        self.client.stream(audio_chunk)
+        if self.client is not None:
+            self.client.stream(audio_chunk)
+            return
+        #still connecting: buffer (dropping the oldest audio if it takes too long)
+        if self.first_audio_time is None:
+            self.first_audio_time = time.perf_counter()
+        self.pending_audio.append(audio_chunk)
+        self.pending_bytes += len(audio_chunk)
+        while self.pending_bytes > MAX_PENDING_AUDIO_BYTES and self.pending_audio:
+            self.pending_bytes -= len(self.pending_audio.popleft())
+        if self.connect_task is None and time.monotonic() >= self.connect_retry_at:
+            self.connect_task = asyncio.create_task(self._connect())
+
+    async def stream_async(self, audio_chunk: bytes):
+        """Ingest sink: waits on upstream backpressure when the native client is in use"""
+        send_audio = getattr(self.client, "send_audio", None)
+        if send_audio is None:
+            self.stream(audio_chunk)
+            return
+        await send_audio(audio_chunk)
         
 
-    def close(self):
-        # Process any remaining transcript before closing
-        if self.transcript:
-            self.process_buffered_transcript()
-        self.client.disconnect(terminate=True)   
+    async def close(self):
+        await self.ingest.close()
+        if self.speculation_timer:
+            self.speculation_timer.cancel()
+        if self.speculation:
+            await self.speculation.discard("abandoned")
+            self.speculation = None
+        if self.connect_task and not self.connect_task.done():
+            self.connect_task.cancel()
+        if self.stt_session is not None:
+            #the browser is gone, so any unanswered transcript is dropped
+            self.stt_session.listener = None
+            await self.stt_session.disconnect()
     
 
 
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class AsyncTTLCache:
+    """Size-bounded TTL cache whose loads are single-flight: concurrent misses share one call"""
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict() #key -> (expires_at, value)
+        self.inflight: Dict[Hashable, asyncio.Task] = {}
+
+        #metrics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                          should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+        """Return the cached value, join an in-flight load, or run loader once and cache its result
+
+        Only successful loads are shared: a caller that joined a load which raised or returned
+        something should_cache rejects runs its own loader instead of inheriting that result.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self.inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader, should_cache))
+            self.inflight[key] = task
+            #shield so one cancelled caller doesn't cancel the load for everyone sharing it
+            return await asyncio.shield(task)
+
+        try:
+            value = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise #we were cancelled, not the shared load
+            value, failed = None, True
+        except Exception:
+            value, failed = None, True
+        else:
+            failed = not should_cache(value)
+        if failed:
+            #the failure may be specific to the other caller (e.g. its API key), so try ourselves
+            self.misses += 1
+            value = await loader()
+            if should_cache(value):
+                self.set(key, value)
+            return value
+        self.coalesced += 1
+        return value
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                    should_cache: Callable[[Any], bool]) -> Any:
+        try:
+            value = await loader()
+            if should_cache(value):
+                self.set(key, value)
+            return value
+        finally:
+            self.inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "inflight": len(self.inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,239 @@
+import logging
+import struct
+from typing import List, Optional, Tuple
+
+from services.audio_frames import FORMAT_MP3, FORMAT_OPUS, FORMAT_PCM16
+from config.config import settings
+
+#(packet bytes, duration in seconds)
+Packet = Tuple[bytes, float]
+
+
+class UnsupportedStream(Exception):
+    """The upstream stream isn't in the codec we negotiated"""
+
+
+class AudioProfile:
+    """One TTS output format: what we ask Murf for and how frames are labelled for the browser"""
+    def __init__(self, name: str, murf_format: str, sample_rate: int, frame_format: int,
+                 frame_rate: Optional[int] = None):
+        self.name = name
+        self.murf_format = murf_format
+        self.sample_rate = sample_rate
+        self.frame_format = frame_format
+        #rate the browser decoder runs at (Opus always decodes at 48 kHz)
+        self.frame_rate = frame_rate or sample_rate
+
+    @property
+    def packetized(self) -> bool:
+        return self.frame_format != FORMAT_PCM16
+
+    def new_packetizer(self):
+        if self.frame_format == FORMAT_MP3:
+            return MP3FrameSplitter()
+        if self.frame_format == FORMAT_OPUS:
+            return OggOpusDemuxer()
+        return None
+
+    def describe(self) -> dict:
+        return {
+            "format": self.name,
+            "codec": {FORMAT_PCM16: "pcm16", FORMAT_MP3: "mp3", FORMAT_OPUS: "opus"}[self.frame_format],
+            "sampleRate": self.frame_rate,
+        }
+
+
+AUDIO_PROFILES = {
+    "pcm44": AudioProfile("pcm44", "WAV", 44100, FORMAT_PCM16),
+    "pcm24": AudioProfile("pcm24", "WAV", 24000, FORMAT_PCM16),
+    "mp3": AudioProfile("mp3", "MP3", 24000, FORMAT_MP3),
+    "opus": AudioProfile("opus", "OGG", 24000, FORMAT_OPUS, frame_rate=48000),
+}
+
+_CODEC_OF = {"pcm44": "pcm", "pcm24": "pcm", "mp3": "mp3", "opus": "opus"}
+
+
+def choose_audio_profile(hint: Optional[dict]) -> AudioProfile:
+    """Pick the TTS output format from the browser's codec support and network hint"""
+    allowed = [name for name in settings.tts_output_formats if name in AUDIO_PROFILES]
+    default = AUDIO_PROFILES.get(settings.tts_default_format, AUDIO_PROFILES["pcm44"])
+    if not isinstance(hint, dict):
+        return default
+
+    codecs = set(hint.get("codecs") or ["pcm"]) | {"pcm"}
+    downlink = hint.get("downlinkMbps")
+    constrained = (
+        bool(hint.get("saveData"))
+        or hint.get("effectiveType") in ("slow-2g", "2g", "3g")
+        or (isinstance(downlink, (int, float)) and downlink < 1.5)
+    )
+    if constrained:
+        order = ["opus", "mp3", "pcm24", "pcm44"]
+    elif isinstance(downlink, (int, float)) and downlink < 10:
+        order = ["mp3", "opus", "pcm24", "pcm44"]
+    else:
+        #plenty of bandwidth: skip decoding, but 24 kHz is all a TTS voice needs
+        order = ["pcm24", "pcm44", "mp3", "opus"]
+
+    for name in order:
+        if name in allowed and _CODEC_OF[name] in codecs:
+            return AUDIO_PROFILES[name]
+    return default
+
+
+#MPEG audio: bitrates (kbps) for layer III by [mpeg1?][index], sample rates by [version][index]
+_MP3_BITRATES = {
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+}
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  #MPEG1
+    2: [22050, 24000, 16000],  #MPEG2
+    0: [11025, 12000, 8000],   #MPEG2.5
+}
+
+
+class MP3FrameSplitter:
+    """Cuts an MP3 byte stream into whole frames (WebCodecs wants one frame per chunk)"""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.started = False
+
+    def _skip_id3(self) -> bool:
+        """Drop a leading ID3v2 tag; False if the tag isn't complete yet"""
+        if self.buffer[:3] != b"ID3":
+            return True
+        if len(self.buffer) < 10:
+            return False
+        #synchsafe size: 7 bits per byte, excluding the 10-byte header
+        size = ((self.buffer[6] & 0x7F) << 21 | (self.buffer[7] & 0x7F) << 14
+                | (self.buffer[8] & 0x7F) << 7 | (self.buffer[9] & 0x7F)) + 10
+        if len(self.buffer) < size:
+            return False
+        del self.buffer[:size]
+        return True
+
+    @staticmethod
+    def _frame_info(header: bytes) -> Optional[Tuple[int, float]]:
+        """(frame length, duration) for a layer III frame header, or None if it isn't one"""
+        b1, b2 = header[1], header[2]
+        if header[0] != 0xFF or (b1 & 0xE0) != 0xE0:
+            return None
+        version = (b1 >> 3) & 0x03
+        layer = (b1 >> 1) & 0x03
+        if version == 1 or layer != 1:
+            return None
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 0x03
+        if bitrate_index in (0, 15) or rate_index == 3:
+            return None
+        mpeg1 = version == 3
+        bitrate = _MP3_BITRATES[mpeg1][bitrate_index] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+        padding = (b2 >> 1) & 0x01
+        samples = 1152 if mpeg1 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+        return length, samples / sample_rate
+
+    def feed(self, data: bytes) -> List[Packet]:
+        self.buffer += data
+        if not self.started:
+            if not self._skip_id3():
+                return []
+            self.started = True
+
+        packets = []
+        offset = 0
+        while offset + 4 <= len(self.buffer):
+            info = self._frame_info(self.buffer[offset:offset + 4])
+            if info is None:
+                offset += 1 #resync on garbage
+                continue
+            length, duration = info
+            if offset + length > len(self.buffer):
+                break
+            packets.append((bytes(self.buffer[offset:offset + length]), duration))
+            offset += length
+        del self.buffer[:offset]
+        return packets
+
+
+def opus_packet_duration(packet: bytes) -> float:
+    """Duration of one Opus packet from its TOC byte (RFC 6716 section 3.1)"""
+    if not packet:
+        return 0.0
+    toc = packet[0]
+    config = toc >> 3
+    if config < 12:
+        frame_ms = (10, 20, 40, 60)[config % 4]
+    elif config < 16:
+        frame_ms = (10, 20)[config % 2]
+    else:
+        frame_ms = (2.5, 5, 10, 20)[config % 4]
+    code = toc & 0x03
+    if code == 0:
+        frames = 1
+    elif code in (1, 2):
+        frames = 2
+    else:
+        frames = packet[1] & 0x3F if len(packet) > 1 else 0
+    return frames * frame_ms / 1000
+
+
+class OggOpusDemuxer:
+    """Pulls raw Opus packets out of an Ogg stream so the browser can decode them with WebCodecs"""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.partial = bytearray() #packet continued on the next page
+        self.headers_seen = 0
+
+    def feed(self, data: bytes) -> List[Packet]:
+        self.buffer += data
+        packets = []
+        while True:
+            if len(self.buffer) < 27:
+                break
+            if self.buffer[:4] != b"OggS":
+                start = self.buffer.find(b"OggS", 1)
+                if start < 0:
+                    del self.buffer[:-3]
+                    break
+                del self.buffer[:start]
+                continue
+            segments = self.buffer[26]
+            header_size = 27 + segments
+            if len(self.buffer) < header_size:
+                break
+            lacing = self.buffer[27:header_size]
+            body_size = sum(lacing)
+            if len(self.buffer) < header_size + body_size:
+                break
+
+            body = self.buffer[header_size:header_size + body_size]
+            position = 0
+            for size in lacing:
+                self.partial += body[position:position + size]
+                position += size
+                if size < 255:
+                    packets.extend(self._packet(bytes(self.partial)))
+                    self.partial.clear()
+            del self.buffer[:header_size + body_size]
+        return packets
+
+    def _packet(self, packet: bytes) -> List[Packet]:
+        if self.headers_seen == 0:
+            self.headers_seen = 1
+            if not packet.startswith(b"OpusHead"):
+                raise UnsupportedStream("Ogg stream is not Opus")
+            return []
+        if self.headers_seen == 1:
+            self.headers_seen = 2
+            if packet.startswith(b"OpusTags"):
+                return []
+            logging.warning("Ogg Opus stream without OpusTags header")
+        return [(packet, opus_packet_duration(packet))]
+
+
+def pack_packets(packets: List[Packet]) -> bytes:
+    """u16 length-prefixed packets, the payload layout of FLAG_PACKETS frames"""
+    return b"".join(struct.pack("<H", len(packet)) + packet for packet, _ in packets)
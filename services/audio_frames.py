@@ -0,0 +1,81 @@
+import base64
+import struct
+from typing import Optional, Tuple
+
+#binary audio frame sent to the browser:
+#  u8 version | u8 format | u8 channels | u8 flags | u32 sequence | u32 sample_rate | payload
+#little-endian, 12 bytes so the payload starts 4-byte aligned and can be viewed as Int16Array without a copy
+FRAME_HEADER = struct.Struct("<BBBBII")
+FRAME_VERSION = 1
+
+FORMAT_PCM16 = 1
+FORMAT_MP3 = 2
+FORMAT_OPUS = 3
+
+#payload is a run of u16 length-prefixed packets (compressed formats)
+FLAG_PACKETS = 0x01
+
+
+def encode_audio_frame(payload: bytes, sequence: int, sample_rate: int,
+                       audio_format: int = FORMAT_PCM16, channels: int = 1, flags: int = 0) -> bytes:
+    header = FRAME_HEADER.pack(FRAME_VERSION, audio_format, channels, flags, sequence & 0xFFFFFFFF, sample_rate)
+    return header + payload
+
+
+def strip_wav_header(data: bytes) -> Tuple[bytes, Optional[int]]:
+    """Return (pcm, sample_rate) for a WAV blob, or (data, None) if it has no RIFF header"""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return data, None
+
+    sample_rate = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack_from("<I", data, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b"fmt " and body + 8 <= len(data):
+            sample_rate = struct.unpack_from("<I", data, body + 4)[0]
+        elif chunk_id == b"data":
+            #streamed WAV often carries a bogus data size, so take everything after the header
+            return data[body:], sample_rate
+        offset = body + chunk_size + (chunk_size & 1)
+    return b"", sample_rate
+
+
+class PCMFrameEncoder:
+    """Turns Murf's base64 WAV/PCM chunks into binary PCM16 frames for one session"""
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.sequence = 0
+        self.carry = b"" #odd trailing byte held back so every frame holds whole samples
+
+    def encode(self, audio_base64: str) -> Optional[bytes]:
+        pcm = self.decode(audio_base64)
+        return self.frame(pcm) if pcm else None
+
+    def decode(self, audio_base64: str) -> bytes:
+        """Base64 WAV/PCM chunk -> whole PCM16 samples (header stripped)"""
+        pcm, sample_rate = strip_wav_header(base64.b64decode(audio_base64))
+        if sample_rate:
+            self.sample_rate = sample_rate
+
+        pcm = self.carry + pcm
+        usable = len(pcm) & ~1
+        self.carry = pcm[usable:]
+        return pcm[:usable]
+
+    def frame(self, pcm: bytes) -> bytes:
+        frame = encode_audio_frame(pcm, self.sequence, self.sample_rate)
+        self.sequence += 1
+        return frame
+
+    def packet_frame(self, payload: bytes, audio_format: int, sample_rate: int) -> bytes:
+        """Frame already length-prefixed compressed packets, sharing the PCM sequence counter"""
+        frame = encode_audio_frame(payload, self.sequence, sample_rate,
+                                   audio_format=audio_format, flags=FLAG_PACKETS)
+        self.sequence += 1
+        return frame
+
+    def reset(self):
+        """Drop any partial sample left over from the previous turn"""
+        self.carry = b""
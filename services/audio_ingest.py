@@ -0,0 +1,116 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional, Union
+
+
+class AudioIngest:
+    """Per-session ingest stage between the browser socket and STT
+
+    Incoming PCM16 is cut into fixed frame_ms frames and kept in a bounded ring buffer
+    that a dedicated sender task drains into the STT client. If the upstream falls
+    behind, the oldest frames are dropped (and counted) instead of stalling /ws.
+    """
+    def __init__(self, sink: Callable[[bytes], Union[Awaitable[Any], Any]], sample_rate: int = 16000,
+                 frame_ms: int = 50, max_buffer_ms: int = 1000):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_bytes = sample_rate * 2 * frame_ms // 1000
+        self.max_frames = max(1, max_buffer_ms // frame_ms)
+        self.partial = bytearray()
+        self.frames = deque()
+        self.ready = asyncio.Event()
+        self.drained = asyncio.Event()
+        self.drained.set()
+        self.sender_task: Optional[asyncio.Task] = None
+        self.dropping = False
+
+        #metrics
+        self.frames_in = 0
+        self.frames_out = 0
+        self.dropped_frames = 0
+        self.max_depth = 0
+        self.send_time = 0.0
+
+    def start(self):
+        if self.sender_task is None:
+            self.sender_task = asyncio.create_task(self._send_loop())
+
+    def push(self, pcm: bytes):
+        """Queue audio without blocking; re-framed to frame_ms"""
+        if not pcm:
+            return
+        self.partial += pcm
+        while len(self.partial) >= self.frame_bytes:
+            self._enqueue(bytes(self.partial[:self.frame_bytes]))
+            del self.partial[:self.frame_bytes]
+
+    def flush(self):
+        """Send the trailing partial frame now, padded with silence to a full frame"""
+        if self.partial:
+            self._enqueue(bytes(self.partial) + bytes(self.frame_bytes - len(self.partial)))
+            self.partial.clear()
+
+    def _enqueue(self, frame: bytes):
+        self.frames.append(frame)
+        self.frames_in += 1
+        if len(self.frames) > self.max_frames:
+            self.frames.popleft()
+            self.dropped_frames += 1
+            if not self.dropping:
+                self.dropping = True
+                logging.warning(f"STT upstream is behind; dropping oldest audio ({self.max_frames} frames buffered)")
+        self.max_depth = max(self.max_depth, len(self.frames))
+        self.drained.clear()
+        self.ready.set()
+
+    async def _send_loop(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.frames:
+                frame = self.frames.popleft()
+                started = time.perf_counter()
+                try:
+                    result = self.sink(frame)
+                    if inspect.isawaitable(result):
+                        await result
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.error(f"STT send failed: {e}")
+                self.send_time += time.perf_counter() - started
+                self.frames_out += 1
+            self.dropping = False
+            self.drained.set()
+
+    async def drain(self, timeout: float = 0.5):
+        """Wait (briefly) until everything queued has been handed to STT"""
+        try:
+            await asyncio.wait_for(self.drained.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def close(self):
+        if self.sender_task:
+            self.sender_task.cancel()
+            self.sender_task = None
+        self.frames.clear()
+        self.partial.clear()
+
+    def stats(self) -> dict:
+        return {
+            "frame_ms": self.frame_ms,
+            "queue_depth": len(self.frames),
+            "queue_ms": len(self.frames) * self.frame_ms,
+            "max_depth": self.max_depth,
+            "capacity": self.max_frames,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "dropped_frames": self.dropped_frames,
+            "dropped_ms": self.dropped_frames * self.frame_ms,
+            "avg_send_ms": round(self.send_time / self.frames_out * 1000, 3) if self.frames_out else 0.0,
+        }
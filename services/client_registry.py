@@ -0,0 +1,179 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+from google import genai
+from google.genai import types
+from murf import AsyncMurf
+
+from config.config import settings
+
+
+class TavilyHTTPClient:
+    """Minimal async Tavily search client on a pooled httpx connection"""
+    def __init__(self, api_key: str, limits: httpx.Limits, base_url: str = "https://api.tavily.com"):
+        self.api_key = api_key
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            limits=limits,
+            timeout=httpx.Timeout(20.0, connect=5.0),
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+
+    async def search(self, query: str, **options) -> dict:
+        response = await self.http.post("/search", json={"query": query, **options})
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+def _limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+
+
+def _gemini_factory(api_key: str):
+    limits = _limits(settings.gemini_max_connections)
+    http_options = types.HttpOptions(
+        base_url=settings.gemini_base_url or None,
+        client_args={"limits": limits},
+        async_client_args={"limits": limits},
+    )
+    if api_key:
+        return genai.Client(api_key=api_key, http_options=http_options)
+    return genai.Client(http_options=http_options)
+
+
+def _murf_factory(api_key: str):
+    http = httpx.AsyncClient(
+        limits=_limits(settings.murf_max_connections),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+    if settings.murf_base_url:
+        client = AsyncMurf(api_key=api_key, base_url=settings.murf_base_url, httpx_client=http)
+    else:
+        client = AsyncMurf(api_key=api_key, httpx_client=http)
+    client._registry_http = http #closed with the client on eviction
+    return client
+
+
+def _tavily_factory(api_key: str):
+    return TavilyHTTPClient(api_key, _limits(settings.tavily_max_connections), base_url=settings.tavily_base_url)
+
+
+async def _close_client(client: Any):
+    """Best-effort close for whatever kind of client a provider returns"""
+    closers = [
+        getattr(getattr(client, "_registry_http", None), "aclose", None),
+        getattr(client, "aclose", None),
+        getattr(getattr(client, "aio", None), "aclose", None),
+        getattr(client, "close", None),
+    ]
+    for closer in closers:
+        if closer is None:
+            continue
+        try:
+            result = closer()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logging.error(f"Error closing upstream client: {e}")
+        return
+
+
+class ClientRegistry:
+    """One long-lived upstream client per (provider, API key), with idle eviction
+
+    Clients keep their HTTP connection pools warm between requests. Services should look
+    the client up on each use rather than hold on to it, so eviction never strands them.
+    """
+    def __init__(self, idle_ttl: float, close_grace: float = 60.0, sweep_interval: float = 60.0):
+        self.idle_ttl = idle_ttl
+        self.close_grace = close_grace #evicted clients stay open this long for in-flight calls
+        self.sweep_interval = sweep_interval
+        self.factories: Dict[str, Callable[[str], Any]] = {}
+        self.clients: Dict[Tuple[str, str], list] = {} #(provider, key) -> [client, last_used]
+        self.retired: list = [] #(close_at, client)
+        self.sweep_task: Optional[asyncio.Task] = None
+
+        #metrics per provider
+        self.created: Dict[str, int] = {}
+        self.reused: Dict[str, int] = {}
+        self.evicted: Dict[str, int] = {}
+
+    def register(self, provider: str, factory: Callable[[str], Any]):
+        self.factories[provider] = factory
+
+    def get(self, provider: str, api_key: str) -> Any:
+        entry = self.clients.get((provider, api_key or ""))
+        if entry is not None:
+            entry[1] = time.monotonic()
+            self.reused[provider] = self.reused.get(provider, 0) + 1
+            return entry[0]
+        client = self.factories[provider](api_key)
+        self.clients[(provider, api_key or "")] = [client, time.monotonic()]
+        self.created[provider] = self.created.get(provider, 0) + 1
+        return client
+
+    async def sweep(self):
+        now = time.monotonic()
+        for key, (client, last_used) in list(self.clients.items()):
+            if now - last_used > self.idle_ttl:
+                del self.clients[key]
+                self.evicted[key[0]] = self.evicted.get(key[0], 0) + 1
+                self.retired.append((now + self.close_grace, client))
+        due = [client for close_at, client in self.retired if close_at <= now]
+        self.retired = [(close_at, client) for close_at, client in self.retired if close_at > now]
+        for client in due:
+            await _close_client(client)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.error(f"Client registry sweep failed: {e}")
+
+    def start(self):
+        if self.sweep_task is None:
+            self.sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        if self.sweep_task:
+            self.sweep_task.cancel()
+            self.sweep_task = None
+        clients = [client for client, _ in self.clients.values()] + [client for _, client in self.retired]
+        self.clients.clear()
+        self.retired = []
+        for client in clients:
+            await _close_client(client)
+
+    def stats(self) -> dict:
+        live: Dict[str, int] = {}
+        for provider, _ in self.clients:
+            live[provider] = live.get(provider, 0) + 1
+        return {
+            provider: {
+                "live_clients": live.get(provider, 0),
+                "created": self.created.get(provider, 0),
+                "reused": self.reused.get(provider, 0),
+                "evicted": self.evicted.get(provider, 0),
+            }
+            for provider in self.factories
+        }
+
+
+#singleton instance
+client_registry = ClientRegistry(idle_ttl=settings.client_idle_ttl)
+client_registry.register("gemini", _gemini_factory)
+client_registry.register("murf", _murf_factory)
+client_registry.register("tavily", _tavily_factory)
@@ -4,12 +4,22 @@ import os
 from dotenv import load_dotenv
 import logging
 import asyncio
+import json
 from datetime import date
-from services.tool_calling import web_search
-from config.config import api_keys
+import time
+from typing import Optional
+from services.tool_calling import tool_registry, ToolContext
+from services.history_manager import HistoryManager
+from services.state_store import state_store
+from services.client_registry import client_registry
+from services.metrics import TurnTimeline
+from config.config import api_keys, settings
 
 load_dotenv()
 
+#caps in-flight Gemini requests per worker so a burst of turns can't swamp the event loop or the quota
+gemini_slots = asyncio.Semaphore(settings.gemini_max_concurrency)
+
 system_instruction = """
 You are Mizuki, a friendly and empathetic AI assistant who helps users with real-time information, emotional support, and joyful conversations.
 
@@ -51,39 +61,216 @@ IMPORTANT GUIDELINES:
 - Focus on creating positive, uplifting interactions
 """
 
+#explicit version: context caches are bound to one model version
+GEMINI_MODEL = "gemini-2.0-flash-001"
+#Gemini refuses explicit context caches smaller than this for GEMINI_MODEL
+CONTEXT_CACHE_MIN_TOKENS = 4096
+
+#prompt/cached/output token totals for this worker
+gemini_usage = {
+    "calls": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+    "output_tokens": 0,
+    "last_prompt_tokens": 0,
+}
+
+
+class PersonaContextCache:
+    """Explicit Gemini context cache holding the static persona prompt and tool declarations"""
+    def __init__(self, enabled: bool, ttl: int):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.entries = {} #api key -> (cache name, expires_at)
+        self.retry_after = {} #api key -> time before which we don't try again after a failure
+        self.size_checked = False
+        self.lock = asyncio.Lock()
+
+    async def _large_enough(self, client, system_instruction: str, tools: list) -> bool:
+        """Count the persona and tool declarations once; below the minimum, caching is switched off"""
+        declarations = json.dumps([tool.model_dump(mode="json", exclude_none=True) for tool in tools])
+        response = await client.aio.models.count_tokens(
+            model=GEMINI_MODEL,
+            contents=system_instruction + "\n" + declarations,
+        )
+        tokens = response.total_tokens or 0
+        self.size_checked = True
+        if tokens < CONTEXT_CACHE_MIN_TOKENS:
+            print(f"Persona is {tokens} tokens, below the {CONTEXT_CACHE_MIN_TOKENS} Gemini caches; sending it inline")
+            self.enabled = False
+            return False
+        return True
+
+    async def get(self, client, api_key: str, system_instruction: str, tools: list):
+        """Name of a live cache for this key, creating or extending it as needed (None if unavailable)"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        entry = self.entries.get(api_key)
+        if entry and entry[1] - now > 60:
+            return entry[0]
+        if self.retry_after.get(api_key, 0) > now:
+            return None
+
+        async with self.lock:
+            entry = self.entries.get(api_key)
+            if entry and entry[1] - time.time() > 60:
+                return entry[0]
+            try:
+                if not self.size_checked and not await self._large_enough(client, system_instruction, tools):
+                    return None
+                if entry:
+                    await client.aio.caches.update(
+                        name=entry[0],
+                        config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"),
+                    )
+                    name = entry[0]
+                else:
+                    cache = await client.aio.caches.create(
+                        model=GEMINI_MODEL,
+                        config=types.CreateCachedContentConfig(
+                            display_name="mizuki-persona",
+                            system_instruction=system_instruction,
+                            tools=tools,
+                            ttl=f"{self.ttl}s",
+                        ),
+                    )
+                    name = cache.name
+                    print(f"Created Gemini context cache {name}")
+            except Exception as e:
+                #e.g. the persona is below the model's minimum cacheable size; fall back to inline prompts
+                logging.warning(f"Gemini context cache unavailable, sending persona inline: {e}")
+                self.entries.pop(api_key, None)
+                self.retry_after[api_key] = time.time() + 600
+                return None
+            self.entries[api_key] = (name, time.time() + self.ttl)
+            return name
+
+
+persona_cache = PersonaContextCache(
+    enabled=settings.gemini_context_cache,
+    ttl=settings.gemini_context_cache_ttl,
+)
+
+
+def get_gemini_client(api_key: str = None) -> genai.Client:
+    """Shared client (and connection pool) for this API key from the registry"""
+    return client_registry.get("gemini", api_key or api_keys.gemini)
+
+
+def dump_contents(contents: list) -> list:
+    """Gemini history -> JSON strings for the state store (bytes fields round-trip as base64)"""
+    return [content.model_dump_json(exclude_none=True) for content in contents]
+
+
+def load_contents(data: list) -> list:
+    return [types.Content.model_validate_json(item) for item in data or []]
+
+
 class GeminiService:
-    def __init__(self, api_key: str = api_keys.gemini):
+    def __init__(self, api_key: str = None, tavily_key: str = None, state_key: str = None):
+        self.api_key = api_key or api_keys.gemini
+        self.tavily_key = tavily_key
+        #conversation is persisted under this id so any worker can resume it
+        self.state_key = state_key
+        self.save_task = None
         try:
-            self.client = genai.Client()
+            get_gemini_client(self.api_key)
         except Exception as e:
             logging.error(f"Failed to initialize Gemini client: {e}")
             raise ValueError("GOOGLE_API_KEY not found or invalid.") from e
 
         self.system_instruction = system_instruction
         
-        self.web_search_declaration = {
-            "name": "web_search",
-            "description": "Search the web for real-time information, news, weather, anime, movies, and updated data",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "The search query to look up real-time information"
-                    }
-                },
-                "required": ["query"]
-            }
-        }
-        
-        #web search tool 
-        self.tools = types.Tool(function_declarations=[self.web_search_declaration])
+        #every registered tool (web_search, ...); see services/tool_calling.py
+        self.tools = types.Tool(function_declarations=tool_registry.declarations())
         
-        #conversation history
+        #conversation history: recent turns verbatim, older ones summarized by the history manager
         self.conversation_history = []
+        self.history = HistoryManager(
+            lambda: self.client,
+            model=GEMINI_MODEL,
+            token_budget=settings.history_token_budget,
+            keep_turns=settings.history_keep_turns,
+        )
+        self.last_usage = {}
         logging.info("GeminiService initialized with Mizuki persona.")
 
-    async def gemini_response(self, user_prompt: str) -> str:
+    @property
+    def client(self) -> genai.Client:
+        #looked up per use so an idle-evicted client is never reused after it closes
+        return get_gemini_client(self.api_key)
+
+    async def _generate_config(self, allow_tools: bool = True) -> types.GenerateContentConfig:
+        """Use the cached persona when available, otherwise send it inline with every call"""
+        cached = await persona_cache.get(self.client, self.api_key, self.system_instruction, [self.tools])
+        if cached:
+            config = types.GenerateContentConfig(cached_content=cached)
+            if not allow_tools:
+                #tools live in the cache, so switch them off instead of omitting them
+                config.tool_config = types.ToolConfig(
+                    function_calling_config=types.FunctionCallingConfig(mode="NONE")
+                )
+            return config
+        return types.GenerateContentConfig(
+            system_instruction=self.system_instruction,
+            tools=[self.tools] if allow_tools else None
+        )
+
+    def _prompt_contents(self, turn: list = ()) -> list:
+        """History window plus the entries of a turn that hasn't been committed yet"""
+        return self.history.prompt_contents(self.conversation_history + list(turn))
+
+    def _record_usage(self, usage):
+        """Report prompt/cached/output tokens for one Gemini call"""
+        if usage is None:
+            return
+        prompt = usage.prompt_token_count or 0
+        cached = usage.cached_content_token_count or 0
+        output = usage.candidates_token_count or 0
+        self.last_usage = {"prompt_tokens": prompt, "cached_tokens": cached, "output_tokens": output}
+        gemini_usage["calls"] += 1
+        gemini_usage["prompt_tokens"] += prompt
+        gemini_usage["cached_tokens"] += cached
+        gemini_usage["output_tokens"] += output
+        gemini_usage["last_prompt_tokens"] = prompt
+        print(f"Gemini usage: prompt={prompt} cached={cached} output={output} "
+              f"history~{self.history.history_tokens(self.conversation_history)}")
+
+    def _end_turn(self):
+        self.history.schedule_compaction(self.conversation_history, gemini_slots)
+        if self.state_key:
+            #one write in flight at a time; the next turn's save picks up anything newer
+            if self.save_task is None or self.save_task.done():
+                self.save_task = asyncio.create_task(self.save_state())
+
+    async def load_state(self) -> bool:
+        """Restore a persisted conversation; False if there is none"""
+        if not self.state_key:
+            return False
+        try:
+            state = await state_store.get("voice", self.state_key)
+        except Exception as e:
+            logging.error(f"Failed to load conversation {self.state_key}: {e}")
+            return False
+        if not state:
+            return False
+        self.conversation_history = load_contents(state.get("history"))
+        self.history.summary = state.get("summary", "")
+        print(f"Resumed conversation {self.state_key} ({len(self.conversation_history)} entries)")
+        return True
+
+    async def save_state(self):
+        try:
+            await state_store.set("voice", self.state_key, {
+                "history": dump_contents(self.conversation_history),
+                "summary": self.history.summary,
+            })
+        except Exception as e:
+            logging.error(f"Failed to save conversation {self.state_key}: {e}")
+
+    async def gemini_response(self, user_prompt: str, timeline: Optional[TurnTimeline] = None,
+                              on_tool_calls=None) -> str:
         """Process user prompt with function calling capability"""
         try:
             # Add user message to conversation history
@@ -93,115 +280,190 @@ class GeminiService:
             )
             self.conversation_history.append(user_content)
             
-            # Generate content with tools
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=self.conversation_history,
-                config=types.GenerateContentConfig(
-                    system_instruction=self.system_instruction,
-                    tools=[self.tools]
-                )
+            rounds = 0
+            while True:
+                #tools stay available until the round limit, then the model has to answer
+                allow_tools = rounds < settings.tool_max_rounds
+                config = await self._generate_config(allow_tools)
+                if timeline:
+                    timeline.mark("llm_request")
+                async with gemini_slots:
+                    response = await self.client.aio.models.generate_content(
+                        model=GEMINI_MODEL,
+                        contents=self._prompt_contents(),
+                        config=config
+                    )
+                if timeline:
+                    timeline.mark("llm_first_token")
+                    timeline.mark("llm_last_token", first=False)
+                self._record_usage(response.usage_metadata)
+
+                content = response.candidates[0].content
+                function_calls = [part.function_call for part in content.parts or [] if part.function_call]
+                if not function_calls or not allow_tools:
+                    break
+                rounds += 1
+                results = await self._handle_function_calls(function_calls, user_prompt, timeline, on_tool_calls)
+                # Add model's function call turn and the tool results to history
+                self.conversation_history.append(content)
+                self.conversation_history.append(self._function_response_content(results))
+
+            response_text = response.text or ""
+            model_content = types.Content(
+                role="model",
+                parts=[types.Part.from_text(text=response_text)]
             )
-            
-            function_calls = []
-            for part in response.candidates[0].content.parts:
-                if hasattr(part, 'function_call') and part.function_call:
-                    function_calls.append(part.function_call)
-            
-            if function_calls:
-                # Handle function calls
-                result = await self._handle_function_calls(function_calls, user_prompt)
-                
-                # Add model's function call response to history
-                self.conversation_history.append(response.candidates[0].content)
-                
-                # final response
-                final_response = self._get_final_response(result)
-                return final_response
-            else:
-                
-                model_content = types.Content(
-                    role="model",
-                    parts=[types.Part.from_text(text=response.text)]
-                )
-                self.conversation_history.append(model_content)
-                return response.text
+            self.conversation_history.append(model_content)
+            self._end_turn()
+            return response_text
                 
         except Exception as e:
             logging.error(f"Error during Gemini API call: {e}")
             return "Sumimasen, something went wrong. Let's try that again."
 
-    async def _handle_function_calls(self, function_calls, original_prompt: str) -> dict:
-        """Execute function calls and return results"""
-        results = {}
-        
-        for func_call in function_calls:
-            if func_call.name == "web_search":
-                try:
-                    # Execute web search
-                    search_query = func_call.args.get("query", original_prompt)
-                    search_results = await web_search({"query": search_query})
-                    
-                    results[func_call.name] = {
-                        "success": True,
-                        "result": search_results
-                    }
-                    
-                except Exception as e:
-                    logging.error(f"Error executing web_search: {e}")
-                    results[func_call.name] = {
-                        "success": False,
-                        "error": str(e)
-                    }
-        
-        return results
+    async def gemini_response_stream(self, user_prompt: str, timeline: Optional[TurnTimeline] = None,
+                                     turn: Optional[list] = None, on_tool_calls=None):
+        """Stream the reply as text deltas, running tools first if the model asks for them
 
-    def _get_final_response(self, function_results: dict) -> str:
+        With `turn`, the new history entries are collected there instead of being committed,
+        so a speculative reply can be dropped; commit_turn(turn) keeps it.
+        """
+        deferred = turn is not None
+        turn = [] if turn is None else turn
+        yielded = False
+        reply_text = ""
+        finished = False
         try:
-            function_response_parts = []
-            for func_name, result in function_results.items():
-                if result["success"]:
-                    response_part = types.Part.from_function_response(
-                        name=func_name,
-                        response={"results": result["result"]}
-                    )
-                else:
-                    response_part = types.Part.from_function_response(
-                        name=func_name,
-                        response={"error": result["error"]}
-                    )
-                function_response_parts.append(response_part)
-            
-            # Add function response to conversation
-            function_response_content = types.Content(
+            turn.append(types.Content(
                 role="user",
-                parts=function_response_parts
-            )
-            self.conversation_history.append(function_response_content)
-            
-            # Get final response from model
-            final_response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=self.conversation_history,
-                config=types.GenerateContentConfig(
-                    system_instruction=self.system_instruction
+                parts=[types.Part.from_text(text=user_prompt)]
+            ))
+
+            rounds = 0
+            while True:
+                #tools stay available until the round limit, then the model has to answer
+                allow_tools = rounds < settings.tool_max_rounds
+                function_calls = []
+                reply_text = ""
+                async for part in self._stream_parts(allow_tools=allow_tools, timeline=timeline, turn=turn):
+                    if part.function_call:
+                        function_calls.append(part)
+                    elif part.text:
+                        reply_text += part.text
+                        yielded = True
+                        yield part.text
+                if not function_calls or not allow_tools:
+                    break
+
+                rounds += 1
+                results = await self._handle_function_calls(
+                    [part.function_call for part in function_calls], user_prompt, timeline, on_tool_calls
                 )
+                # Add model's function call turn and the tool results to history
+                model_parts = [types.Part.from_text(text=reply_text)] if reply_text else []
+                turn.append(types.Content(role="model", parts=model_parts + function_calls))
+                turn.append(self._function_response_content(results))
+
+            if reply_text:
+                turn.append(types.Content(
+                    role="model",
+                    parts=[types.Part.from_text(text=reply_text)]
+                ))
+            finished = True
+            if not deferred:
+                self.commit_turn(turn)
+
+        except Exception as e:
+            logging.error(f"Error during Gemini streaming call: {e}")
+            finished = True
+            if not deferred:
+                self.conversation_history.extend(turn)
+            if not yielded:
+                yield "Sumimasen, something went wrong. Let's try that again."
+        finally:
+            if not finished:
+                #interrupted by the user (cancelled, or closed at a yield while the consumer was
+                #speaking): keep what was already said so the history stays coherent
+                if reply_text:
+                    turn.append(types.Content(
+                        role="model",
+                        parts=[types.Part.from_text(text=reply_text)]
+                    ))
+                if not deferred:
+                    self.commit_turn(turn)
+
+    def commit_turn(self, turn: list):
+        """Add one finished turn's entries to the history"""
+        self.conversation_history.extend(turn)
+        self._end_turn()
+
+    async def _stream_parts(self, allow_tools: bool, timeline: Optional[TurnTimeline] = None, turn: list = ()):
+        """Yield response parts as they stream in from Gemini"""
+        config = await self._generate_config(allow_tools)
+        usage = None
+        if timeline:
+            timeline.mark("llm_request")
+        #the slot is held for the whole stream, not just the request
+        async with gemini_slots:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=self._prompt_contents(turn),
+                config=config
             )
-            
-            response_text = final_response.text
-            
-            # Add final model response to history
-            model_content = types.Content(
-                role="model",
-                parts=[types.Part.from_text(text=response_text)]
+            async for chunk in stream:
+                usage = chunk.usage_metadata or usage
+                if not chunk.candidates or not chunk.candidates[0].content:
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    if timeline and part.text:
+                        timeline.mark("llm_first_token")
+                        timeline.mark("llm_last_token", first=False)
+                    yield part
+        self._record_usage(usage)
+
+    async def _handle_function_calls(self, function_calls, original_prompt: str,
+                                     timeline: Optional[TurnTimeline] = None, on_tool_calls=None) -> list:
+        """Run every function call of one model response concurrently; (call, result) in call order"""
+        names = [func_call.name for func_call in function_calls]
+        if timeline:
+            timeline.mark("tool_start")
+        await self._notify_tools(on_tool_calls, names, True)
+        try:
+            results = await tool_registry.run_all(
+                [(func_call.name, dict(func_call.args or {})) for func_call in function_calls],
+                ToolContext(prompt=original_prompt, tavily_key=self.tavily_key),
             )
-            self.conversation_history.append(model_content)
-            
-            return response_text
-            
+        finally:
+            if timeline:
+                timeline.mark("tool_end", first=False)
+            await self._notify_tools(on_tool_calls, names, False)
+        return list(zip(function_calls, results))
+
+    @staticmethod
+    async def _notify_tools(on_tool_calls, names: list, active: bool):
+        """Let the caller tell the user we're looking something up"""
+        if on_tool_calls is None:
+            return
+        try:
+            await on_tool_calls(names, active)
         except Exception as e:
-            logging.error(f"Error getting final response: {e}")
-            return "Gomen ne, I'm having trouble responding. Could we try again?"
+            logging.error(f"Tool status callback failed: {e}")
+
+    def _function_response_content(self, results: list) -> types.Content:
+        """Wrap tool results into the user turn Gemini expects after a function call"""
+        function_response_parts = []
+        for func_call, result in results:
+            if result["success"]:
+                response = {"results": result["result"]}
+            else:
+                response = {"error": result["error"]}
+            function_response_parts.append(types.Part(
+                function_response=types.FunctionResponse(id=func_call.id, name=func_call.name, response=response)
+            ))
+        return types.Content(
+            role="user",
+            parts=function_response_parts
+        )
 
     def get_conversation_history(self) -> list:
         """Get the entire conversation history"""
@@ -211,4 +473,7 @@ class GeminiService:
     def clear_history(self):
         """Clear the conversation history"""
         self.conversation_history = []
+        self.history.clear()
+        if self.state_key:
+            asyncio.create_task(state_store.delete("voice", self.state_key))
         logging.info("Chat history cleared.")
\ No newline at end of file
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+from typing import Any, Callable, List, Optional
+
+from google.genai import types
+
+SUMMARY_PROMPT = """Update the running summary of a voice conversation between a user and Mizuki, an AI assistant.
+Keep names, facts the user shared, preferences, promises and open questions. Drop small talk.
+Write at most {max_words} words of plain text.
+
+Current summary:
+{summary}
+
+Conversation to fold in:
+{transcript}
+"""
+
+
+def estimate_tokens(content: types.Content) -> int:
+    """Cheap token estimate (~4 characters per token) for one history entry"""
+    chars = 0
+    for part in content.parts or []:
+        if part.text:
+            chars += len(part.text)
+        elif part.function_call:
+            chars += len(part.function_call.name or "") + len(json.dumps(part.function_call.args or {}))
+        elif part.function_response:
+            chars += len(json.dumps(part.function_response.response or {}, default=str))
+    return chars // 4 + 4
+
+
+def _is_user_text(content: types.Content) -> bool:
+    return content.role == "user" and any(part.text for part in content.parts or [])
+
+
+def _render(content: types.Content) -> str:
+    speaker = "User" if content.role == "user" else "Mizuki"
+    lines = []
+    for part in content.parts or []:
+        if part.text:
+            lines.append(f"{speaker}: {part.text.strip()}")
+        elif part.function_call:
+            lines.append(f"Mizuki looked up: {json.dumps(part.function_call.args or {})}")
+        elif part.function_response:
+            lines.append(f"Lookup result: {json.dumps(part.function_response.response or {}, default=str)[:500]}")
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    """Keeps the prompt under a token budget: recent turns verbatim, older turns folded into a summary"""
+    def __init__(self, get_client: Callable[[], Any], model: str, token_budget: int, keep_turns: int,
+                 summary_words: int = 150):
+        self.get_client = get_client
+        self.model = model
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summary_words = summary_words
+        self.summary = ""
+        self.compacting: Optional[asyncio.Task] = None
+        self.compactions = 0
+
+    def prompt_contents(self, history: List[types.Content]) -> List[types.Content]:
+        """What actually goes to Gemini: the running summary (if any) followed by the recent window"""
+        if self.history_tokens(history) > self.token_budget:
+            #compaction failed or hasn't finished: still send only the last keep_turns turns
+            history = history[self._cut_index(history):]
+        if not self.summary:
+            return history
+        return [
+            types.Content(role="user", parts=[types.Part.from_text(
+                text=f"(Summary of our earlier conversation: {self.summary})"
+            )]),
+            types.Content(role="model", parts=[types.Part.from_text(text="Hai, I remember.")]),
+        ] + history
+
+    def history_tokens(self, history: List[types.Content]) -> int:
+        return sum(estimate_tokens(content) for content in history) + len(self.summary) // 4
+
+    def schedule_compaction(self, history: List[types.Content], slots: asyncio.Semaphore):
+        """Fold old turns into the summary in the background once the window is over budget"""
+        if self.history_tokens(history) <= self.token_budget:
+            return
+        if self.compacting and not self.compacting.done():
+            return
+        self.compacting = asyncio.create_task(self._compact(history, slots))
+
+    def _cut_index(self, history: List[types.Content]) -> int:
+        """Index where the last keep_turns turns begin; turns start at a user text message"""
+        starts = [index for index, content in enumerate(history) if _is_user_text(content)]
+        if len(starts) <= self.keep_turns:
+            return 0
+        return starts[-self.keep_turns]
+
+    async def _compact(self, history: List[types.Content], slots: asyncio.Semaphore):
+        cut = self._cut_index(history)
+        if cut <= 0:
+            return
+        old = history[:cut]
+        transcript = "\n".join(_render(content) for content in old)
+        try:
+            async with slots:
+                response = await self.get_client().aio.models.generate_content(
+                    model=self.model,
+                    contents=[SUMMARY_PROMPT.format(
+                        max_words=self.summary_words,
+                        summary=self.summary or "(none yet)",
+                        transcript=transcript,
+                    )],
+                    config=types.GenerateContentConfig(max_output_tokens=self.summary_words * 2),
+                )
+            summary = (response.text or "").strip()
+        except Exception as e:
+            logging.error(f"History compaction failed: {e}")
+            return
+        if not summary:
+            return
+
+        #only appends happen while we summarize, so the old prefix is still at the front
+        if len(history) < cut or any(a is not b for a, b in zip(history, old)):
+            return
+        del history[:cut]
+        self.summary = summary
+        self.compactions += 1
+        print(f"Compacted {cut} history entries into summary ({len(summary)} chars)")
+
+    def clear(self):
+        self.summary = ""
+        if self.compacting and not self.compacting.done():
+            self.compacting.cancel()
+        self.compacting = None
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config.config import settings
+from services.state_store import MemoryStateStore, state_store
+
+FINISHED = ("done", "failed")
+
+
+class QueueFull(Exception):
+    """Raised by submit() when max_pending jobs are already waiting"""
+
+
+class Job:
+    """One unit of REST work (a transcription, a chat reply...) and its progress"""
+    def __init__(self, kind: str, run: Callable[["Job"], Awaitable[Any]]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.run = run
+        self.status = "queued" #queued | running | done | failed
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.changed = asyncio.Event() #replaced after every update, so waiters see each one
+        self.done = asyncio.Event()
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 2),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """Bounded worker pool for slow REST requests, kept apart from the realtime /ws path
+
+    Jobs run on a fixed number of worker tasks; at most max_pending wait behind them.
+    Finished jobs are kept for result_ttl. With a shared state store backend every update is
+    also written there (namespace "jobs") so any worker process can answer a status poll; the
+    memory backend is per process anyway, and its LRU is bounded for sessions, so jobs stay
+    only in self.jobs.
+    """
+    def __init__(self, workers: int, max_pending: int, result_ttl: float, sweep_interval: float = 60.0):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.sweep_interval = sweep_interval
+        self.queue: Optional[asyncio.Queue] = None
+        self.jobs: Dict[str, Job] = {} #jobs submitted to this process, dropped result_ttl after finishing
+        self.tasks: List[asyncio.Task] = []
+        self.running = 0
+        self.shared = not isinstance(state_store, MemoryStateStore)
+
+        #metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        if self.tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._sweep_loop()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def submit(self, kind: str, run: Callable[[Job], Awaitable[Any]]) -> Job:
+        """Queue run(job); raises QueueFull instead of waiting when the queue is full"""
+        if self.queue is None:
+            self.start()
+        if self.queue.full():
+            self.rejected += 1
+            raise QueueFull(f"{self.max_pending} jobs already queued")
+        job = Job(kind, run)
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job)
+        self.submitted += 1
+        await self._publish(job)
+        return job
+
+    async def progress(self, job: Job, stage: str, progress: float):
+        """Called by running jobs to report what they are doing"""
+        job.stage = stage
+        job.progress = progress
+        await self._publish(job)
+
+    async def _publish(self, job: Job):
+        changed, job.changed = job.changed, asyncio.Event()
+        changed.set()
+        if not self.shared:
+            return
+        try:
+            await state_store.set("jobs", job.id, job.snapshot(), ttl=self.result_ttl)
+        except Exception as e:
+            logging.error(f"Failed to store job {job.id}: {e}")
+
+    async def _execute(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        self.running += 1
+        await self._publish(job)
+        try:
+            job.result = await job.run(job)
+            job.status = "done"
+            job.progress = 1.0
+            self.completed += 1
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "Cancelled"
+            self.failed += 1
+            raise
+        except Exception as e:
+            logging.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+            self.failed += 1
+        finally:
+            self.running -= 1
+            job.finished_at = time.time()
+            job.done.set()
+            await self._publish(job)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._execute(job)
+            finally:
+                self.queue.task_done()
+
+    def sweep(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.result_ttl:
+                del self.jobs[job_id]
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        if not self.shared:
+            return None
+        #submitted to another worker process, or this one restarted
+        return await state_store.get("jobs", job_id)
+
+    async def events(self, job_id: str, poll_interval: float = 1.0):
+        """Snapshots of a job as it changes, ending once it has finished"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            while True:
+                changed = job.changed
+                yield job.snapshot()
+                if job.status in FINISHED:
+                    return
+                await changed.wait()
+        if not self.shared:
+            return
+        #not ours: follow it through the state store
+        last = None
+        while True:
+            snapshot = await state_store.get("jobs", job_id)
+            if snapshot is None:
+                return
+            if snapshot != last:
+                yield snapshot
+                last = snapshot
+            if snapshot["status"] in FINISHED:
+                return
+            await asyncio.sleep(poll_interval)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queue.qsize() if self.queue else 0,
+            "max_pending": self.max_pending,
+            "retained": len(self.jobs),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+#singleton instance
+job_queue = JobQueue(
+    workers=settings.job_workers,
+    max_pending=settings.job_max_pending,
+    result_ttl=settings.job_result_ttl,
+)
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+#seconds; voice turns live between ~50 ms (cached audio) and tens of seconds (tool calls)
+DEFAULT_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _quote(value) -> str:
+    return f'"{value}"'
+
+
+class Histogram:
+    """Cumulative Prometheus histogram, one series per label value tuple"""
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[tuple, list] = {} #labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, 'le=%s' % _quote(bound))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, 'le=%s' % _quote('+Inf'))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    """Monotonic Prometheus counter, one series per label value tuple"""
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.series: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+turn_stage_seconds = Histogram(
+    "voice_turn_stage_seconds",
+    "Latency of each stage of a /ws voice turn",
+    labelnames=("stage",),
+)
+turns_total = Counter(
+    "voice_turns_total",
+    "Voice turns by how they ended",
+    labelnames=("outcome",),
+)
+loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke a periodic timer",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+speculations_total = Counter(
+    "llm_speculations_total",
+    "Speculative Gemini replies by outcome (hit: final transcript matched, miss: discarded)",
+    labelnames=("outcome",),
+)
+speculation_wasted_tokens_total = Counter(
+    "llm_speculation_wasted_tokens_total",
+    "Estimated tokens spent on discarded speculative replies",
+    labelnames=("kind",),
+)
+_metrics = [turn_stage_seconds, turns_total, loop_lag_seconds, speculations_total, speculation_wasted_tokens_total]
+
+
+class LoopLagMonitor:
+    """Samples event loop lag: how much later than scheduled a short sleep returns"""
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self.task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.last = lag
+            self.max = max(self.max, lag)
+            loop_lag_seconds.observe(lag)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def stats(self) -> dict:
+        return {"last_ms": round(self.last * 1000, 1), "max_ms": round(self.max * 1000, 1)}
+
+
+def process_rss_bytes() -> int:
+    """Resident memory of this worker process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        #no procfs (macOS/Windows): fall back to the peak, which is all getrusage offers
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            return 0
+
+
+#singleton instance
+loop_lag = LoopLagMonitor()
+
+
+def render_metrics() -> str:
+    """Everything registered here, in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+#stage -> (from event, to event)
+TURN_STAGES = {
+    "stt_finalize": ("user_audio_end", "final_transcript"),
+    "llm_first_token": ("llm_request", "llm_first_token"),
+    "llm_total": ("llm_request", "llm_last_token"),
+    "tool": ("tool_start", "tool_end"),
+    "tts_first_chunk": ("llm_first_token", "tts_first_chunk"),
+    "tts_total": ("tts_first_chunk", "tts_last_chunk"),
+    "first_audio": ("user_audio_end", "tts_first_chunk"),
+    "turn": ("user_audio_end", "audio_complete"),
+}
+
+
+class TurnTimeline:
+    """Timestamps (perf_counter) of the milestones of one voice turn
+
+    Every stage of the pipeline marks the events it sees; finish() turns them into stage
+    durations, records the histograms once and hands the report to on_finish.
+    """
+    def __init__(self, turn: int, on_finish: Optional[Callable[[dict], Awaitable]] = None):
+        self.turn = turn
+        self.on_finish = on_finish
+        self.marks: Dict[str, float] = {}
+        self.finished = False
+
+    def mark(self, event: str, at: Optional[float] = None, first: bool = True):
+        """Record an event; by default only its first occurrence counts, first=False keeps the latest"""
+        if first and event in self.marks:
+            return
+        self.marks[event] = at if at is not None else time.perf_counter()
+
+    def stages(self) -> Dict[str, float]:
+        durations = {}
+        for stage, (start, end) in TURN_STAGES.items():
+            if start in self.marks and end in self.marks:
+                durations[stage] = max(0.0, self.marks[end] - self.marks[start])
+        return durations
+
+    def report(self, outcome: str) -> dict:
+        origin = min(self.marks.values()) if self.marks else 0.0
+        return {
+            "turn": self.turn,
+            "outcome": outcome,
+            "stages": {stage: round(seconds * 1000) for stage, seconds in self.stages().items()},
+            "marks": {event: round((at - origin) * 1000) for event, at in sorted(self.marks.items(), key=lambda m: m[1])},
+        }
+
+    async def finish(self, outcome: str = "completed"):
+        """Record this turn once; later calls (e.g. a barge-in after completion) are ignored"""
+        if self.finished:
+            return
+        self.finished = True
+        stages = self.stages()
+        for stage, seconds in stages.items():
+            turn_stage_seconds.observe(seconds, stage)
+        turns_total.inc(outcome)
+        report = self.report(outcome)
+        print(f"Turn {self.turn} {outcome}: " + ", ".join(f"{k}={v}ms" for k, v in report["stages"].items()))
+        if self.on_finish:
+            try:
+                await self.on_finish(report)
+            except Exception as e:
+                logging.error(f"Failed to deliver turn timing: {e}")
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+import websockets
+
+from config.config import settings
+
+
+#(api_key, sample_rate, format) - connections are only shared between identical stream settings
+PoolKey = Tuple[str, int, str]
+
+
+class PoolExhausted(Exception):
+    """Raised by acquire() when no context frees up within acquire_timeout"""
+
+
+class MurfContext:
+    """One turn's view of a shared Murf connection, addressed by context id"""
+    def __init__(self, connection: "MurfConnection", context_id: str):
+        self.connection = connection
+        self.context_id = context_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.released = False
+
+    async def send(self, message: dict):
+        message["context_id"] = self.context_id
+        await self.connection.send(message)
+
+    async def recv(self, timeout: float) -> dict:
+        """Next message Murf sent for this context (raises asyncio.TimeoutError)"""
+        return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+
+    async def clear(self):
+        """Ask Murf to drop any audio still queued for this context"""
+        try:
+            await self.send({"clear": True})
+        except Exception as e:
+            logging.debug(f"Murf clear failed for {self.context_id}: {e}")
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.connection.pool._release(self)
+
+
+class MurfConnection:
+    """A warm stream-input websocket multiplexing several contexts"""
+    def __init__(self, pool: "MurfConnectionPool", key: PoolKey):
+        self.pool = pool
+        self.key = key
+        self.ws = None
+        self.contexts: Dict[str, MurfContext] = {}
+        self.reader_task: Optional[asyncio.Task] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.closed = False
+
+    @property
+    def url(self) -> str:
+        api_key, sample_rate, audio_format = self.key
+        return f"{settings.murf_stream_url}?api_key={api_key}&sample_rate={sample_rate}&channel_type=MONO&format={audio_format}"
+
+    async def open(self):
+        self.ws = await websockets.connect(self.url)
+        self.reader_task = asyncio.create_task(self._read_loop())
+        print("Connected to Murf.ai TTS service")
+
+    async def send(self, message: dict):
+        self.last_used = time.monotonic()
+        await self.ws.send(json.dumps(message))
+
+    async def _read_loop(self):
+        """Route every incoming message to the context it belongs to"""
+        try:
+            async for raw in self.ws:
+                data = json.loads(raw)
+                context = self.contexts.get(data.get("context_id"))
+                if context is None and len(self.contexts) == 1:
+                    #messages without a context id can only belong to the single open context
+                    context = next(iter(self.contexts.values()))
+                if context is not None:
+                    context.queue.put_nowait(data)
+        except websockets.exceptions.ConnectionClosed:
+            print("Murf connection closed unexpectedly")
+        except Exception as e:
+            logging.error(f"Murf reader error: {e}")
+        finally:
+            self.closed = True
+            for context in list(self.contexts.values()):
+                context.queue.put_nowait({"error": "connection closed"})
+
+    async def ping(self, timeout: float) -> bool:
+        try:
+            pong = await self.ws.ping()
+            await asyncio.wait_for(pong, timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        self.closed = True
+        if self.reader_task:
+            self.reader_task.cancel()
+        if self.ws:
+            try:
+                await self.ws.close()
+            except Exception:
+                pass
+
+
+class MurfConnectionPool:
+    """Process-wide pool of warm Murf websockets shared across sessions"""
+    def __init__(self, max_connections: int, contexts_per_connection: int, min_idle: int,
+                 idle_timeout: float, max_age: float, health_interval: float, acquire_timeout: float):
+        self.max_connections = max_connections
+        self.contexts_per_connection = contexts_per_connection
+        self.min_idle = min_idle
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.health_interval = health_interval
+        self.acquire_timeout = acquire_timeout
+
+        self.connections: Dict[PoolKey, List[MurfConnection]] = {}
+        self.opening = 0
+        self.condition = asyncio.Condition()
+        self.health_task: Optional[asyncio.Task] = None
+        self.background: Set[asyncio.Task] = set() #notify and close tasks, held until they finish
+
+        #metrics
+        self.created = 0
+        self.recycled = 0
+        self.evicted = 0
+        self.timeouts = 0
+        self.failed_health_checks = 0
+        self.acquired = 0
+        self.waits = 0
+        self.waiting = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _total_connections(self) -> int:
+        return sum(len(conns) for conns in self.connections.values()) + self.opening
+
+    def _pick(self, key: PoolKey) -> Optional[MurfConnection]:
+        """Least-loaded live connection for this key with a free context slot"""
+        candidates = [
+            conn for conn in self.connections.get(key, [])
+            if not conn.closed and len(conn.contexts) < self.contexts_per_connection
+        ]
+        return min(candidates, key=lambda conn: len(conn.contexts), default=None)
+
+    def _evict_idle(self, key: PoolKey) -> bool:
+        """Free a slot for key by dropping a dead connection or the oldest idle one kept for another key"""
+        candidates = [
+            conn for conns in self.connections.values() for conn in conns
+            if not conn.contexts and (conn.closed or conn.key != key)
+        ]
+        if not candidates:
+            return False
+        #dead sockets first, then the one unused for longest
+        victim = min(candidates, key=lambda conn: (not conn.closed, conn.last_used))
+        connections = self.connections[victim.key]
+        connections.remove(victim)
+        if not connections:
+            self.connections.pop(victim.key, None)
+        self.evicted += 1
+        self._spawn(victim.close())
+        return True
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def _open(self, key: PoolKey) -> MurfConnection:
+        """Open a connection for a slot already reserved via self.opening"""
+        connection = MurfConnection(self, key)
+        try:
+            await connection.open()
+        except BaseException:
+            self.opening -= 1
+            await self._notify()
+            raise
+        self.opening -= 1
+        self.connections.setdefault(key, []).append(connection)
+        self.created += 1
+        return connection
+
+    async def acquire(self, api_key: str, sample_rate: int = 44100, audio_format: str = "WAV") -> MurfContext:
+        """Reserve a context on a warm connection, opening or waiting for one if needed"""
+        key = (api_key, sample_rate, audio_format)
+        started = time.monotonic()
+        waited = False
+        async with self.condition:
+            while True:
+                connection = self._pick(key)
+                if connection is not None:
+                    return self._bind(connection, started, waited)
+                if self._total_connections() < self.max_connections or self._evict_idle(key):
+                    self.opening += 1
+                    break
+                remaining = self.acquire_timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolExhausted(f"No Murf context free after {self.acquire_timeout:g}s")
+                waited = True
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(self.condition.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass #loop once more, then give up
+                finally:
+                    self.waiting -= 1
+
+        #open outside the lock so other sessions aren't held up by our handshake
+        connection = await self._open(key)
+        return self._bind(connection, started, waited)
+
+    def _bind(self, connection: MurfConnection, started: float, waited: bool) -> MurfContext:
+        context = MurfContext(connection, uuid.uuid4().hex)
+        connection.contexts[context.context_id] = context
+        connection.last_used = time.monotonic()
+        self.acquired += 1
+        if waited:
+            wait_ms = (time.monotonic() - started) * 1000
+            self.waits += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        return context
+
+    def _release(self, context: MurfContext):
+        connection = context.connection
+        connection.contexts.pop(context.context_id, None)
+        connection.last_used = time.monotonic()
+        self._spawn(self._notify())
+
+    async def _notify(self):
+        async with self.condition:
+            self.condition.notify_all()
+
+    async def prewarm(self, api_key: str, sample_rate: int, audio_format: str):
+        """Keep min_idle connections open for the stream settings most sessions negotiate"""
+        if not api_key:
+            return
+        key = (api_key, sample_rate, audio_format)
+        while (len([c for c in self.connections.get(key, []) if not c.closed]) < self.min_idle
+               and self._total_connections() < self.max_connections):
+            self.opening += 1
+            try:
+                await self._open(key)
+            except Exception as e:
+                logging.error(f"Failed to prewarm Murf connection: {e}")
+                return
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.health_check()
+            except Exception as e:
+                logging.error(f"Murf pool health check failed: {e}")
+
+    async def health_check(self):
+        """Ping idle sockets, recycle dead, stale or surplus ones"""
+        now = time.monotonic()
+        for key, connections in list(self.connections.items()):
+            idle_kept = 0
+            for connection in list(connections):
+                if connection.contexts:
+                    continue
+                expired = now - connection.created_at > self.max_age
+                surplus = idle_kept >= self.min_idle and now - connection.last_used > self.idle_timeout
+                healthy = not connection.closed and not expired and not surplus
+                if healthy and not await connection.ping(timeout=5.0):
+                    self.failed_health_checks += 1
+                    healthy = False
+                if healthy:
+                    idle_kept += 1
+                    continue
+                if connection not in connections:
+                    continue #evicted by acquire() while we were pinging
+                connections.remove(connection)
+                self.recycled += 1
+                await connection.close()
+            if not connections and self.connections.get(key) is connections:
+                self.connections.pop(key, None)
+        await self._notify()
+
+    def start(self):
+        if self.health_task is None:
+            self.health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self.health_task:
+            self.health_task.cancel()
+            self.health_task = None
+        for connections in self.connections.values():
+            for connection in connections:
+                await connection.close()
+        self.connections.clear()
+        for task in list(self.background):
+            task.cancel()
+
+    def stats(self) -> dict:
+        connections = [conn for conns in self.connections.values() for conn in conns]
+        return {
+            "connections": len(connections),
+            "idle_connections": len([conn for conn in connections if not conn.contexts]),
+            "active_contexts": sum(len(conn.contexts) for conn in connections),
+            "opening": self.opening,
+            "waiting": self.waiting,
+            "created": self.created,
+            "recycled": self.recycled,
+            "evicted": self.evicted,
+            "timeouts": self.timeouts,
+            "failed_health_checks": self.failed_health_checks,
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "avg_wait_ms": round(self.total_wait_ms / self.waits, 2) if self.waits else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+
+#singleton instance
+murf_pool = MurfConnectionPool(
+    max_connections=settings.murf_pool_max_connections,
+    contexts_per_connection=settings.murf_pool_contexts_per_connection,
+    min_idle=settings.murf_pool_min_idle,
+    idle_timeout=settings.murf_pool_idle_timeout,
+    max_age=settings.murf_pool_max_age,
+    health_interval=settings.murf_pool_health_interval,
+    acquire_timeout=settings.murf_pool_acquire_timeout,
+)
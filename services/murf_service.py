@@ -1,144 +1,435 @@
 import os
-from murf import Murf
 from dotenv import load_dotenv
 import asyncio
-import websockets
+import time
 import json
 import base64
 import logging
+from collections import deque
 from typing import Optional
-from config.config import api_keys
+from config.config import api_keys, settings
+from services.murf_pool import murf_pool, MurfContext
+from services.audio_frames import PCMFrameEncoder
+from services.audio_codecs import AUDIO_PROFILES, AudioProfile, UnsupportedStream, pack_packets
+from services.tts_cache import tts_cache
+from services.client_registry import client_registry
+from services.metrics import TurnTimeline
 
 load_dotenv()
 MURF_API_KEY = api_keys.murf
 
 
 # non-streaming murf service 
-async def murf_tts(text: str) -> dict:
-   
-    client = Murf(
-        api_key=MURF_API_KEY
-    )
+REST_VOICE_ID = "en-US-Ken"
+REST_SAMPLE_RATE = 44100
 
+async def murf_tts(text: str, voice_id: str = REST_VOICE_ID, style: str = "", rate: int = 0, pitch: int = 0,
+                   sample_rate: int = REST_SAMPLE_RATE) -> dict:
+    """Synthesize a whole text once; repeated texts are served from the audio cache"""
     if not text or not text.strip():
         return {"error": "Missing text"}
-    res = client.text_to_speech.generate(
+
+    key = tts_cache.make_key(text, voice_id, style, rate, pitch, 1, sample_rate, "WAV", "file")
+    if await tts_cache.contains(key):
+        return {"audio_file": f"/tts/cache/{key}", "cached": True}
+
+    #only send the voice settings that differ from Murf's defaults
+    options = {"style": style, "rate": rate, "pitch": pitch}
+    client = client_registry.get("murf", api_keys.murf)
+    res = await client.text_to_speech.generate(
         text=text,
-        voice_id="en-US-Ken"
+        voice_id=voice_id,
+        format="WAV",
+        sample_rate=sample_rate,
+        encode_as_base_64=tts_cache.enabled,
+        **{name: value for name, value in options.items() if value},
     )
 
+    encoded_audio = getattr(res, "encoded_audio", None)
+    if encoded_audio:
+        await tts_cache.put(key, base64.b64decode(encoded_audio))
+        return {"audio_file": f"/tts/cache/{key}", "cached": False}
+
     if not res.audio_file:
         return {"error": "No audio file generated"}
 
-    return {"audio_file": res.audio_file}
+    return {"audio_file": res.audio_file, "cached": False}
+
+
+async def murf_tts_batch(items: list, concurrency: int):
+    """Synthesize many texts at most `concurrency` at a time, yielding each result as it completes
+
+    items are dicts of murf_tts() arguments plus an optional "id"; results carry the item's
+    index, how long it waited for a slot and how long synthesis took.
+    """
+    slots = asyncio.Semaphore(max(1, concurrency))
+    submitted = time.perf_counter()
+
+    async def synthesize(index: int, item: dict) -> dict:
+        item = dict(item)
+        result = {"index": index, "id": item.pop("id", None)}
+        async with slots:
+            started = time.perf_counter()
+            result["wait_ms"] = round((started - submitted) * 1000)
+            try:
+                result.update(await murf_tts(**item))
+            except Exception as e:
+                logging.error(f"Batch TTS item {index} failed: {e}")
+                result["error"] = str(e)
+            result["ms"] = round((time.perf_counter() - started) * 1000)
+        result["status"] = "error" if "error" in result else "ok"
+        return result
+
+    tasks = [asyncio.create_task(synthesize(index, item)) for index, item in enumerate(items)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        #the client went away: stop synthesizing what it will never read
+        for task in tasks:
+            task.cancel()
 
 
-WS_URL = "wss://api.murf.ai/v1/speech/stream-input"
+VOICE_CONFIG = {
+    "voiceId": "en-US-amara",
+    "style": "Conversational",
+    "rate": 0,
+    "pitch": 0,
+    "variation": 1
+}
+
+#how much cached audio goes into one binary frame when replaying
+REPLAY_CHUNK_SECONDS = 0.2
+#same for cached compressed streams, in bytes fed to the packetizer
+REPLAY_CHUNK_BYTES = 4096
+
+
+class _Segment:
+    """One sentence of a bot turn, backed by cached audio or a live Murf context"""
+    def __init__(self, text: str, key: str, profile: AudioProfile, audio=None,
+                 context: Optional[MurfContext] = None):
+        self.text = text
+        self.key = key
+        self.profile = profile
+        self.audio = audio
+        self.context = context
+
 
 class MurfService:
-    def __init__(self, websocket, api_key: str = MURF_API_KEY):
+    def __init__(self, websocket, api_key: str = MURF_API_KEY, profile: Optional[AudioProfile] = None):
         self.websocket = websocket
         self.api_key = api_key
-        self.ws_url = WS_URL
-        self.connection: Optional[websockets.WebSocketClientProtocol] = None
-        self.is_connected = False
+        #output format negotiated with the browser (raw PCM unless it asked for less)
+        self.profile = profile or AUDIO_PROFILES["pcm44"]
+        self.sample_rate = self.profile.sample_rate
+        self.audio_format = self.profile.murf_format
+        self.bytes_sent = 0
+        #texts of the current bot turn, None marks the end of the turn
+        self.segments: Optional[asyncio.Queue] = None
+        #segments being synthesized ahead of the one currently playing
+        self.window: deque = deque()
+        self.live_contexts = set()
+        #decodes Murf's base64 WAV once and frames raw PCM16 for the browser
+        self.frame_encoder = PCMFrameEncoder(self.sample_rate)
+        #estimated moment the browser finishes playing what we've sent
+        self.playback_until = 0.0
+        #last jitter-buffer report from the browser's playback engine
+        self.client_playback: dict = {}
         self.receive_task: Optional[asyncio.Task] = None
-        
-    async def connect(self):
-        """Connect to the Murf WebSocket API."""
+        #timeline of the turn currently being relayed
+        self.relay_timeline: Optional[TurnTimeline] = None
+        #cache key -> task synthesizing a sentence ahead of its turn (speculative replies)
+        self.prefetching: dict = {}
+
+    @property
+    def is_connected(self) -> bool:
+        return self.segments is not None
+
+    @property
+    def is_speaking(self) -> bool:
+        relaying = self.receive_task is not None and not self.receive_task.done()
+        return relaying or time.monotonic() < self.playback_until
+
+    def update_client_playback(self, stats: dict):
+        """Browser-reported buffered audio replaces our own estimate of when playback ends"""
+        self.client_playback = {
+            "buffered_ms": int(stats.get("bufferedMs") or 0),
+            "target_ms": int(stats.get("targetMs") or 0),
+            "jitter_ms": int(stats.get("jitterMs") or 0),
+            "underruns": int(stats.get("underruns") or 0),
+        }
+        remaining = time.monotonic() + self.client_playback["buffered_ms"] / 1000
+        relaying = self.receive_task is not None and not self.receive_task.done()
+        #while relaying, frames may still be in flight to the browser, so only ever extend
+        self.playback_until = max(self.playback_until, remaining) if relaying else remaining
+
+    def _cache_key(self, text: str) -> str:
+        return tts_cache.make_key(
+            text, VOICE_CONFIG["voiceId"], VOICE_CONFIG["style"], VOICE_CONFIG["rate"],
+            VOICE_CONFIG["pitch"], VOICE_CONFIG["variation"], self.sample_rate, self.audio_format, "stream",
+        )
+
+    async def connect(self, timeline: Optional[TurnTimeline] = None):
+        """Open a new bot turn; its audio is relayed in order by a background task."""
+        if self.segments is not None:
+            return
+        self.segments = asyncio.Queue()
+        #a turn never starts playing before the previous one has finished relaying
+        self.receive_task = asyncio.create_task(
+            self._receive_audio_stream(self.segments, self.receive_task, timeline)
+        )
+
+    async def synthesize_speech(self, text:str, timeline: Optional[TurnTimeline] = None):
+        """Convert text to speech and return base64 audio"""
+        await self.send_text(text, timeline)
+        await self.end_turn()
+
+    async def send_text(self, text: str, timeline: Optional[TurnTimeline] = None):
+        """Queue one segment of text for this turn; audio is relayed as it arrives"""
+        await self.connect(timeline)
+        self.segments.put_nowait(text)
+        print("Text queued for Murf.ai")
+
+    async def end_turn(self):
+        """No more text is coming for this turn"""
+        if self.segments is not None:
+            self.segments.put_nowait(None)
+            self.segments = None
+
+    def prefetch(self, text: str) -> Optional[str]:
+        """Synthesize a sentence into the TTS cache without playing it, so its turn starts from cache
+
+        Returns the cache key, which cancel_prefetch() takes if the sentence turns out not to be needed.
+        """
+        if not tts_cache.enabled:
+            return None
+        key = self._cache_key(text)
+        if key not in self.prefetching:
+            self.prefetching[key] = asyncio.create_task(self._prefetch(key, text))
+        return key
+
+    def cancel_prefetch(self, key: str):
+        """Stop synthesizing a prefetched sentence; its Murf context is cleared and released"""
+        task = self.prefetching.get(key)
+        if task is not None:
+            task.cancel()
+
+    async def _prefetch(self, key: str, text: str):
         try:
-            if self.is_connected and self.connection:
+            if await tts_cache.contains(key):
                 return
-            self.connection = await websockets.connect(
-                f"{self.ws_url}?api_key={self.api_key}&sample_rate=44100&channel_type=MONO&format=WAV"
-            )
-            self.is_connected = True
-            print("Connected to Murf.ai TTS service")
-            
-            #send voice configuration
-            voice_config = {
-                "voice_config": {
-                    "voiceId": "en-US-amara",  
-                    "style": "Conversational",
-                    "rate": 0,
-                    "pitch": 0,
-                    "variation": 1
-                }
-            }
-            await self.connection.send(json.dumps(voice_config))
-            self.receive_task = asyncio.create_task(self._receive_audio_stream())
-        except Exception as e:
-            logging.error(f"Failed to connect to Murf.ai: {e}")
+            profile = self.profile
+            decoder = None if profile.packetized else PCMFrameEncoder(profile.sample_rate)
+            context = await murf_pool.acquire(self.api_key, profile.sample_rate, profile.murf_format)
+            captured = bytearray()
+            try:
+                await context.send({'text': text, 'end': True, 'voice_config': VOICE_CONFIG})
+                while True:
+                    data = await context.recv(timeout=30.0)
+                    if "error" in data:
+                        logging.error(f"Murf prefetch error: {data['error']}")
+                        return
+                    if data.get("audio"):
+                        captured += decoder.decode(data["audio"]) if decoder else base64.b64decode(data["audio"])
+                    if data.get("final"):
+                        break
+            except asyncio.CancelledError:
+                await context.clear()
+                raise
+            finally:
+                context.release()
+            await tts_cache.put(key, captured)
+        except asyncio.CancelledError:
             raise
-        
-    async def synthesize_speech(self, text:str):
-        """Convert text to speech and return base64 audio"""
-        if not self.is_connected or not self.connection:
-            await self.connect()    
-            
+        except Exception as e:
+            logging.error(f"Murf prefetch failed: {e}")
+        finally:
+            self.prefetching.pop(key, None)
+
+    async def _start_segment(self, text: str) -> _Segment:
+        """Serve the segment from cache, or start synthesizing it on a pooled context"""
+        profile = self.profile
+        key = self._cache_key(text)
+        pending = self.prefetching.get(key)
+        if pending is not None:
+            #already being synthesized for this turn: wait for it rather than paying twice
+            await asyncio.wait([pending])
+        audio = await tts_cache.get(key)
+        if audio is not None:
+            return _Segment(text, key, profile, audio=audio)
+
+        context = await murf_pool.acquire(self.api_key, self.sample_rate, self.audio_format)
+        self.live_contexts.add(context)
         try:
-            #send text to be synthesized
-            text_message = {
+            #voice configuration travels with the first message of every context
+            await context.send({
                 'text': text,
-                'end': False,
-                 
-                
-            }
-            await self.connection.send(json.dumps(text_message))
-            print("Text sent to Murf.ai")
-        
-        except Exception as e:
-            logging.error(f"Failed to synthesize speech: {e}")
-            self.is_connected = False
-            if self.connection:
-                await self.connection.close()
-                self.connection = None
+                'end': True,
+                'voice_config': VOICE_CONFIG,
+            })
+        except Exception:
+            self._release(context)
             raise
-        
-    async def _receive_audio_stream(self):
-        """Handle audio streaming in background"""
+        return _Segment(text, key, profile, context=context)
+
+    def _release(self, context: MurfContext):
+        self.live_contexts.discard(context)
+        context.release()
+
+    async def _receive_audio_stream(self, segments: asyncio.Queue, previous: Optional[asyncio.Task],
+                                    timeline: Optional[TurnTimeline] = None):
+        """Relay this turn's segments to the browser in order, synthesizing a few ahead"""
+        if previous and not previous.done():
+            await asyncio.wait([previous])
+        self.relay_timeline = timeline
+
+        window = self.window = deque()
+        input_done = False
         try:
-            first_chunk = True
-            while self.is_connected and self.connection:
-                try:
-                    response = await asyncio.wait_for(self.connection.recv(), timeout=30.0)
-                    data = json.loads(response)
-                    
-                    if "audio" in data:
-                        audio_data = data["audio"]
-                        await self.websocket.send_json({
-                            "status": "audio_chunk",
-                            "audio_base64": audio_data,
-                            "is_complete": False
-                        })
-                    
-                    if data.get("final"):
-                        await self.websocket.send_json({
-                            "status": "audio_complete"
-                        })
-                        await self.websocket.send_json({
-                            "status": "bot_speaking",
-                            "active": False
-                        })
-                        print("Audio synthesis completed")
+            while True:
+                while not input_done and len(window) < settings.murf_segment_lookahead:
+                    if window and segments.empty():
                         break
-                        
-                except asyncio.TimeoutError:
-                    # Keep connection alive
-                    continue
-                except websockets.exceptions.ConnectionClosed:
-                    print("Murf connection closed unexpectedly")
+                    text = await segments.get()
+                    if text is None:
+                        input_done = True
+                        break
+                    window.append(asyncio.create_task(self._start_segment(text)))
+                if not window:
                     break
-                    
+
+                try:
+                    segment = await window.popleft()
+                except Exception as e:
+                    logging.error(f"Failed to synthesize speech: {e}")
+                    continue
+                await self._play_segment(segment)
+
+            await self.websocket.send_json({
+                "status": "audio_complete"
+            })
+            await self.websocket.send_json({
+                "status": "bot_speaking",
+                "active": False
+            })
+            print("Audio synthesis completed")
+            if timeline:
+                timeline.mark("audio_complete")
+                await timeline.finish()
+
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logging.error(f"Audio streaming error: {e}")
+            if timeline:
+                await timeline.finish("failed")
         finally:
-            self.is_connected = False       
-        
-    async def close(self):
-        """Close the WebSocket connection"""
-        self.is_connected = False
-        
+            self.relay_timeline = None
+            for task in window:
+                task.cancel()
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    tts_cache.release(task.result().audio) #synthesized ahead but never played
+
+    def _downgrade(self, reason: str):
+        """The negotiated codec isn't working out; fall back to plain PCM for the rest of the session"""
+        logging.error(f"TTS format {self.profile.name} failed ({reason}); falling back to pcm24")
+        self.profile = AUDIO_PROFILES["pcm24"]
+        self.sample_rate = self.profile.sample_rate
+        self.audio_format = self.profile.murf_format
+        self.frame_encoder = PCMFrameEncoder(self.sample_rate)
+
+    async def _play_segment(self, segment: _Segment):
+        self.frame_encoder.reset()
+        #compressed streams are cut into whole packets; each segment is its own stream
+        profile = segment.profile
+        packetizer = profile.new_packetizer()
+        if segment.audio is not None:
+            try:
+                if packetizer:
+                    for offset in range(0, len(segment.audio), REPLAY_CHUNK_BYTES):
+                        await self._send_packets(packetizer.feed(segment.audio[offset:offset + REPLAY_CHUNK_BYTES]), profile)
+                    return
+                chunk_bytes = int(self.frame_encoder.sample_rate * REPLAY_CHUNK_SECONDS) * 2
+                for offset in range(0, len(segment.audio), chunk_bytes):
+                    await self._send_pcm(segment.audio[offset:offset + chunk_bytes])
+                return
+            finally:
+                tts_cache.release(segment.audio)
+
+        context = segment.context
+        captured = bytearray()
+        complete = False
+        try:
+            while True:
+                try:
+                    data = await context.recv(timeout=30.0)
+                except asyncio.TimeoutError:
+                    logging.error("Murf segment timed out")
+                    break
+
+                if "error" in data:
+                    logging.error(f"Murf stream error: {data['error']}")
+                    break
+
+                if data.get("audio") and packetizer:
+                    encoded = base64.b64decode(data["audio"])
+                    captured += encoded
+                    await self._send_packets(packetizer.feed(encoded), profile)
+                elif data.get("audio"):
+                    pcm = self.frame_encoder.decode(data["audio"])
+                    if pcm:
+                        captured += pcm
+                        await self._send_pcm(pcm)
+
+                if data.get("final"):
+                    complete = True
+                    break
+        except asyncio.CancelledError:
+            #barge-in: stop Murf from synthesizing the rest of this segment
+            await context.clear()
+            raise
+        except UnsupportedStream as e:
+            await context.clear()
+            if self.profile is profile:
+                self._downgrade(str(e))
+        finally:
+            #hand the context back so the pooled connection can serve the next segment
+            self._release(context)
+
+        if complete:
+            await tts_cache.put(segment.key, captured)
+
+    def _mark_chunk(self):
+        if self.relay_timeline:
+            self.relay_timeline.mark("tts_first_chunk")
+            self.relay_timeline.mark("tts_last_chunk", first=False)
+
+    async def _send_pcm(self, pcm: bytes):
+        frame = self.frame_encoder.frame(pcm)
+        await self.websocket.send_bytes(frame)
+        self._mark_chunk()
+        self.bytes_sent += len(frame)
+        duration = len(pcm) / 2 / self.frame_encoder.sample_rate
+        self.playback_until = max(self.playback_until, time.monotonic()) + duration
+
+    async def _send_packets(self, packets: list, profile: AudioProfile):
+        if not packets:
+            return
+        frame = self.frame_encoder.packet_frame(
+            pack_packets(packets), profile.frame_format, profile.frame_rate
+        )
+        await self.websocket.send_bytes(frame)
+        self._mark_chunk()
+        self.bytes_sent += len(frame)
+        duration = sum(seconds for _, seconds in packets)
+        self.playback_until = max(self.playback_until, time.monotonic()) + duration
+
+    def stats(self) -> dict:
+        return {"format": self.profile.name, "bytes_sent": self.bytes_sent, **self.client_playback}
+
+    async def abort(self):
+        """Drop the rest of the current turn: stop relaying and clear Murf's queue"""
+        self.segments = None
         if self.receive_task:
             self.receive_task.cancel()
             try:
@@ -146,8 +437,16 @@ class MurfService:
             except asyncio.CancelledError:
                 pass
             self.receive_task = None
-            
-        if self.connection:
-            await self.connection.close()
-            self.connection = None
-            print("Murf.ai connection closed")        
\ No newline at end of file
+
+        for task in list(self.window) + list(self.prefetching.values()):
+            task.cancel()
+        self.window = deque()
+        for context in list(self.live_contexts):
+            await context.clear()
+            self._release(context)
+        self.playback_until = 0.0
+
+    async def close(self):
+        """Release this session's contexts; the pooled connections stay warm"""
+        await self.abort()
+        print("Murf.ai contexts released")
@@ -0,0 +1,179 @@
+import asyncio
+import inspect
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+def estimate_size(obj: Any, max_depth: int = 8) -> int:
+    """Rough deep size in bytes of plain containers, strings and pydantic/regular objects"""
+    seen = set()
+
+    def walk(value, depth):
+        if id(value) in seen or depth > max_depth:
+            return 0
+        seen.add(id(value))
+        size = sys.getsizeof(value)
+        if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+            return size
+        if isinstance(value, dict):
+            return size + sum(walk(k, depth + 1) + walk(v, depth + 1) for k, v in value.items())
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return size + sum(walk(item, depth + 1) for item in value)
+        if hasattr(value, "__dict__"):
+            return size + walk(vars(value), depth + 1)
+        return size
+
+    return walk(obj, 0)
+
+
+class SessionLimitReached(Exception):
+    """Raised by add() when every slot holds a live session that may not be evicted"""
+
+
+class _Entry:
+    __slots__ = ("session", "created_at", "last_used")
+
+    def __init__(self, session):
+        self.session = session
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class SessionManager:
+    """Bounded registry of live sessions with idle expiry and LRU eviction
+
+    When full, add() evicts the least recently used session that is idle for at least
+    evict_after seconds or that is_live reports as gone; if there is none it refuses the
+    new session rather than cut off one in use.
+    """
+    def __init__(self, name: str, max_sessions: int, idle_ttl: float, sweep_interval: float = 30.0,
+                 on_evict: Optional[Callable[[str, Any], Any]] = None,
+                 sizer: Callable[[Any], int] = estimate_size,
+                 evict_after: float = 0.0, is_live: Optional[Callable[[Any], bool]] = None):
+        self.name = name
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.on_evict = on_evict #called with (session_id, session); may be a coroutine
+        self.evict_after = evict_after
+        self.is_live = is_live
+        self.sizer = sizer
+        self.sessions: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.sweep_task: Optional[asyncio.Task] = None
+
+        #metrics
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self.rejected = 0
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.sessions
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def get(self, session_id: str):
+        entry = self.sessions.get(session_id)
+        if entry is None:
+            return None
+        self.touch(session_id)
+        return entry.session
+
+    def get_or_create(self, session_id: str, factory: Callable[[], Any]):
+        session = self.get(session_id)
+        if session is None:
+            session = factory()
+            self.add(session_id, session)
+        return session
+
+    def add(self, session_id: str, session: Any):
+        """Register a session, making room if needed; raises SessionLimitReached when full"""
+        self.sessions.pop(session_id, None)
+        while len(self.sessions) >= self.max_sessions:
+            victim_id = self._evictable()
+            if victim_id is None:
+                self.rejected += 1
+                raise SessionLimitReached(f"{self.max_sessions} {self.name} sessions in use")
+            self.evicted_lru += 1
+            self._evict(victim_id)
+        self.sessions[session_id] = _Entry(session)
+        self.created += 1
+
+    def _evictable(self) -> Optional[str]:
+        """Least recently used session that is idle long enough or no longer connected"""
+        cutoff = time.monotonic() - self.evict_after
+        for session_id, entry in self.sessions.items():
+            if entry.last_used <= cutoff:
+                return session_id
+            if self.is_live is not None and not self.is_live(entry.session):
+                return session_id
+        return None
+
+    def touch(self, session_id: str):
+        entry = self.sessions.get(session_id)
+        if entry is not None:
+            entry.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+
+    def remove(self, session_id: str):
+        return self.sessions.pop(session_id, None)
+
+    def _evict(self, session_id: str):
+        entry = self.sessions.pop(session_id, None)
+        if entry is None:
+            return
+        print(f"Evicting {self.name} session {session_id}")
+        if self.on_evict is None:
+            return
+        try:
+            result = self.on_evict(session_id, entry.session)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+        except Exception as e:
+            logging.error(f"Error evicting {self.name} session {session_id}: {e}")
+
+    def sweep(self):
+        """Evict every session idle for longer than idle_ttl"""
+        cutoff = time.monotonic() - self.idle_ttl
+        #entries are kept in last-used order, so stop at the first fresh one
+        while self.sessions:
+            session_id, entry = next(iter(self.sessions.items()))
+            if entry.last_used > cutoff:
+                break
+            self.evicted_idle += 1
+            self._evict(session_id)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    def start(self):
+        if self.sweep_task is None:
+            self.sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self.sweep_task:
+            self.sweep_task.cancel()
+            self.sweep_task = None
+
+    def stats(self) -> dict:
+        estimated = 0
+        for entry in list(self.sessions.values()):
+            try:
+                estimated += self.sizer(entry.session)
+            except Exception:
+                pass
+        return {
+            "live_sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "created": self.created,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru,
+            "rejected": self.rejected,
+            "estimated_bytes": estimated,
+        }
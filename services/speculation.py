@@ -0,0 +1,129 @@
+import asyncio
+import re
+from typing import List
+
+from services.metrics import TurnTimeline, speculations_total, speculation_wasted_tokens_total
+from services.text_segmenter import SentenceSegmenter
+
+
+def normalize_transcript(text: str) -> str:
+    """Formatting (case, punctuation) doesn't change what the user said"""
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+
+class Speculation:
+    """A Gemini reply started from a stable partial transcript, held back until the final one confirms it
+
+    Deltas are buffered while nothing is committed to the history; a hit replays them
+    (and whatever is still streaming) through stream(), a miss cancels the request and
+    any TTS prefetch it started.
+    """
+    def __init__(self, text: str, gemini_service, murf_service=None):
+        self.text = text
+        self.key = normalize_transcript(text)
+        self.final_transcript = text
+        self.gemini_service = gemini_service
+        self.turn: list = [] #history entries, committed only on a hit
+        self.deltas: List[str] = []
+        self.done = False
+        self.changed = asyncio.Event()
+        self.timeline = TurnTimeline(0) #adopted as the turn's timeline on a hit
+        self.tool_listener = None #tool status goes to the user only once the reply is confirmed
+        self.murf_service = murf_service
+        self.prefetched: List[str] = [] #TTS cache keys being synthesized for this reply
+        #prompt size at start, for the wasted-token estimate of a miss
+        self.prompt_tokens = gemini_service.history.history_tokens(gemini_service.conversation_history) + len(text) // 4
+        self.task = asyncio.create_task(self._run(murf_service))
+
+    async def _run(self, murf_service):
+        #optionally start synthesizing the first sentence too; it lands in the TTS cache, not the speaker
+        segmenter = SentenceSegmenter() if murf_service else None
+        try:
+            async for delta in self.gemini_service.gemini_response_stream(
+                    self.text, self.timeline, turn=self.turn, on_tool_calls=self._on_tool_calls):
+                self.deltas.append(delta)
+                self.changed.set()
+                if segmenter:
+                    segments = segmenter.feed(delta)
+                    if segments:
+                        key = murf_service.prefetch(segments[0])
+                        if key:
+                            self.prefetched.append(key)
+                        segmenter = None
+        finally:
+            self.done = True
+            self.changed.set()
+
+    async def _on_tool_calls(self, names: list, active: bool):
+        if self.tool_listener:
+            await self.tool_listener(names, active)
+
+    def matches(self, transcript: str) -> bool:
+        return self.key == normalize_transcript(transcript)
+
+    async def stream(self):
+        """Every delta so far, then the rest as it arrives"""
+        index = 0
+        while True:
+            while index < len(self.deltas):
+                yield self.deltas[index]
+                index += 1
+            if self.done:
+                return
+            self.changed.clear()
+            if index < len(self.deltas) or self.done:
+                continue
+            await self.changed.wait()
+
+    def adopt(self, transcript: str, timeline: TurnTimeline, tool_listener=None) -> TurnTimeline:
+        """The final transcript matched: this becomes the turn's reply
+
+        Returns the timeline to use for the turn: ours, which already holds the LLM marks
+        (they predate the final transcript) and keeps receiving them, plus the turn's own.
+        """
+        self.final_transcript = transcript
+        speculations_total.inc("hit")
+        self.tool_listener = tool_listener
+        self.timeline.marks.update(timeline.marks)
+        self.timeline.turn = timeline.turn
+        self.timeline.on_finish = timeline.on_finish
+        return self.timeline
+
+    async def finish(self):
+        """Stop generating if still running (barge-in), then keep the reply in the history"""
+        if not self.done:
+            self.task.cancel()
+        try:
+            await self.task
+        except (asyncio.CancelledError, Exception):
+            pass
+        if self.turn and self.turn[0].role == "user":
+            #record what the user finally said, not the partial we speculated on
+            self.turn[0].parts[0].text = self.final_transcript
+        self.gemini_service.commit_turn(self.turn)
+
+    async def discard(self, outcome: str = "miss"):
+        """Cancel the request and its TTS prefetch, and count what it cost"""
+        if not self.done:
+            self.task.cancel()
+        try:
+            await self.task
+        except (asyncio.CancelledError, Exception):
+            pass
+        for key in self.prefetched:
+            self.murf_service.cancel_prefetch(key)
+        speculations_total.inc(outcome)
+        speculation_wasted_tokens_total.inc("prompt", amount=self.prompt_tokens)
+        speculation_wasted_tokens_total.inc("output", amount=len("".join(self.deltas)) // 4)
+
+
+def speculation_stats() -> dict:
+    hits = speculations_total.series.get(("hit",), 0)
+    misses = speculations_total.series.get(("miss",), 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        "wasted_prompt_tokens": speculation_wasted_tokens_total.series.get(("prompt",), 0),
+        "wasted_output_tokens": speculation_wasted_tokens_total.series.get(("output",), 0),
+    }
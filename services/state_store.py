@@ -0,0 +1,201 @@
+import asyncio
+from abc import ABC, abstractmethod
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config.config import settings
+
+
+class StateStore(ABC):
+    """Key/value store for conversation state shared by every worker: JSON values per (namespace, key)"""
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: dict, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str):
+        ...
+
+    def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryStateStore(StateStore):
+    """Per-process store with idle expiry and LRU bounds; only correct for a single worker
+
+    Expired entries are dropped when read and by a background purge every purge_interval,
+    so abandoned sessions don't hold memory until the LRU bound pushes them out.
+    """
+    def __init__(self, max_entries: int, ttl: float, purge_interval: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict() #(namespace, key) -> (expires_at, json)
+        self.purge_task: Optional[asyncio.Task] = None
+        self.evicted = 0
+        self.expired = 0
+
+    async def get(self, namespace: str, key: str) -> Optional[dict]:
+        entry = self.entries.get((namespace, key))
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[(namespace, key)]
+            return None
+        self.entries.move_to_end((namespace, key))
+        #stored serialized so callers never share mutable state, same as the SQLite backend
+        return json.loads(entry[1])
+
+    async def set(self, namespace: str, key: str, value: dict, ttl: Optional[float] = None):
+        self.entries[(namespace, key)] = (time.monotonic() + (ttl or self.ttl), json.dumps(value))
+        self.entries.move_to_end((namespace, key))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    async def delete(self, namespace: str, key: str):
+        self.entries.pop((namespace, key), None)
+
+    def purge(self) -> int:
+        """Drop every expired entry; entries are in LRU order, not expiry order, so scan them all"""
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self.entries.items() if expires_at < now]
+        for key in expired:
+            del self.entries[key]
+        self.expired += len(expired)
+        return len(expired)
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                self.purge()
+            except Exception as e:
+                logging.error(f"State store purge failed: {e}")
+
+    def start(self):
+        if self.purge_task is None:
+            self.purge_task = asyncio.create_task(self._purge_loop())
+
+    async def close(self):
+        if self.purge_task:
+            self.purge_task.cancel()
+            self.purge_task = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "bytes": sum(len(value) for _, value in self.entries.values()),
+        }
+
+
+class SQLiteStateStore(StateStore):
+    """SQLite-backed store (WAL mode) that several workers on one host can share"""
+    def __init__(self, path: str, ttl: float, purge_interval: float = 300.0):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.last_purge = 0.0
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            self.db.commit()
+
+        #metrics
+        self.reads = 0
+        self.writes = 0
+
+    def _get(self, namespace: str, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, namespace: str, key: str, value: str, expires_at: float):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (namespace, key, value, expires_at),
+            )
+            if time.time() - self.last_purge > self.purge_interval:
+                self.last_purge = time.time()
+                self.db.execute("DELETE FROM state WHERE expires_at <= ?", (self.last_purge,))
+            self.db.commit()
+
+    def _delete(self, namespace: str, key: str):
+        with self.lock:
+            self.db.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+            self.db.commit()
+
+    async def get(self, namespace: str, key: str) -> Optional[dict]:
+        self.reads += 1
+        value = await asyncio.to_thread(self._get, namespace, key)
+        return json.loads(value) if value else None
+
+    async def set(self, namespace: str, key: str, value: dict, ttl: Optional[float] = None):
+        self.writes += 1
+        await asyncio.to_thread(self._set, namespace, key, json.dumps(value), time.time() + (ttl or self.ttl))
+
+    async def delete(self, namespace: str, key: str):
+        await asyncio.to_thread(self._delete, namespace, key)
+
+    async def close(self):
+        with self.lock:
+            self.db.close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "reads": self.reads,
+            "writes": self.writes,
+        }
+
+
+def create_state_store() -> StateStore:
+    backend = settings.state_backend
+    if backend == "sqlite":
+        return SQLiteStateStore(settings.state_sqlite_path, ttl=settings.session_idle_ttl)
+    if backend != "memory":
+        logging.error(f"Unknown STATE_BACKEND {backend!r}, using memory")
+    return MemoryStateStore(
+        max_entries=settings.max_rest_sessions + settings.max_voice_sessions,
+        ttl=settings.session_idle_ttl,
+    )
+
+
+#singleton instance
+state_store = create_state_store()
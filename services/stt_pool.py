@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from assemblyai.streaming.v3 import (
+    StreamingClient,
+    StreamingClientOptions,
+    StreamingEvents,
+    StreamingParameters,
+)
+
+from services.assembly_realtime import AsyncStreamingClient
+from config.config import settings
+
+STT_HOST = "streaming.assemblyai.com"
+
+
+class STTSession:
+    """One AssemblyAI streaming session whose events are forwarded to whoever currently owns it"""
+    def __init__(self, api_key: str, sample_rate: int):
+        self.api_key = api_key
+        self.sample_rate = sample_rate
+        #"native" runs the v3 protocol on the event loop; "sdk" uses the SDK's threaded client
+        self.native = settings.stt_client != "sdk"
+        if self.native:
+            self.client = AsyncStreamingClient(api_key, sample_rate=sample_rate)
+        else:
+            self.client = StreamingClient(
+                StreamingClientOptions(
+                    api_key=api_key,
+                    api_host=STT_HOST
+                )
+            )
+        self.created_at = time.monotonic()
+        self.listener = None
+        self.begin_event = None
+        self.closed = False
+        self.lock = threading.Lock() #SDK callbacks run on its reader thread
+
+        self.client.on(StreamingEvents.Begin, self._on_begin)
+        self.client.on(StreamingEvents.Turn, self._on_turn)
+        self.client.on(StreamingEvents.Termination, self._on_terminated)
+        self.client.on(StreamingEvents.Error, self._on_error)
+
+    async def connect(self):
+        if self.native:
+            await self.client.connect()
+            return
+        #the SDK handshake blocks, so keep it off the event loop
+        await asyncio.to_thread(self.client.connect, StreamingParameters(
+            sample_rate=self.sample_rate, format_turns=False
+        ))
+
+    async def disconnect(self):
+        self.closed = True
+        try:
+            if self.native:
+                await self.client.disconnect(terminate=True)
+            else:
+                #joins the SDK's reader/writer threads
+                await asyncio.to_thread(self.client.disconnect, terminate=True)
+        except Exception as e:
+            logging.error(f"STT disconnect failed: {e}")
+
+    def bind(self, listener):
+        """Hand the session to a voice client; replays Begin if it already arrived"""
+        with self.lock:
+            self.listener = listener
+            begin_event = self.begin_event
+        if begin_event is not None:
+            listener.on_begin(self.client, begin_event)
+
+    def _on_begin(self, client, event):
+        with self.lock:
+            self.begin_event = event
+            listener = self.listener
+        if listener:
+            listener.on_begin(client, event)
+
+    def _on_turn(self, client, event):
+        listener = self.listener
+        if listener:
+            listener.on_turn(client, event)
+
+    def _on_terminated(self, client, event):
+        self.closed = True
+        listener = self.listener
+        if listener:
+            listener.on_terminated(client, event)
+
+    def _on_error(self, client, error):
+        self.closed = True
+        listener = self.listener
+        if listener:
+            listener.on_error(client, error)
+        else:
+            logging.error(f"Idle STT session error: {error}")
+
+
+class STTSessionPool:
+    """Pre-connected AssemblyAI sessions so a new /ws connection doesn't wait for a cold handshake"""
+    def __init__(self, size: int, max_age: float, sample_rate: int = 16000):
+        self.size = size
+        self.max_age = max_age
+        self.sample_rate = sample_rate
+        self.api_key: Optional[str] = None
+        self.idle = deque()
+        self.connecting = 0
+        self.refill_event: Optional[asyncio.Event] = None
+        self.refill_task: Optional[asyncio.Task] = None
+
+        #metrics
+        self.connect_times = deque(maxlen=256) #seconds per completed handshake
+        self.pool_hits = 0
+        self.cold_connects = 0
+        self.failed_connects = 0
+        self.expired = 0
+
+    async def acquire(self, api_key: str, listener) -> STTSession:
+        """A connected session bound to listener: pooled if one is ready, otherwise a fresh connect"""
+        while self.idle:
+            session = self.idle.popleft()
+            if session.api_key != api_key or session.closed or self._too_old(session):
+                self._discard(session)
+                continue
+            self.pool_hits += 1
+            session.bind(listener)
+            self._request_refill()
+            return session
+
+        self.cold_connects += 1
+        self._request_refill()
+        session = await self._connect(api_key)
+        session.bind(listener)
+        return session
+
+    async def _connect(self, api_key: str) -> STTSession:
+        session = STTSession(api_key, self.sample_rate)
+        started = time.perf_counter()
+        try:
+            await session.connect()
+        except BaseException:
+            self.failed_connects += 1
+            raise
+        elapsed = time.perf_counter() - started
+        self.connect_times.append(elapsed)
+        print(f"AssemblyAI session connected in {elapsed * 1000:.0f} ms")
+        return session
+
+    def _too_old(self, session: STTSession) -> bool:
+        return time.monotonic() - session.created_at > self.max_age
+
+    def _discard(self, session: STTSession):
+        self.expired += 1
+        asyncio.create_task(session.disconnect())
+
+    def _request_refill(self):
+        if self.refill_event is not None:
+            self.refill_event.set()
+
+    async def _refill_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.refill_event.wait(), timeout=max(1.0, self.max_age / 4))
+            except asyncio.TimeoutError:
+                pass
+            self.refill_event.clear()
+
+            #recycle sessions before AssemblyAI times them out
+            for session in [s for s in self.idle if s.closed or self._too_old(s)]:
+                self.idle.remove(session)
+                self._discard(session)
+
+            if not self.api_key:
+                continue
+            missing = self.size - len(self.idle) - self.connecting
+            if missing > 0:
+                self.connecting += missing
+                await asyncio.gather(*(self._add_one() for _ in range(missing)))
+
+    async def _add_one(self):
+        try:
+            session = await self._connect(self.api_key)
+            if session.api_key == self.api_key:
+                self.idle.append(session)
+            else:
+                self._discard(session)
+        except Exception as e:
+            logging.error(f"Failed to pre-connect AssemblyAI session: {e}")
+            await asyncio.sleep(5) #don't hammer a failing upstream
+        finally:
+            self.connecting -= 1
+
+    def start(self, api_key: str):
+        self.api_key = api_key
+        if self.size <= 0 or self.refill_task is not None:
+            return
+        self.refill_event = asyncio.Event()
+        self.refill_event.set()
+        self.refill_task = asyncio.create_task(self._refill_loop())
+
+    async def close(self):
+        if self.refill_task:
+            self.refill_task.cancel()
+            self.refill_task = None
+        sessions = list(self.idle)
+        self.idle.clear()
+        await asyncio.gather(*(s.disconnect() for s in sessions), return_exceptions=True)
+
+    def stats(self) -> dict:
+        times = sorted(self.connect_times)
+        return {
+            "pool_size": self.size,
+            "idle_sessions": len(self.idle),
+            "connecting": self.connecting,
+            "pool_hits": self.pool_hits,
+            "cold_connects": self.cold_connects,
+            "failed_connects": self.failed_connects,
+            "expired": self.expired,
+            "avg_connect_ms": round(sum(times) / len(times) * 1000, 1) if times else 0.0,
+            "p95_connect_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 1) if times else 0.0,
+            "max_connect_ms": round(times[-1] * 1000, 1) if times else 0.0,
+        }
+
+
+#singleton instance
+stt_pool = STTSessionPool(
+    size=settings.stt_pool_size,
+    max_age=settings.stt_pool_max_age,
+)
@@ -0,0 +1,82 @@
+import re
+from typing import List, Optional
+
+#sentence end: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*\s+')
+#clause end: soft punctuation followed by whitespace
+CLAUSE_END = re.compile(r'[,;:—–]\s+')
+
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "vs", "etc", "e.g", "i.e", "jr", "sr", "no"}
+
+
+class SentenceSegmenter:
+    """Split streamed LLM text into speakable sentences/clauses for TTS"""
+    def __init__(self, min_chars: int = 20, max_chars: int = 220, first_clause_chars: int = 40):
+        self.min_chars = min_chars #shorter sentences ("Hmm.") are merged into the next one
+        self.max_chars = max_chars #force a split at a clause/word boundary past this length
+        self.first_clause_chars = first_clause_chars #the first segment may end at a clause to start audio sooner
+        self.buffer = ""
+        self.segments_emitted = 0
+
+    def feed(self, delta: str) -> List[str]:
+        """Add a text delta and return every segment that is now complete"""
+        self.buffer += delta
+        segments = []
+        while True:
+            segment = self._next_segment()
+            if segment is None:
+                break
+            segments.append(segment)
+        return segments
+
+    def flush(self) -> Optional[str]:
+        """Return whatever is left once the LLM stream has finished"""
+        tail = self.buffer.strip()
+        self.buffer = ""
+        if not tail:
+            return None
+        self.segments_emitted += 1
+        return tail
+
+    def _next_segment(self) -> Optional[str]:
+        cut = self._sentence_cut()
+        if cut is None and self.segments_emitted == 0 and len(self.buffer) >= self.first_clause_chars:
+            cut = self._last_match_end(CLAUSE_END, self.first_clause_chars)
+        if cut is None and len(self.buffer) > self.max_chars:
+            cut = self._last_match_end(CLAUSE_END, self.min_chars) or self._last_space(self.max_chars)
+        if cut is None:
+            return None
+
+        segment = self.buffer[:cut].strip()
+        self.buffer = self.buffer[cut:]
+        if not segment:
+            return None
+        self.segments_emitted += 1
+        return segment
+
+    def _sentence_cut(self) -> Optional[int]:
+        for match in SENTENCE_END.finditer(self.buffer):
+            end = match.end()
+            if end < self.min_chars:
+                continue
+            if self._is_abbreviation(match.start()):
+                continue
+            return end
+        return None
+
+    def _is_abbreviation(self, dot_index: int) -> bool:
+        if self.buffer[dot_index] != ".":
+            return False
+        words = self.buffer[:dot_index].split()
+        return bool(words) and words[-1].lower().rstrip(".") in ABBREVIATIONS
+
+    def _last_match_end(self, pattern, min_end: int) -> Optional[int]:
+        cut = None
+        for match in pattern.finditer(self.buffer):
+            if match.end() >= min_end:
+                cut = match.end()
+        return cut
+
+    def _last_space(self, limit: int) -> Optional[int]:
+        index = self.buffer.rfind(" ", 0, limit)
+        return index + 1 if index > 0 else limit
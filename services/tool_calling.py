@@ -1,22 +1,49 @@
-from tavily import TavilyClient
 import os
 from dotenv import load_dotenv
 import asyncio
 import logging
-from config.config import api_keys
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config.config import api_keys, settings
+from services.async_cache import AsyncTTLCache
+from services.client_registry import client_registry
 load_dotenv()
 
-tavily = TavilyClient(api_key=api_keys.tavily)
 
-async def web_search(query: str) -> dict:
-   
+#popular questions (weather, news, anime...) repeat across sessions within minutes
+search_cache = AsyncTTLCache(
+    max_entries=settings.search_cache_max_entries,
+    ttl=settings.search_cache_ttl,
+)
+
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing punctuation don't change what Tavily returns"""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!.,;: ")
+
+
+async def web_search(query: str, api_key: str = None) -> dict:
+    # Ensure query is a string, not dict
+    if isinstance(query, dict):
+        query = query.get("query", "")
+
+    key = normalize_query(query)
+    if not key:
+        return {"status": "error", "message": "Empty search query"}
+    return await search_cache.get_or_load(
+        key,
+        lambda: _tavily_search(query, api_key),
+        should_cache=lambda result: result.get("status") == "success",
+    )
+
+
+async def _tavily_search(query: str, api_key: str = None) -> dict:
     try:
-        # Ensure query is a string, not dict
-        if isinstance(query, dict):
-            query = query.get("query", "")
-        
         print(f"Calling web search tool with query: {query}")
-        response = await asyncio.to_thread(tavily.search, query)
+        client = client_registry.get("tavily", api_key or api_keys.tavily)
+        response = await client.search(query)
         
         # Validate response structure
         if not isinstance(response, dict):
@@ -35,3 +62,79 @@ async def web_search(query: str) -> dict:
         
 
 
+
+
+class ToolContext:
+    """What a tool may need beyond its arguments: the user's prompt and this session's keys"""
+    def __init__(self, prompt: str = "", tavily_key: str = None):
+        self.prompt = prompt
+        self.tavily_key = tavily_key
+
+
+class Tool:
+    def __init__(self, declaration: dict, handler: Callable[[dict, ToolContext], Awaitable[Any]], timeout: float):
+        self.name = declaration["name"]
+        self.declaration = declaration
+        self.handler = handler
+        self.timeout = timeout
+
+
+class ToolRegistry:
+    """Function declarations Gemini sees and the async handlers that run them"""
+    def __init__(self, default_timeout: float):
+        self.default_timeout = default_timeout
+        self.tools: Dict[str, Tool] = {}
+
+    def register(self, declaration: dict, handler: Callable[[dict, ToolContext], Awaitable[Any]],
+                 timeout: Optional[float] = None):
+        self.tools[declaration["name"]] = Tool(declaration, handler, timeout or self.default_timeout)
+
+    def declarations(self) -> List[dict]:
+        return [tool.declaration for tool in self.tools.values()]
+
+    async def run(self, name: str, args: dict, context: ToolContext) -> dict:
+        """One call, as {"success": ..., "result"/"error": ...}; never raises"""
+        tool = self.tools.get(name)
+        if tool is None:
+            return {"success": False, "error": f"Unknown tool {name}"}
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(tool.handler(args or {}, context), timeout=tool.timeout)
+            return {"success": True, "result": result}
+        except asyncio.TimeoutError:
+            logging.error(f"Tool {name} timed out after {tool.timeout}s")
+            return {"success": False, "error": f"{name} took too long, answer without it"}
+        except Exception as e:
+            logging.error(f"Error executing {name}: {e}")
+            return {"success": False, "error": str(e)}
+        finally:
+            print(f"Tool {name} finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    async def run_all(self, calls: List[Tuple[str, dict]], context: ToolContext) -> List[dict]:
+        """Every call from one model response at once; results in call order"""
+        return await asyncio.gather(*(self.run(name, args, context) for name, args in calls))
+
+
+async def _web_search_tool(args: dict, context: ToolContext):
+    return await web_search({"query": args.get("query") or context.prompt}, api_key=context.tavily_key)
+
+
+tool_registry = ToolRegistry(default_timeout=settings.tool_timeout)
+tool_registry.register(
+    {
+        "name": "web_search",
+        "description": "Search the web for real-time information, news, weather, anime, movies, and updated data",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "The search query to look up real-time information"
+                }
+            },
+            "required": ["query"]
+        }
+    },
+    _web_search_tool,
+    timeout=settings.web_search_timeout,
+)
@@ -0,0 +1,30 @@
+import asyncio
+import logging
+
+import assemblyai as aai
+
+from config.config import api_keys
+
+
+def _transcribe(audio_path: str):
+    aai.settings.api_key = api_keys.assemblyai
+    #the SDK uploads local files in chunks straight from disk
+    return aai.Transcriber().transcribe(audio_path)
+
+
+async def transcription(audio_path: str) -> dict:
+    """Transcribe a stored recording; the SDK polls until done, so it runs in a thread"""
+    if not audio_path:
+        return {"error": "Missing file"}
+    try:
+        transcript = await asyncio.to_thread(_transcribe, audio_path)
+    except Exception as e:
+        logging.error(f"Transcription failed: {e}")
+        return {"error": str(e)}
+    print("transcript", transcript)
+    if transcript.status == aai.TranscriptStatus.error:
+        return {"error": transcript.error or "Transcription failed"}
+    # Handle missing or empty transcript text
+    if not getattr(transcript, "text", None) or not transcript.text.strip():
+        return {"error": "Nothing to transcribe"}
+    return {"transcript": transcript.text}
@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+from config.config import settings
+
+AudioBytes = Union[bytes, mmap.mmap]
+
+
+class TTSAudioCache:
+    """Content-addressed synthesized audio: byte-bounded in-memory LRU over a memory-mapped disk tier"""
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int, enabled: bool = True):
+        self.directory = directory
+        self.memory_limit = memory_bytes
+        self.disk_limit = disk_bytes
+        self.enabled = enabled
+        #entries bigger than this are served from disk only so one long answer can't flush the LRU
+        self.max_memory_entry = max(1, memory_bytes // 8)
+
+        self.memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = None #computed lazily on the first disk write
+        self.disk_lock = threading.Lock() #disk writes run on worker threads
+
+        #metrics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bytes_served = 0
+        self.bytes_stored = 0
+
+    @staticmethod
+    def make_key(text: str, voice_id: str, style: str, rate: int, pitch: int, variation: int,
+                 sample_rate: int, audio_format: str, source: str) -> str:
+        """source names the payload's container: "stream" (header-less PCM or raw MP3/OGG frames
+        from the streaming socket) or "file" (a complete file from the REST API)"""
+        payload = json.dumps(
+            [source, text.strip(), voice_id, style, rate, pitch, variation, sample_rate, audio_format.upper()],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.bin")
+
+    async def get(self, key: str) -> Optional[AudioBytes]:
+        """Cached audio, or None; large entries come back as a read-only mmap for release() to close"""
+        if not self.enabled:
+            return None
+        audio = self.memory.get(key)
+        if audio is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            self.bytes_served += len(audio)
+            return audio
+
+        audio = await asyncio.to_thread(self._read_disk, key)
+        if audio is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self.bytes_served += len(audio)
+        if len(audio) <= self.max_memory_entry:
+            mapped, audio = audio, bytes(audio)
+            mapped.close()
+            self._remember(key, audio)
+        return audio
+
+    async def contains(self, key: str) -> bool:
+        """Whether key is cached, without reading (or mapping) its audio"""
+        if not self.enabled:
+            return False
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return True
+        if await asyncio.to_thread(self._touch_disk, key):
+            self.disk_hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    @staticmethod
+    def release(audio: Optional[AudioBytes]):
+        """Close the mmap behind audio returned by get(), once the caller is done with it"""
+        if isinstance(audio, mmap.mmap):
+            audio.close()
+
+    def _touch_disk(self, key: str) -> bool:
+        try:
+            os.utime(self._path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _read_disk(self, key: str) -> Optional[mmap.mmap]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                audio = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(path) #mtime doubles as last-access time for disk eviction
+            return audio
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"TTS cache read failed for {key}: {e}")
+            return None
+
+    async def put(self, key: str, audio: bytes):
+        if not self.enabled or not audio:
+            return
+        audio = bytes(audio)
+        self.stores += 1
+        self.bytes_stored += len(audio)
+        if len(audio) <= self.max_memory_entry:
+            self._remember(key, audio)
+        try:
+            await asyncio.to_thread(self._write_disk, key, audio)
+        except Exception as e:
+            logging.error(f"TTS cache write failed for {key}: {e}")
+
+    def _remember(self, key: str, audio: bytes):
+        previous = self.memory.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= len(previous)
+        self.memory[key] = audio
+        self.memory_bytes += len(audio)
+        while self.memory_bytes > self.memory_limit and self.memory:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _write_disk(self, key: str, audio: bytes):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+        with self.disk_lock:
+            if self.disk_bytes is None:
+                self.disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self.disk_bytes += len(audio)
+            if self.disk_bytes > self.disk_limit:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".bin"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict_disk(self):
+        """Remove least recently used files until the disk tier is back under 90% of its limit (holds disk_lock)"""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_limit * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self.disk_bytes = total
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.disk_bytes,
+            "bytes_served": self.bytes_served,
+            "bytes_stored": self.bytes_stored,
+        }
+
+
+#singleton instance
+tts_cache = TTSAudioCache(
+    directory=settings.tts_cache_dir,
+    memory_bytes=settings.tts_cache_memory_mb * 1024 * 1024,
+    disk_bytes=settings.tts_cache_disk_mb * 1024 * 1024,
+    enabled=settings.tts_cache_enabled,
+)
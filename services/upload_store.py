@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from config.config import settings
+
+#room for the multipart envelope around the file when judging a request by its Content-Length
+FORM_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised by save() once an upload passes max_bytes"""
+
+
+class InvalidUpload(Exception):
+    """Raised by save() when the request carries no file"""
+
+
+class _FilePart:
+    """Incremental multipart/form-data parser that keeps only the first file field's bytes"""
+    def __init__(self, boundary: bytes):
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.data = [] #file bytes parsed since the last feed()
+        self.headers = {}
+        self.field = b""
+        self.value = b""
+        self.in_file = False
+        self.done = False
+        self.parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def _part_begin(self):
+        self.headers = {}
+
+    def _header_field(self, data: bytes, start: int, end: int):
+        self.field += data[start:end]
+
+    def _header_value(self, data: bytes, start: int, end: int):
+        self.value += data[start:end]
+
+    def _header_end(self):
+        self.headers[self.field.lower()] = self.value
+        self.field = b""
+        self.value = b""
+
+    def _headers_finished(self):
+        if self.done:
+            return
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        if b"filename" in options:
+            self.in_file = True
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self.content_type = self.headers.get(b"content-type", b"").decode("latin-1") or None
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self.in_file:
+            self.data.append(data[start:end])
+
+    def _part_end(self):
+        if self.in_file:
+            self.in_file = False
+            self.done = True
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Parse one chunk of the request body; returns the file bytes it contained"""
+        self.parser.write(chunk)
+        data, self.data = self.data, []
+        return b"".join(data)
+
+
+class UploadStore:
+    """Uploaded recordings on disk, named by the sha256 of their content
+
+    The request body is streamed straight into the destination file and hashed as it
+    arrives (no spooled copy first), so memory stays flat however large the file; identical
+    uploads share one stored file. Files not used for ttl seconds are removed in the background.
+    """
+    def __init__(self, directory: str, max_bytes: int, ttl: float, sweep_interval: float = 300.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.sweep_task: Optional[asyncio.Task] = None
+
+        #metrics
+        self.stored = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.removed = 0
+        self.bytes_received = 0
+
+    def _path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, upload_id)
+
+    def _too_large(self) -> UploadTooLarge:
+        self.rejected += 1
+        return UploadTooLarge(f"Upload is larger than {self.max_bytes / (1024 * 1024):g} MB")
+
+    async def save(self, request: Request) -> dict:
+        """Stream a request's file to disk: the "file" field of a multipart form, or a raw audio body
+
+        Returns its id (the content hash), size, filename, content type and whether it was already stored.
+        """
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        form = content_type == b"multipart/form-data"
+        length = request.headers.get("content-length", "")
+        #refuse before reading anything when the client says up front that it is too big
+        if length.isdigit() and int(length) > self.max_bytes + (FORM_OVERHEAD if form else 0):
+            raise self._too_large()
+        part = None
+        if form:
+            if not options.get(b"boundary"):
+                raise InvalidUpload("Missing multipart boundary")
+            part = _FilePart(options[b"boundary"])
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f".{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in request.stream():
+                    data = part.feed(chunk) if part else chunk
+                    if not data:
+                        continue
+                    size += len(data)
+                    if size > self.max_bytes:
+                        raise self._too_large()
+                    digest.update(data)
+                    await asyncio.to_thread(f.write, data)
+            if part and part.filename is None:
+                raise InvalidUpload("Missing file")
+            if not size:
+                raise InvalidUpload("Missing file")
+            self.bytes_received += size
+
+            upload_id = digest.hexdigest()
+            path = self._path(upload_id)
+            deduplicated = os.path.exists(path)
+            if deduplicated:
+                os.remove(tmp_path)
+                os.utime(path) #keep the shared copy alive as if it had just been uploaded
+                self.deduplicated += 1
+            else:
+                os.replace(tmp_path, path)
+                self.stored += 1
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        if part:
+            filename, file_type = part.filename, part.content_type
+        else:
+            filename, file_type = request.query_params.get("filename"), content_type.decode("latin-1") or None
+        return {
+            "upload_id": upload_id,
+            "path": path,
+            "size": size,
+            "deduplicated": deduplicated,
+            "filename": filename,
+            "content_type": file_type,
+        }
+
+    def path(self, upload_id: str) -> Optional[str]:
+        """Where a stored upload lives, or None if it is unknown or already cleaned up"""
+        if len(upload_id) != 64 or not all(c in "0123456789abcdef" for c in upload_id):
+            return None
+        path = self._path(upload_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _sweep(self) -> int:
+        removed = 0
+        cutoff = time.time() - self.ttl
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def sweep(self):
+        removed = await asyncio.to_thread(self._sweep)
+        self.removed += removed
+        if removed:
+            print(f"Removed {removed} expired uploads")
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.error(f"Upload cleanup failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self):
+        if self.sweep_task is None:
+            self.sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self.sweep_task:
+            self.sweep_task.cancel()
+            self.sweep_task = None
+
+    def stats(self) -> dict:
+        return {
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "removed": self.removed,
+            "bytes_received": self.bytes_received,
+            "max_bytes": self.max_bytes,
+        }
+
+
+#singleton instance
+upload_store = UploadStore(
+    directory=settings.upload_dir,
+    max_bytes=settings.upload_max_mb * 1024 * 1024,
+    ttl=settings.upload_ttl,
+)
@@ -0,0 +1,134 @@
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class VadResult:
+    audio: bytes = b"" #PCM16 that should still go upstream to STT
+    speech_started: bool = False
+    end_of_utterance: bool = False
+    dropped_ms: int = 0
+
+
+class VoiceActivityDetector:
+    """Energy + zero-crossing VAD over fixed PCM16 frames, suppressing long silences"""
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 20, energy_ratio: float = 3.0,
+                 min_rms: float = 300.0, zcr_max: float = 0.35, speech_start_ms: int = 60,
+                 hangover_ms: int = 300, eou_silence_ms: int = 700, preroll_ms: int = 200,
+                 keepalive_ms: int = 1000):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.energy_ratio = energy_ratio #speech must be this many times louder than the noise floor
+        self.min_rms = min_rms #absolute floor so digital silence never counts as speech
+        self.zcr_max = zcr_max #quiet frames with a high crossing rate are hiss, not voice
+        self.speech_start_ms = speech_start_ms
+        self.hangover_ms = hangover_ms #trailing silence still forwarded so STT can finish the last word
+        self.eou_silence_ms = eou_silence_ms
+        self.keepalive_ms = keepalive_ms
+
+        self.noise_floor = min_rms / energy_ratio
+        self.pending = b""
+        self.preroll = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self.keepalive_frame = bytes(self.frame_bytes)
+
+        self.in_speech = False
+        self.utterance_open = False
+        self.speech_run_ms = 0
+        self.silence_run_ms = 0
+        self.suppressed_ms = 0
+        self.utterance_speech_ms = 0 #voiced time in the current utterance, used to gate barge-in
+
+        #counters
+        self.frames_in = 0
+        self.frames_forwarded = 0
+        self.frames_dropped = 0
+
+    def classify(self, frames: np.ndarray) -> np.ndarray:
+        """Vectorized speech/non-speech decision for a (n, frame_samples) int16 block"""
+        x = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(x * x, axis=1))
+        signs = np.signbit(x)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        threshold = max(self.min_rms, self.noise_floor * self.energy_ratio)
+        loud = rms > threshold
+        #fricatives have a high crossing rate, so accept them when they are clearly loud
+        is_speech = loud & ((zcr < self.zcr_max) | (rms > 2 * threshold))
+
+        quiet = rms[~is_speech]
+        if quiet.size:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * float(np.mean(quiet))
+        return is_speech
+
+    def process(self, pcm: bytes) -> VadResult:
+        result = VadResult()
+        data = self.pending + pcm
+        count = len(data) // self.frame_bytes
+        self.pending = data[count * self.frame_bytes:]
+        if not count:
+            return result
+
+        frames = np.frombuffer(data, dtype="<i2", count=count * self.frame_samples).reshape(count, self.frame_samples)
+        decisions = self.classify(frames)
+        out = bytearray()
+        self.frames_in += count
+
+        for index, is_speech in enumerate(decisions):
+            frame = data[index * self.frame_bytes:(index + 1) * self.frame_bytes]
+            if is_speech:
+                self.speech_run_ms += self.frame_ms
+                self.silence_run_ms = 0
+                if self.in_speech:
+                    self.utterance_speech_ms += self.frame_ms
+            else:
+                self.speech_run_ms = 0
+                self.silence_run_ms += self.frame_ms
+
+            if not self.in_speech and self.speech_run_ms >= self.speech_start_ms:
+                self.in_speech = True
+                self.utterance_open = True
+                self.utterance_speech_ms = self.speech_run_ms
+                result.speech_started = True
+                #replay the onset that was held back while we were deciding
+                for held in self.preroll:
+                    out += held
+                    self.frames_forwarded += 1
+                self.preroll.clear()
+
+            if self.in_speech and self.silence_run_ms >= self.hangover_ms:
+                self.in_speech = False
+
+            if self.utterance_open and self.silence_run_ms >= self.eou_silence_ms:
+                self.utterance_open = False
+                result.end_of_utterance = True
+
+            if self.in_speech:
+                out += frame
+                self.frames_forwarded += 1
+                self.suppressed_ms = 0
+                continue
+
+            if len(self.preroll) == self.preroll.maxlen:
+                self.frames_dropped += 1
+                result.dropped_ms += self.frame_ms
+            self.preroll.append(frame)
+            self.suppressed_ms += self.frame_ms
+            if self.suppressed_ms >= self.keepalive_ms:
+                #a silent frame now and then keeps the upstream session from timing out
+                out += self.keepalive_frame
+                self.suppressed_ms = 0
+
+        result.audio = bytes(out)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "frames_in": self.frames_in,
+            "frames_forwarded": self.frames_forwarded,
+            "frames_dropped": self.frames_dropped,
+            "noise_floor": round(self.noise_floor, 1),
+            "in_speech": self.in_speech,
+        }
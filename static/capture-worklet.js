@@ -0,0 +1,60 @@
+// Microphone capture on the audio rendering thread.
+// Decimates whatever the hardware rate is down to 16 kHz, converts to Int16 and posts
+// fixed-size frames to the main thread as transferable buffers (no copies, no jank).
+class CaptureProcessor extends AudioWorkletProcessor {
+  constructor(options) {
+    super();
+    const opts = (options && options.processorOptions) || {};
+    this.targetRate = opts.targetRate || 16000;
+    this.frameSamples = Math.round((this.targetRate * (opts.frameMs || 50)) / 1000);
+    // input samples per output sample (sampleRate is the context rate, a worklet global)
+    this.ratio = sampleRate / this.targetRate;
+    this.phase = 0;
+    this.sum = 0;
+    this.count = 0;
+    this.frame = new Int16Array(this.frameSamples);
+    this.filled = 0;
+    this.active = true;
+    this.port.onmessage = (event) => {
+      if (event.data === "stop") this.active = false;
+    };
+  }
+
+  push(value) {
+    const s = value > 1 ? 1 : value < -1 ? -1 : value;
+    this.frame[this.filled++] = s < 0 ? s * 0x8000 : s * 0x7fff;
+    if (this.filled === this.frameSamples) {
+      this.port.postMessage(this.frame.buffer, [this.frame.buffer]);
+      this.frame = new Int16Array(this.frameSamples);
+      this.filled = 0;
+    }
+  }
+
+  process(inputs) {
+    const input = inputs[0];
+    if (!input || !input.length) return this.active;
+    const channel = input[0];
+
+    if (this.ratio <= 1) {
+      for (let i = 0; i < channel.length; i++) this.push(channel[i]);
+      return this.active;
+    }
+
+    // box-filter decimation: average the input samples that fall into each output sample,
+    // which doubles as a cheap anti-aliasing low-pass for speech
+    for (let i = 0; i < channel.length; i++) {
+      this.sum += channel[i];
+      this.count++;
+      this.phase += 1;
+      if (this.phase >= this.ratio) {
+        this.phase -= this.ratio;
+        this.push(this.sum / this.count);
+        this.sum = 0;
+        this.count = 0;
+      }
+    }
+    return this.active;
+  }
+}
+
+registerProcessor("capture-processor", CaptureProcessor);
@@ -104,71 +104,212 @@ saveConfigButton.addEventListener("click", () => {
 
 //streaming websocket setup
 let websocket = null;
+let configSent = false; // audio waits until the server has our config
+const VOICE_RESUME_KEY = "voiceResumeToken"; // per tab, so two tabs never share a conversation
 let isRecording = false;
 let audioContext;
 let scriptProcessor;
+let captureNode = null;
 let source;
 let streamAudioContext = null;
 let audioChunks = [];
-let base64AudioChunks = [];
 let playheadTime = 0;
-let wavHeaderStripped = false;
 let isPlaying = false;
+let streamingMessageEl = null;
+let scheduledSources = [];
+let playbackNode = null;
+let playbackReady = null;
+let pendingPlayback = [];
+let outputSampleRate = 44100; // negotiated TTS rate (see "audio_format")
+let audioDecoder = null;
+let audioDecoderCodec = null;
+let decodedTimestamp = 0;
+
+// Microphone frames: 16 kHz PCM16, 50 ms each
+const CAPTURE_SAMPLE_RATE = 16000;
+const CAPTURE_FRAME_MS = 50;
+
+// Binary audio frame header (see services/audio_frames.py):
+// u8 version | u8 format | u8 channels | u8 flags | u32 sequence | u32 sampleRate
+const AUDIO_FRAME_HEADER_BYTES = 12;
+const AUDIO_FORMAT_PCM16 = 1;
+const AUDIO_FORMAT_MP3 = 2;
+const AUDIO_FORMAT_OPUS = 3;
+const AUDIO_FLAG_PACKETS = 0x01; // payload: u16 length-prefixed packets
+const AUDIO_CODECS = { [AUDIO_FORMAT_MP3]: "mp3", [AUDIO_FORMAT_OPUS]: "opus" };
+
+function parseAudioFrame(arrayBuffer) {
+  const header = new DataView(arrayBuffer, 0, AUDIO_FRAME_HEADER_BYTES);
+  const format = header.getUint8(1);
+  const flags = header.getUint8(3);
+  const sequence = header.getUint32(4, true);
+  const sampleRate = header.getUint32(8, true);
+  if (format === AUDIO_FORMAT_PCM16) {
+    // View the payload in place - no copy of the PCM bytes
+    const samples = new Int16Array(
+      arrayBuffer,
+      AUDIO_FRAME_HEADER_BYTES,
+      (arrayBuffer.byteLength - AUDIO_FRAME_HEADER_BYTES) >> 1
+    );
+    return { format, sequence, sampleRate, samples };
+  }
+  if (AUDIO_CODECS[format] && flags & AUDIO_FLAG_PACKETS) {
+    const packets = [];
+    const view = new DataView(arrayBuffer);
+    let offset = AUDIO_FRAME_HEADER_BYTES;
+    while (offset + 2 <= arrayBuffer.byteLength) {
+      const length = view.getUint16(offset, true);
+      offset += 2;
+      packets.push(new Uint8Array(arrayBuffer, offset, length));
+      offset += length;
+    }
+    return { format, sequence, sampleRate, packets };
+  }
+  console.warn("Unsupported audio frame format", format);
+  return null;
+}
 
-//Function to base64ToPCMFLoat32
-function base64ToPCMFloat32(base64) {
-  const binary = atob(base64);
-  let offset = 0;
-  console.log("offset", offset);
-  if (
-    !wavHeaderStripped &&
-    binary.length > 44 &&
-    binary.slice(0, 4) === "RIFF"
-  ) {
-    console.log("Detected WAV header, stripping 44 bytes");
-    offset = 44;
-    wavHeaderStripped = true;
+// Compressed TTS (MP3/Opus) is decoded with WebCodecs and fed to the same playback path
+function decodeAudioPackets(frame) {
+  const codec = AUDIO_CODECS[frame.format];
+  if (!audioDecoder || audioDecoderCodec !== codec) {
+    closeAudioDecoder();
+    audioDecoder = new AudioDecoder({
+      output: (audioData) => {
+        const samples = new Float32Array(audioData.numberOfFrames);
+        audioData.copyTo(samples, { planeIndex: 0, format: "f32-planar" });
+        playAudioChunks(samples, audioData.sampleRate);
+        audioData.close();
+      },
+      error: (error) => console.error("Audio decode error:", error),
+    });
+    audioDecoder.configure({
+      codec,
+      sampleRate: frame.sampleRate,
+      numberOfChannels: 1,
+    });
+    audioDecoderCodec = codec;
   }
-  const length = binary.length - offset;
-  if (length <= 0) return null;
+  frame.packets.forEach((packet) => {
+    audioDecoder.decode(
+      new EncodedAudioChunk({ type: "key", timestamp: decodedTimestamp, data: packet })
+    );
+    // only needs to increase; playback timing comes from the jitter buffer
+    decodedTimestamp += 1000;
+  });
+}
 
-  const bytes = new Uint8Array(length);
-  for (let i = 0; i < length; i++) {
-    bytes[i] = binary.charCodeAt(i + offset);
+function closeAudioDecoder() {
+  if (audioDecoder && audioDecoder.state !== "closed") {
+    audioDecoder.close();
   }
+  audioDecoder = null;
+  audioDecoderCodec = null;
+}
+
+// What we can decode and how good the network looks; the server picks the TTS format from it
+async function detectAudioCapabilities() {
+  const codecs = ["pcm"];
+  if (window.AudioDecoder) {
+    const candidates = [
+      ["mp3", { codec: "mp3", sampleRate: 24000, numberOfChannels: 1 }],
+      ["opus", { codec: "opus", sampleRate: 48000, numberOfChannels: 1 }],
+    ];
+    for (const [name, config] of candidates) {
+      try {
+        if ((await AudioDecoder.isConfigSupported(config)).supported) codecs.push(name);
+      } catch (e) {
+        // codec not available
+      }
+    }
+  }
+  const connection = navigator.connection || {};
+  return {
+    codecs,
+    downlinkMbps: connection.downlink,
+    effectiveType: connection.effectiveType,
+    saveData: !!connection.saveData,
+  };
+}
 
-  const dataView = new DataView(bytes.buffer);
-  const sampleCount = bytes.length / 2;
-  const float32Array = new Float32Array(sampleCount);
+// Jitter-buffered playback engine (static/playback-worklet.js)
+function startPlaybackEngine() {
+  playbackReady = streamAudioContext.audioWorklet
+    .addModule("/static/playback-worklet.js")
+    .then(() => {
+      playbackNode = new AudioWorkletNode(streamAudioContext, "playback-processor", {
+        numberOfInputs: 0,
+        numberOfOutputs: 1,
+        outputChannelCount: [1],
+      });
+      playbackNode.port.onmessage = (event) => reportPlaybackStats(event.data);
+      playbackNode.connect(streamAudioContext.destination);
+      pendingPlayback.forEach((message) => playbackNode.port.postMessage(message));
+      pendingPlayback = [];
+    })
+    .catch((error) => {
+      console.warn("Playback worklet unavailable, scheduling buffers instead", error);
+      playbackReady = null;
+      const queued = pendingPlayback;
+      pendingPlayback = [];
+      queued.forEach((message) => {
+        if (message.type === "push") scheduleAudioBuffer(message.samples, message.sampleRate);
+      });
+    });
+}
 
-  for (let i = 0; i < sampleCount; i++) {
-    const int16 = dataView.getInt16(i * 2, true);
-    float32Array[i] = int16 / 32768;
-    // Convert to float32
+function postToPlayback(message, transfer) {
+  if (playbackNode) {
+    playbackNode.port.postMessage(message, transfer || []);
+  } else if (playbackReady) {
+    pendingPlayback.push(message);
   }
+}
 
-  return float32Array;
+// Buffered level and underruns go back to the server so it knows when we are really done
+function reportPlaybackStats(stats) {
+  if (stats.type !== "stats") return;
+  if (websocket && websocket.readyState === WebSocket.OPEN) {
+    websocket.send(JSON.stringify({ ...stats, type: "playback_stats" }));
+  }
 }
 
 //play audio
-function playAudioChunks(base64Audio) {
+function playAudioChunks(samples, sampleRate) {
   if (!streamAudioContext) {
     streamAudioContext = new (window.AudioContext || window.webkitAudioContext)(
-      { sampleRate: 44100 }
+      { sampleRate: outputSampleRate }
     );
     playheadTime = streamAudioContext.currentTime;
+    if (window.AudioWorkletNode) startPlaybackEngine();
 
     pulseRing.classList.add("speaking");
     statusText.textContent = "Speaking";
     pulseRing.classList.remove("listening");
   }
+  if (!samples.length) return;
 
-  const float32Array = base64ToPCMFloat32(base64Audio);
-  if (!float32Array) return;
+  if (playbackNode || playbackReady) {
+    // the view keeps its offset; the frame's buffer moves to the audio thread without a copy
+    postToPlayback({ type: "push", samples, sampleRate }, [samples.buffer]);
+    isPlaying = true;
+    return;
+  }
+  scheduleAudioBuffer(samples, sampleRate);
+}
 
+// Fallback: one AudioBufferSourceNode per chunk with a fixed lead
+function scheduleAudioBuffer(samples, sampleRate) {
   //create audio buffer
-  const buffer = streamAudioContext.createBuffer(1, float32Array.length, 44100);
-  buffer.copyToChannel(float32Array, 0);
+  const buffer = streamAudioContext.createBuffer(1, samples.length, sampleRate);
+  const channel = buffer.getChannelData(0);
+  if (samples instanceof Float32Array) {
+    channel.set(samples);
+  } else {
+    for (let i = 0; i < samples.length; i++) {
+      channel[i] = samples[i] / 32768;
+    }
+  }
   const source = streamAudioContext.createBufferSource();
   source.buffer = buffer;
   source.connect(streamAudioContext.destination);
@@ -179,14 +320,42 @@ function playAudioChunks(base64Audio) {
   source.start(playheadTime);
   playheadTime += buffer.duration;
   isPlaying = true;
+
+  scheduledSources.push(source);
+  source.onended = () => {
+    const index = scheduledSources.indexOf(source);
+    if (index !== -1) scheduledSources.splice(index, 1);
+  };
+}
+
+// Barge-in: silence everything already scheduled for the interrupted turn
+function flushPlayback() {
+  pendingPlayback = [];
+  closeAudioDecoder();
+  postToPlayback({ type: "flush" });
+  scheduledSources.forEach((source) => {
+    try {
+      source.stop();
+    } catch (e) {
+      // already stopped
+    }
+  });
+  scheduledSources = [];
+  if (streamAudioContext) {
+    playheadTime = streamAudioContext.currentTime;
+  }
+  isPlaying = false;
 }
 
 // Cleanup function when stopping
 function cleanupStreamAudio() {
   audioChunks = [];
-  base64AudioChunks = [];
+  scheduledSources = [];
+  pendingPlayback = [];
+  playbackNode = null;
+  playbackReady = null;
+  closeAudioDecoder();
   isPlaying = false;
-  wavHeaderStripped = false;
   if (streamAudioContext) {
     streamAudioContext.close();
     streamAudioContext = null;
@@ -203,23 +372,44 @@ function setupWebSocket() {
   const protocol = window.location.protocol === "https:" ? "wss" : "ws";
   const wsUrl = `${protocol}://${window.location.host}/ws`;
   websocket = new WebSocket(wsUrl);
+  // Audio arrives as binary frames, everything else as JSON text
+  websocket.binaryType = "arraybuffer";
 
   console.log("WebSocket URL:", wsUrl);
 
-  websocket.onopen = () => {
+  configSent = false;
+  websocket.onopen = async () => {
     console.log("WebSocket connection established");
-    // Send API keys to the server
+    // Send API keys (and what audio we can play) to the server
     if (apiKeys) {
+      const audio = await detectAudioCapabilities();
       websocket.send(
         JSON.stringify({
           type: "config",
           apiKeys: apiKeys,
+          audio,
+          // lets any server worker pick the conversation back up
+          resumeToken: sessionStorage.getItem(VOICE_RESUME_KEY) || undefined,
+          // ?timing in the page URL asks for a latency breakdown of every turn
+          timing: new URLSearchParams(location.search).has("timing"),
         })
       );
     }
+    configSent = true;
   };
 
   websocket.onmessage = (event) => {
+    if (event.data instanceof ArrayBuffer) {
+      const frame = parseAudioFrame(event.data);
+      if (!frame) return;
+      if (frame.packets) {
+        decodeAudioPackets(frame);
+      } else {
+        playAudioChunks(frame.samples, frame.sampleRate);
+      }
+      return;
+    }
+
     // Handle server acknowledgement here
     const data = JSON.parse(event.data);
 
@@ -242,16 +432,44 @@ function setupWebSocket() {
         statusText.textContent = "Meow";
         updateThoughtsDisplay("idle");
       }
-    } else if (data.status === "audio_chunk") {
-      playAudioChunks(data.audio_base64);
+    } else if (data.status === "session") {
+      sessionStorage.setItem(VOICE_RESUME_KEY, data.resumeToken);
+    } else if (data.status === "audio_format") {
+      console.log("TTS audio format:", data.format);
+      outputSampleRate = data.sampleRate || 44100;
+    } else if (data.status === "tool_status") {
+      // the model is running tools (web search...) before it answers
+      updateThoughtsDisplay(data.active ? "looking_up" : "processing");
+    } else if (data.status === "timing") {
+      console.table(data.stages);
+    } else if (data.status === "barge_in") {
+      console.log("barge-in: dropping scheduled bot audio");
+      flushPlayback();
+      streamingMessageEl = null;
+      statusText.textContent = "Listening";
+      updateThoughtsDisplay("listening");
     } else if (data.status === "audio_complete") {
       // Allow user to continue speaking without restarting session
       console.log("audio complete ✅");
+      // nothing more is coming this turn: play out what is buffered
+      postToPlayback({ type: "end" });
       statusText.textContent = "Listening";
       updateThoughtsDisplay("listening");
     } else if (data.status === "llm_response") {
-      // Add bot message to chat
-      addMessageToChat(data.text, "assistant");
+      if (!data.is_complete) {
+        // Grow the current bot bubble as tokens stream in
+        if (!streamingMessageEl) {
+          streamingMessageEl = addMessageToChat("", "assistant");
+        }
+        streamingMessageEl.textContent += data.text;
+        chatWindow.scrollTop = chatWindow.scrollHeight;
+      } else if (streamingMessageEl) {
+        streamingMessageEl.textContent = data.text;
+        streamingMessageEl = null;
+      } else {
+        // Add bot message to chat
+        addMessageToChat(data.text, "assistant");
+      }
     } else if (data.status === "error" && data.type === "api_key") {
       // Show API key error
       errorContainer.style.display = "flex";
@@ -279,16 +497,48 @@ function setupWebSocket() {
   return websocket;
 }
 
+function sendCapturedFrame(buffer) {
+  if (!isRecording || !configSent) return;
+  if (websocket && websocket.readyState === WebSocket.OPEN) {
+    websocket.send(buffer);
+  }
+}
+
+// Preferred path: AudioWorklet on the audio thread, 50 ms Int16 frames
+async function startWorkletCapture() {
+  await audioContext.audioWorklet.addModule("/static/capture-worklet.js");
+  captureNode = new AudioWorkletNode(audioContext, "capture-processor", {
+    numberOfInputs: 1,
+    numberOfOutputs: 0,
+    channelCount: 1,
+    processorOptions: {
+      targetRate: CAPTURE_SAMPLE_RATE,
+      frameMs: CAPTURE_FRAME_MS,
+    },
+  });
+  captureNode.port.onmessage = (event) => sendCapturedFrame(event.data);
+  source.connect(captureNode);
+}
+
+// Fallback for browsers without AudioWorklet
+function startScriptProcessorCapture() {
+  scriptProcessor = audioContext.createScriptProcessor(4096, 1, 1);
+  scriptProcessor.onaudioprocess = (audioProcessingEvent) => {
+    const inputData = audioProcessingEvent.inputBuffer.getChannelData(0);
+    sendCapturedFrame(floatTo16BitPCM(inputData));
+  };
+  source.connect(scriptProcessor);
+  scriptProcessor.connect(audioContext.destination);
+}
+
 /*  Convert Float32 → PCM16 */
 function floatTo16BitPCM(float32Array) {
-  const buffer = new ArrayBuffer(float32Array.length * 2);
-  const view = new DataView(buffer);
-  let offset = 0;
-  for (let i = 0; i < float32Array.length; i++, offset += 2) {
-    let s = Math.max(-1, Math.min(1, float32Array[i]));
-    view.setInt16(offset, s < 0 ? s * 0x8000 : s * 0x7fff, true);
+  const pcm = new Int16Array(float32Array.length);
+  for (let i = 0; i < float32Array.length; i++) {
+    const s = float32Array[i] > 1 ? 1 : float32Array[i] < -1 ? -1 : float32Array[i];
+    pcm[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
   }
-  return buffer;
+  return pcm.buffer;
 }
 
 // Update thoughts display based on current state
@@ -313,6 +563,11 @@ function updateThoughtsDisplay(state) {
       thoughtsDisplay.classList.add("processing");
       thoughtsDisplay.classList.remove("listening", "speaking", "error");
       break;
+    case "looking_up":
+      thoughtsDisplay.textContent = "looking that up...";
+      thoughtsDisplay.classList.add("processing");
+      thoughtsDisplay.classList.remove("listening", "speaking", "error");
+      break;
     case "speaking":
       thoughtsDisplay.textContent = "responding to your thoughts...";
       thoughtsDisplay.classList.add("speaking");
@@ -339,6 +594,7 @@ function addMessageToChat(text, sender) {
 
   // Scroll to the bottom
   chatWindow.scrollTop = chatWindow.scrollHeight;
+  return messageEl;
 }
 
 recordButton.onclick = async () => {
@@ -357,26 +613,20 @@ recordButton.onclick = async () => {
 
   // Set up Web Audio API for PCM16 streaming
   if (!audioContext) {
-    audioContext = new (window.AudioContext || window.webkitAudioContext)({
-      sampleRate: 16000,
-    });
-
     try {
       const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-      source = audioContext.createMediaStreamSource(stream);
-      scriptProcessor = audioContext.createScriptProcessor(4096, 1, 1);
-
-      scriptProcessor.onaudioprocess = (audioProcessingEvent) => {
-        if (!isRecording) return;
-        const inputData = audioProcessingEvent.inputBuffer.getChannelData(0);
-        const pcm16Buffer = floatTo16BitPCM(inputData);
-        if (websocket && websocket.readyState === WebSocket.OPEN) {
-          websocket.send(pcm16Buffer);
-        }
-      };
-
-      source.connect(scriptProcessor);
-      scriptProcessor.connect(audioContext.destination);
+      if (window.AudioWorkletNode) {
+        // native hardware rate; the worklet decimates to 16 kHz itself
+        audioContext = new (window.AudioContext || window.webkitAudioContext)();
+        source = audioContext.createMediaStreamSource(stream);
+        await startWorkletCapture();
+      } else {
+        audioContext = new (window.AudioContext || window.webkitAudioContext)({
+          sampleRate: CAPTURE_SAMPLE_RATE,
+        });
+        source = audioContext.createMediaStreamSource(stream);
+        startScriptProcessorCapture();
+      }
     } catch (error) {
       console.error("Error accessing microphone:", error);
       errorContainer.style.display = "flex";
@@ -408,9 +658,15 @@ stopRecordButton.onclick = () => {
   pulseRing.classList.remove("listening");
   statusText.textContent = "Processing";
 
+  if (captureNode) {
+    captureNode.port.postMessage("stop");
+    captureNode.disconnect();
+    captureNode = null;
+  }
   if (scriptProcessor) scriptProcessor.disconnect();
   if (source) source.disconnect();
   if (audioContext) audioContext.close();
+  audioContext = null;
   if (websocket && websocket.readyState === WebSocket.OPEN) {
     websocket.close();
   }
@@ -659,6 +915,7 @@ const fetchResponsefromllm = async (file) => {
 restartButton.addEventListener("click", () => {
   // Clear session ID to start fresh
   localStorage.removeItem("sessionId");
+  sessionStorage.removeItem(VOICE_RESUME_KEY);
   // Clear chat messages
   chatWindow.innerHTML = "";
   pulseRing.classList.remove("listening");
@@ -0,0 +1,149 @@
+// Streamed TTS playback on the audio rendering thread.
+// PCM chunks go into a growable Float32 ring buffer; playback starts (and restarts after
+// an underrun) once the jitter buffer holds targetMs, and targetMs follows the measured
+// lateness of chunk arrivals instead of a fixed lead.
+class PlaybackProcessor extends AudioWorkletProcessor {
+  constructor(options) {
+    super();
+    const opts = (options && options.processorOptions) || {};
+    this.minTargetMs = opts.minTargetMs || 40;
+    this.maxTargetMs = opts.maxTargetMs || 400;
+    this.targetMs = opts.initialTargetMs || 120;
+    this.statsInterval = Math.round((sampleRate * (opts.statsIntervalMs || 500)) / 1000);
+
+    this.ring = new Float32Array(sampleRate * 10);
+    this.readIndex = 0;
+    this.available = 0;
+
+    this.playing = false;
+    this.ending = false; // server finished the turn: play out whatever is left
+    this.underruns = 0;
+    this.jitterMs = 0;
+    this.lastArrival = null;
+    this.lastChunkMs = 0;
+    this.sinceStats = 0;
+
+    this.port.onmessage = (event) => this.onMessage(event.data);
+  }
+
+  onMessage(message) {
+    if (message.type === "push") {
+      this.onChunk(message.samples, message.sampleRate);
+    } else if (message.type === "end") {
+      this.ending = true;
+    } else if (message.type === "flush") {
+      this.readIndex = 0;
+      this.available = 0;
+      this.playing = false;
+      this.ending = false;
+      this.lastArrival = null;
+      this.reportStats();
+    }
+  }
+
+  onChunk(samples, rate) {
+    const now = currentTime * 1000;
+    if (this.lastArrival !== null) {
+      // how much later than "back to back" this chunk arrived
+      const lateness = Math.max(0, now - this.lastArrival - this.lastChunkMs);
+      this.jitterMs = this.jitterMs * 0.9 + lateness * 0.1;
+      const wanted = 2 * this.jitterMs + this.minTargetMs;
+      this.targetMs = Math.min(this.maxTargetMs, Math.max(this.minTargetMs, wanted, this.targetMs * 0.98));
+    }
+    this.lastArrival = now;
+    this.lastChunkMs = (samples.length / rate) * 1000;
+    this.ending = false;
+    this.write(samples, rate);
+  }
+
+  write(samples, rate) {
+    // Int16 from the PCM path, Float32 from WebCodecs
+    const scale = samples instanceof Float32Array ? 1 : 1 / 32768;
+    const step = rate / sampleRate;
+    const count = step === 1 ? samples.length : Math.floor(samples.length / step);
+    this.reserve(count);
+    const capacity = this.ring.length;
+    let writeIndex = (this.readIndex + this.available) % capacity;
+    for (let i = 0; i < count; i++) {
+      let value;
+      if (step === 1) {
+        value = samples[i];
+      } else {
+        // linear interpolation when the stream rate differs from the context rate
+        const position = i * step;
+        const index = position | 0;
+        const next = index + 1 < samples.length ? samples[index + 1] : samples[index];
+        value = samples[index] + (next - samples[index]) * (position - index);
+      }
+      this.ring[writeIndex] = value * scale;
+      writeIndex = writeIndex + 1 === capacity ? 0 : writeIndex + 1;
+    }
+    this.available += count;
+  }
+
+  reserve(count) {
+    if (this.available + count <= this.ring.length) return;
+    let capacity = this.ring.length * 2;
+    while (capacity < this.available + count) capacity *= 2;
+    const grown = new Float32Array(capacity);
+    for (let i = 0; i < this.available; i++) {
+      grown[i] = this.ring[(this.readIndex + i) % this.ring.length];
+    }
+    this.ring = grown;
+    this.readIndex = 0;
+  }
+
+  bufferedMs() {
+    return (this.available / sampleRate) * 1000;
+  }
+
+  reportStats() {
+    this.port.postMessage({
+      type: "stats",
+      bufferedMs: Math.round(this.bufferedMs()),
+      targetMs: Math.round(this.targetMs),
+      jitterMs: Math.round(this.jitterMs),
+      underruns: this.underruns,
+      playing: this.playing,
+    });
+  }
+
+  process(inputs, outputs) {
+    const output = outputs[0][0];
+    const frames = output.length;
+
+    if (!this.playing && this.available > 0 && (this.ending || this.bufferedMs() >= this.targetMs)) {
+      this.playing = true;
+    }
+
+    let written = 0;
+    if (this.playing) {
+      const capacity = this.ring.length;
+      written = Math.min(frames, this.available);
+      for (let i = 0; i < written; i++) {
+        output[i] = this.ring[this.readIndex];
+        this.readIndex = this.readIndex + 1 === capacity ? 0 : this.readIndex + 1;
+      }
+      this.available -= written;
+      if (this.available === 0) {
+        this.playing = false;
+        if (!this.ending) {
+          // ran dry mid-turn: count it and ask for a deeper buffer next time
+          this.underruns++;
+          this.targetMs = Math.min(this.maxTargetMs, this.targetMs + 20);
+        }
+        this.reportStats();
+      }
+    }
+    output.fill(0, written);
+
+    this.sinceStats += frames;
+    if (this.sinceStats >= this.statsInterval) {
+      this.sinceStats = 0;
+      if (this.playing || this.available > 0) this.reportStats();
+    }
+    return true;
+  }
+}
+
+registerProcessor("playback-processor", PlaybackProcessor);
@@ -0,0 +1,158 @@
+"""Local stand-in for AssemblyAI's v3 streaming endpoint, for offline testing
+
+    python -m tools.fake_assemblyai --port 8765
+    ASSEMBLYAI_STREAMING_URL=ws://127.0.0.1:8765/v3/ws uvicorn main:app
+
+Speech is detected from PCM16 energy; each utterance is "transcribed" as the words of
+--transcript, revealed progressively as partial turns and finalized after a pause,
+on ForceEndpoint, or on Terminate.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from array import array
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+
+
+class FakeSession:
+    def __init__(self, ws, args):
+        self.ws = ws
+        self.args = args
+        query = parse_qs(urlparse(ws.request.path).query)
+        self.sample_rate = int(query.get("sample_rate", ["16000"])[0])
+        self.format_turns = query.get("format_turns", ["false"])[0] == "true"
+        self.words = args.transcript.split()
+        self.turn_order = 0
+        self.speech_ms = 0.0
+        self.silence_ms = 0.0
+        self.in_turn = False
+        self.audio_seconds = 0.0
+        self.started = time.time()
+
+    async def send(self, message: dict):
+        await self.ws.send(json.dumps(message))
+
+    def _transcript(self, words: int) -> str:
+        return " ".join(self.words[:max(0, min(words, len(self.words)))])
+
+    def _turn(self, transcript: str, end_of_turn: bool, formatted: bool) -> dict:
+        if formatted and transcript:
+            transcript = transcript[0].upper() + transcript[1:] + "."
+        return {
+            "type": "Turn",
+            "turn_order": self.turn_order,
+            "turn_is_formatted": formatted,
+            "end_of_turn": end_of_turn,
+            "transcript": transcript,
+            "end_of_turn_confidence": 0.9 if end_of_turn else 0.1,
+            "words": [],
+        }
+
+    async def on_audio(self, data: bytes):
+        samples = array("h")
+        samples.frombytes(data[:len(data) & ~1])
+        if not samples:
+            return
+        duration_ms = len(samples) * 1000 / self.sample_rate
+        self.audio_seconds += duration_ms / 1000
+        rms = (sum(s * s for s in samples) / len(samples)) ** 0.5
+
+        if rms >= self.args.speech_rms:
+            self.silence_ms = 0.0
+            before = int(self.speech_ms // self.args.ms_per_word)
+            self.speech_ms += duration_ms
+            self.in_turn = True
+            words = int(self.speech_ms // self.args.ms_per_word)
+            if words != before:
+                await self.send(self._turn(self._transcript(words), False, False))
+        elif self.in_turn:
+            self.silence_ms += duration_ms
+            if self.silence_ms >= self.args.end_silence_ms:
+                await self.end_turn()
+
+    async def end_turn(self):
+        if not self.in_turn:
+            return
+        self.in_turn = False
+        if self.args.final_delay_ms:
+            spread = self.args.final_delay_ms * self.args.jitter
+            await asyncio.sleep(random.uniform(self.args.final_delay_ms - spread, self.args.final_delay_ms + spread) / 1000)
+        transcript = self._transcript(max(1, int(self.speech_ms // self.args.ms_per_word)))
+        await self.send(self._turn(transcript, True, False))
+        if self.format_turns:
+            await self.send(self._turn(transcript, True, True))
+        self.turn_order += 1
+        self.speech_ms = 0.0
+        self.silence_ms = 0.0
+
+    async def on_control(self, message: dict):
+        kind = message.get("type")
+        if kind == "ForceEndpoint":
+            await self.end_turn()
+        elif kind == "UpdateConfiguration":
+            if "format_turns" in message:
+                self.format_turns = bool(message["format_turns"])
+        elif kind == "Terminate":
+            await self.end_turn()
+            await self.send({
+                "type": "Termination",
+                "audio_duration_seconds": round(self.audio_seconds, 3),
+                "session_duration_seconds": round(time.time() - self.started, 3),
+            })
+            await self.ws.close()
+
+    async def run(self):
+        await self.send({
+            "type": "Begin",
+            "id": str(uuid.uuid4()),
+            "expires_at": int(time.time()) + 3600,
+        })
+        async for message in self.ws:
+            if isinstance(message, bytes):
+                await self.on_audio(message)
+            else:
+                try:
+                    await self.on_control(json.loads(message))
+                except ValueError:
+                    await self.send({"error": "Invalid JSON message"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake AssemblyAI v3 streaming server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--transcript", default="hello mizuki what is the weather like today")
+    parser.add_argument("--speech-rms", type=float, default=500.0, help="PCM16 RMS counted as speech")
+    parser.add_argument("--ms-per-word", type=float, default=300.0)
+    parser.add_argument("--end-silence-ms", type=float, default=700.0)
+    parser.add_argument("--final-delay-ms", type=float, default=0.0, help="simulated time to finalize a turn")
+    parser.add_argument("--jitter", type=float, default=0.2, help="spread of --final-delay-ms as a fraction")
+    parser.add_argument("--connect-delay-ms", type=float, default=0.0, help="simulated handshake latency")
+    args = parser.parse_args()
+
+    async def handler(ws):
+        if not ws.request.headers.get("Authorization"):
+            await ws.close(code=1008, reason="Unauthorized")
+            return
+        if args.connect_delay_ms:
+            await asyncio.sleep(args.connect_delay_ms / 1000)
+        try:
+            await FakeSession(ws, args).run()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def serve():
+        async with websockets.serve(handler, args.host, args.port):
+            print(f"Fake AssemblyAI listening on ws://{args.host}:{args.port}/v3/ws")
+            await asyncio.Future()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
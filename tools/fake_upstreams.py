@@ -0,0 +1,265 @@
+"""Local stand-ins for Gemini, Murf (REST + stream-input websocket) and Tavily, for load tests
+
+    python -m tools.fake_upstreams --port 8766
+    GEMINI_BASE_URL=http://127.0.0.1:8766 MURF_BASE_URL=http://127.0.0.1:8766 \\
+    MURF_STREAM_URL=ws://127.0.0.1:8766/v1/speech/stream-input TAVILY_BASE_URL=http://127.0.0.1:8766 \\
+    uvicorn main:app
+
+Every response is canned; only the wire protocols and the timing are realistic. Latencies are
+drawn around the configured values with +/- --jitter (a fraction). Each reply sentence gets a
+random number so repeated turns still miss the app's TTS cache (--fixed-reply turns that off). Murf audio is always WAV
+(PCM16), so sessions should negotiate a pcm format.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import re
+import struct
+import time
+import uuid
+from array import array
+
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SEARCH_WORDS = re.compile(r"\b(weather|news|today|latest|tonight|score|release)\b", re.IGNORECASE)
+SENTENCE_END = re.compile(r"([.!?])(\s|$)")
+
+args = None
+app = FastAPI()
+
+
+async def delay(ms: float):
+    """Sleep around ms, spread by the configured jitter"""
+    if ms <= 0:
+        return
+    spread = ms * args.jitter
+    await asyncio.sleep(max(0.0, random.uniform(ms - spread, ms + spread)) / 1000)
+
+
+_tones = {} #sample rate -> one second of tone
+
+
+def tone(seconds: float, sample_rate: int) -> bytes:
+    """Quiet 220 Hz tone as PCM16, so the audio isn't pure digital silence"""
+    second = _tones.get(sample_rate)
+    if second is None:
+        samples = array("h", (int(800 * math.sin(2 * math.pi * 220 * i / sample_rate)) for i in range(sample_rate)))
+        second = _tones[sample_rate] = samples.tobytes()
+    count = int(seconds * sample_rate) * 2
+    return (second * (count // len(second) + 1))[:count]
+
+
+def wav_header(sample_rate: int, data_size: int = 0xFFFFFFFF - 36) -> bytes:
+    return (b"RIFF" + struct.pack("<I", (data_size + 36) & 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+            + b"data" + struct.pack("<I", data_size & 0xFFFFFFFF))
+
+
+def speech_seconds(text: str) -> float:
+    return max(0.3, len(text.split()) * args.seconds_per_word)
+
+
+# --- Gemini (generativelanguage v1beta) ---
+
+def reply_text() -> str:
+    """The configured reply, made unique per call unless --fixed-reply"""
+    if args.fixed_reply:
+        return args.reply
+    return SENTENCE_END.sub(lambda m: f", {random.randint(1000, 9999)}{m.group(1)}{m.group(2)}", args.reply)
+
+
+def _gemini_reply(body: dict) -> dict:
+    """A functionCall part or text for this request, decided from the last content"""
+    contents = body.get("contents") or []
+    last_parts = contents[-1].get("parts", []) if contents else []
+    if any("functionResponse" in part for part in last_parts):
+        return {"text": reply_text()}
+    prompt = " ".join(part.get("text", "") for part in last_parts)
+    tools_off = (body.get("toolConfig") or {}).get("functionCallingConfig", {}).get("mode") == "NONE"
+    has_tools = bool(body.get("tools") or body.get("cachedContent"))
+    if has_tools and not tools_off and SEARCH_WORDS.search(prompt) and random.random() < args.tool_rate:
+        return {"functionCall": {"name": "web_search", "args": {"query": prompt.strip()[:200]}}}
+    if "summar" in prompt.lower():
+        return {"text": "The user and Mizuki chatted about their day."}
+    return {"text": reply_text()}
+
+
+def _gemini_chunk(parts: list, usage: bool, prompt_tokens: int, output_tokens: int) -> dict:
+    chunk = {
+        "candidates": [{"content": {"role": "model", "parts": parts}, "index": 0}],
+        "modelVersion": "fake-gemini",
+    }
+    if usage:
+        chunk["candidates"][0]["finishReason"] = "STOP"
+        chunk["usageMetadata"] = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        }
+    return chunk
+
+
+def _prompt_tokens(body: dict) -> int:
+    return len(json.dumps(body.get("contents") or [])) // 4
+
+
+@app.post("/v1beta/models/{model_action}")
+async def gemini_generate(model_action: str, request: Request):
+    body = await request.json()
+    reply = _gemini_reply(body)
+    prompt_tokens = _prompt_tokens(body)
+    await delay(args.llm_first_token_ms)
+
+    if model_action.endswith(":streamGenerateContent"):
+        async def events():
+            if "functionCall" in reply:
+                yield f"data: {json.dumps(_gemini_chunk([reply], True, prompt_tokens, 8))}\r\n\r\n"
+                return
+            words = reply["text"].split(" ")
+            pieces = [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+            for i, piece in enumerate(pieces):
+                if i:
+                    await delay(args.llm_token_ms * 4)
+                last = i == len(pieces) - 1
+                yield f"data: {json.dumps(_gemini_chunk([{'text': piece}], last, prompt_tokens, len(words)))}\r\n\r\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    if model_action.endswith(":countTokens"):
+        return {"totalTokens": prompt_tokens}
+    await delay(args.llm_token_ms * len(reply.get("text", "").split()))
+    return _gemini_chunk([reply], True, prompt_tokens, len(reply.get("text", "").split()))
+
+
+def _cached_content(name: str) -> dict:
+    return {
+        "name": name,
+        "model": "models/fake-gemini",
+        "displayName": "mizuki-persona",
+        "expireTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600)),
+        "usageMetadata": {"totalTokenCount": 1024},
+    }
+
+
+@app.post("/v1beta/cachedContents")
+async def gemini_cache_create(request: Request):
+    await request.body()
+    return _cached_content(f"cachedContents/fake-{uuid.uuid4().hex[:12]}")
+
+
+@app.patch("/v1beta/cachedContents/{cache_id}")
+async def gemini_cache_update(cache_id: str, request: Request):
+    await request.body()
+    return _cached_content(f"cachedContents/{cache_id}")
+
+
+# --- Tavily ---
+
+@app.post("/search")
+async def tavily_search(request: Request):
+    body = await request.json()
+    query = body.get("query", "")
+    await delay(args.search_ms)
+    return {
+        "query": query,
+        "results": [
+            {"title": f"Result {i} for {query}", "url": f"https://example.com/{i}",
+             "content": f"Fake search result {i} about {query}.", "score": 1 - i / 10}
+            for i in range(3)
+        ],
+        "response_time": args.search_ms / 1000,
+    }
+
+
+# --- Murf ---
+
+@app.post("/v1/speech/generate")
+async def murf_generate(request: Request):
+    body = await request.json()
+    text = body.get("text", "")
+    sample_rate = int(body.get("sampleRate") or 44100)
+    seconds = speech_seconds(text)
+    await delay(args.tts_first_chunk_ms + seconds * 1000 / args.tts_speed)
+    response = {
+        "audioFile": f"http://127.0.0.1:{args.port}/fake/{uuid.uuid4().hex}.wav",
+        "audioLengthInSeconds": seconds,
+        "consumedCharacterCount": len(text),
+        "remainingCharacterCount": 1_000_000,
+        "wordDurations": [],
+    }
+    if body.get("encodeAsBase64"):
+        pcm = tone(seconds, sample_rate)
+        response["encodedAudio"] = base64.b64encode(wav_header(sample_rate, len(pcm)) + pcm).decode()
+    return JSONResponse(response)
+
+
+@app.websocket("/v1/speech/stream-input")
+async def murf_stream(websocket: WebSocket):
+    await websocket.accept()
+    sample_rate = int(websocket.query_params.get("sample_rate", "44100"))
+    send_lock = asyncio.Lock()
+    contexts = {} #context id -> synthesis task
+
+    async def send(message: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(message))
+
+    async def synthesize(context_id: str, text: str):
+        await delay(args.tts_first_chunk_ms)
+        pcm = tone(speech_seconds(text), sample_rate)
+        chunk_bytes = int(sample_rate * args.tts_chunk_ms / 1000) * 2
+        for index, offset in enumerate(range(0, len(pcm), chunk_bytes)):
+            chunk = pcm[offset:offset + chunk_bytes]
+            if index == 0:
+                chunk = wav_header(sample_rate) + chunk
+            else:
+                await asyncio.sleep(args.tts_chunk_ms / 1000 / args.tts_speed)
+            await send({"audio": base64.b64encode(chunk).decode(), "context_id": context_id})
+        await send({"final": True, "context_id": context_id})
+        contexts.pop(context_id, None)
+
+    try:
+        while True:
+            message = json.loads(await websocket.receive_text())
+            context_id = message.get("context_id", "default")
+            if message.get("clear"):
+                task = contexts.pop(context_id, None)
+                if task:
+                    task.cancel()
+                continue
+            if message.get("text"):
+                contexts[context_id] = asyncio.create_task(synthesize(context_id, message["text"]))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        for task in contexts.values():
+            task.cancel()
+
+
+def main():
+    global args
+    parser = argparse.ArgumentParser(description="Fake Gemini / Murf / Tavily servers for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency spread as a fraction (0.2 = +/-20%%)")
+    parser.add_argument("--llm-first-token-ms", type=float, default=400.0)
+    parser.add_argument("--llm-token-ms", type=float, default=15.0, help="per word after the first chunk")
+    parser.add_argument("--tool-rate", type=float, default=0.5, help="share of search-like prompts answered with a tool call")
+    parser.add_argument("--reply", default="Sou desu ne, that sounds lovely! I hope the rest of your day is calm and "
+                                           "happy. Is there anything else you would like to talk about?")
+    parser.add_argument("--fixed-reply", action="store_true", help="send --reply verbatim (repeated turns hit the TTS cache)")
+    parser.add_argument("--search-ms", type=float, default=600.0)
+    parser.add_argument("--tts-first-chunk-ms", type=float, default=200.0)
+    parser.add_argument("--tts-chunk-ms", type=float, default=100.0, help="audio per streamed Murf message")
+    parser.add_argument("--tts-speed", type=float, default=4.0, help="synthesis speed as a multiple of real time")
+    parser.add_argument("--seconds-per-word", type=float, default=0.35)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
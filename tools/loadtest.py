@@ -0,0 +1,257 @@
+"""Drive N concurrent /ws voice sessions and report turn latency and server load
+
+    python -m tools.fake_assemblyai --port 8765 &
+    python -m tools.fake_upstreams --port 8766 &
+    python -m tools.loadtest --sessions 50 --turns 3 --url ws://127.0.0.1:8000/ws
+
+Each session streams PCM16 in real time (a recorded --wav file, 16 kHz mono, or a synthetic
+tone utterance), keeps sending silence like an open microphone, and measures from its last
+voiced frame to the first bot audio frame and to audio_complete. /stats is polled during the
+run for event loop lag, live sessions and RSS per worker process. Start the app with
+TTS_CACHE_ENABLED=false SEARCH_CACHE_TTL=0 (see the readme) so turns after the first still
+exercise synthesis and search rather than the caches.
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+import wave
+from array import array
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+SAMPLE_RATE = 16000
+FRAME_MS = 50
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000 * 2
+
+
+def synthetic_utterance(speech_ms: int) -> bytes:
+    """A voiced-looking tone (loud, low crossing rate) the VAD and fake STT both count as speech"""
+    count = SAMPLE_RATE * speech_ms // 1000
+    samples = array("h", (int(6000 * math.sin(2 * math.pi * 180 * i / SAMPLE_RATE)) for i in range(count)))
+    return samples.tobytes()
+
+
+def load_wav(path: str) -> bytes:
+    with wave.open(path, "rb") as wav:
+        if wav.getframerate() != SAMPLE_RATE or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+            raise SystemExit(f"{path} must be 16 kHz mono PCM16")
+        return wav.readframes(wav.getnframes())
+
+
+def frames_of(pcm: bytes) -> List[bytes]:
+    return [pcm[i:i + FRAME_BYTES].ljust(FRAME_BYTES, b"\0") for i in range(0, len(pcm), FRAME_BYTES)]
+
+
+def last_voiced_frame(frames: List[bytes], threshold: float = 500.0) -> int:
+    for index in range(len(frames) - 1, -1, -1):
+        samples = array("h")
+        samples.frombytes(frames[index])
+        if (sum(s * s for s in samples) / len(samples)) ** 0.5 >= threshold:
+            return index
+    return len(frames) - 1
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Results:
+    def __init__(self):
+        self.first_audio: List[float] = []
+        self.turn: List[float] = []
+        self.server_stages: Dict[str, List[float]] = {}
+        self.sessions_ok = 0
+        self.sessions_failed = 0
+        self.turns_timed_out = 0
+        self.errors: Dict[str, int] = {}
+        #pid -> samples polled from /stats
+        self.workers: Dict[int, dict] = {}
+
+    def error(self, message: str):
+        self.errors[message] = self.errors.get(message, 0) + 1
+
+
+class Session:
+    def __init__(self, index: int, args, utterance: List[bytes], voiced_until: int, results: Results):
+        self.index = index
+        self.args = args
+        self.utterance = utterance
+        self.voiced_until = voiced_until
+        self.results = results
+        self.ws = None
+        self.turn_started: Optional[float] = None #perf_counter of the last voiced frame
+        self.first_audio: Optional[float] = None
+        self.turn_done = asyncio.Event()
+
+    async def reader(self):
+        async for message in self.ws:
+            now = time.perf_counter()
+            if isinstance(message, bytes):
+                if self.turn_started is not None and self.first_audio is None:
+                    self.first_audio = now
+                    self.results.first_audio.append(now - self.turn_started)
+                continue
+            data = json.loads(message)
+            status = data.get("status")
+            if status == "audio_complete" and self.turn_started is not None:
+                self.results.turn.append(now - self.turn_started)
+                self.turn_done.set()
+            elif status == "timing":
+                for stage, ms in (data.get("stages") or {}).items():
+                    self.results.server_stages.setdefault(stage, []).append(ms / 1000)
+            elif status == "error":
+                self.results.error(str(data.get("message")))
+
+    async def send_realtime(self, frames: List[bytes], on_frame=None):
+        started = time.perf_counter()
+        for index, frame in enumerate(frames):
+            await self.ws.send(frame)
+            if on_frame:
+                on_frame(index)
+            #pace against the start time so scheduling delays don't accumulate
+            wait = started + (index + 1) * FRAME_MS / 1000 - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def silence_until(self, done: asyncio.Event, timeout: float) -> bool:
+        silence = bytes(FRAME_BYTES)
+        deadline = time.perf_counter() + timeout
+        while not done.is_set():
+            if time.perf_counter() > deadline:
+                return False
+            await self.ws.send(silence)
+            await asyncio.sleep(FRAME_MS / 1000)
+        return True
+
+    async def run(self):
+        await asyncio.sleep(self.index * self.args.ramp_ms / 1000)
+        try:
+            async with websockets.connect(self.args.url, max_size=None) as ws:
+                self.ws = ws
+                await ws.send(json.dumps({
+                    "type": "config",
+                    "apiKeys": {},
+                    "audio": {"codecs": ["pcm"]},
+                    "timing": True,
+                }))
+                reader = asyncio.create_task(self.reader())
+                try:
+                    for _ in range(self.args.turns):
+                        self.turn_started = None
+                        self.first_audio = None
+                        self.turn_done.clear()
+
+                        def mark(index):
+                            if index == self.voiced_until:
+                                self.turn_started = time.perf_counter()
+                        await self.send_realtime(self.utterance, mark)
+                        if not await self.silence_until(self.turn_done, self.args.turn_timeout):
+                            self.results.turns_timed_out += 1
+                        await self.send_realtime([bytes(FRAME_BYTES)] * (self.args.think_ms // FRAME_MS))
+                finally:
+                    reader.cancel()
+            self.results.sessions_ok += 1
+        except Exception as e:
+            self.results.sessions_failed += 1
+            self.results.error(f"{type(e).__name__}: {e}")
+
+
+async def poll_stats(url: str, results: Results, stop: asyncio.Event, interval: float):
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        while not stop.is_set():
+            try:
+                stats = (await client.get(url)).json()
+                process = stats.get("process") or {}
+                pid = process.get("pid", 0)
+                worker = results.workers.setdefault(pid, {
+                    "rss_min": math.inf, "rss_max": 0, "sessions_max": 0, "lag_max_ms": 0.0, "lag_samples": [],
+                })
+                rss = process.get("rss_bytes") or 0
+                worker["rss_min"] = min(worker["rss_min"], rss)
+                worker["rss_max"] = max(worker["rss_max"], rss)
+                live = (stats.get("voice_sessions") or {}).get("live_sessions", 0)
+                worker["sessions_max"] = max(worker["sessions_max"], live)
+                lag = stats.get("event_loop_lag") or {}
+                worker["lag_max_ms"] = max(worker["lag_max_ms"], lag.get("max_ms", 0.0))
+                worker["lag_samples"].append(lag.get("last_ms", 0.0))
+            except Exception as e:
+                results.error(f"/stats: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def report(results: Results, elapsed: float):
+    print(f"\nsessions ok={results.sessions_ok} failed={results.sessions_failed} "
+          f"turns={len(results.turn)} timed_out={results.turns_timed_out} in {elapsed:.1f}s")
+    print(f"{'latency (ms)':<22}{'p50':>8}{'p95':>8}{'p99':>8}{'n':>7}")
+    rows = [("first audio", results.first_audio), ("turn complete", results.turn)]
+    rows += [(f"  server {stage}", values) for stage, values in sorted(results.server_stages.items())]
+    for name, values in rows:
+        print(f"{name:<22}{_ms(percentile(values, 50)):>8}{_ms(percentile(values, 95)):>8}"
+              f"{_ms(percentile(values, 99)):>8}{len(values):>7}")
+
+    for pid, worker in sorted(results.workers.items()):
+        sessions = worker["sessions_max"]
+        growth = max(0, worker["rss_max"] - worker["rss_min"]) if worker["rss_min"] != math.inf else 0
+        per_session = f"{growth / sessions / 1024:.0f} KiB" if sessions else "-"
+        lag = worker["lag_samples"]
+        print(f"worker {pid}: peak sessions={sessions} rss={worker['rss_max'] / 1048576:.1f} MiB "
+              f"memory/session~{per_session} loop lag p50={percentile(lag, 50) or 0:.1f}ms "
+              f"p99={percentile(lag, 99) or 0:.1f}ms max={worker['lag_max_ms']:.1f}ms")
+    for message, count in sorted(results.errors.items(), key=lambda e: -e[1])[:10]:
+        print(f"error x{count}: {message}")
+
+
+async def run(args):
+    if args.wav:
+        pcm = load_wav(args.wav)
+    else:
+        pcm = synthetic_utterance(args.speech_ms)
+    utterance = frames_of(pcm)
+    voiced_until = last_voiced_frame(utterance)
+
+    results = Results()
+    stats_url = args.stats_url or args.url.replace("ws://", "http://").replace("wss://", "https://").rsplit("/ws", 1)[0] + "/stats"
+    stop = asyncio.Event()
+    poller = asyncio.create_task(poll_stats(stats_url, results, stop, args.stats_interval))
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        Session(i, args, utterance, voiced_until, results).run() for i in range(args.sessions)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await poller
+    report(results, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /ws voice session load test")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws")
+    parser.add_argument("--stats-url", default=None, help="defaults to /stats next to --url")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--wav", default=None, help="16 kHz mono PCM16 utterance to stream")
+    parser.add_argument("--speech-ms", type=int, default=1500, help="length of the synthetic utterance")
+    parser.add_argument("--think-ms", type=int, default=1000, help="silence between turns")
+    parser.add_argument("--ramp-ms", type=int, default=50, help="delay between session starts")
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--stats-interval", type=float, default=1.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()